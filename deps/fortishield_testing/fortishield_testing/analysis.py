@@ -8,20 +8,12 @@ import re
 from copy import deepcopy
 from datetime import datetime
 
-from jsonschema import validate, exceptions
+from jsonschema import exceptions
 from fortishield_testing import logger
+from fortishield_testing.tools.schema_validator import get_validator
 
 _data_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
 
-with open(os.path.join(_data_path, 'analysis_alert.json'), 'r') as f:
-    linux_schema = json.load(f)
-
-with open(os.path.join(_data_path, 'analysis_alert_windows.json'), 'r') as f:
-    win32_schema = json.load(f)
-
-with open(os.path.join(_data_path, 'state_integrity_analysis_schema.json'), 'r') as f:
-    state_integrity_analysis_schema = json.load(f)
-
 
 def callback_analysisd_message(line):
     if isinstance(line, bytes):
@@ -131,11 +123,17 @@ def validate_analysis_alert(alert, schema='linux'):
         alert (dict): Dictionary that represent an alert
         schema (str, optional): String with the platform to validate the alert from. Default `linux`
     """
-    if schema == 'win32':
-        _schema = win32_schema
-    else:
-        _schema = linux_schema
-    validate(schema=_schema, instance=alert)
+    get_validator('analysis_alert.json', 'win32' if schema == 'win32' else None).validate(alert)
+
+
+def validate_analysis_alerts(alerts, schema='linux'):
+    """Check if several Analysis events are properly formatted.
+
+    Args:
+        alerts (list): List of dictionaries that represent alerts
+        schema (str, optional): String with the platform to validate the alerts from. Default `linux`
+    """
+    get_validator('analysis_alert.json', 'win32' if schema == 'win32' else None).validate_events(alerts)
 
 
 def validate_analysis_alert_complex(alert, event, schema='linux'):
@@ -216,7 +214,7 @@ def validate_analysis_integrity_state(event):
     Args:
         event (dict): Candidate event to be validated against the state integrity schema
     """
-    validate(schema=state_integrity_analysis_schema, instance=event)
+    get_validator('state_integrity_analysis_schema.json').validate(event)
 
 
 class CallbackWithContext(object):
@@ -1,14 +1,15 @@
-import json
-import socket
 import os
 import sys
 import sqlite3
 from time import sleep
 
 from fortishield_testing import FORTISHIELD_DB_SOCKET_PATH
-from fortishield_testing.tools.monitoring import fortishield_pack, fortishield_unpack
+from fortishield_testing.db_interface.wdb_client import get_wdb_client
 from fortishield_testing.tools.services import control_service
 
+# Statements that SQLite can not run inside a transaction
+AUTOCOMMIT_STATEMENTS = ('VACUUM', 'ATTACH', 'DETACH', 'PRAGMA JOURNAL_MODE')
+
 
 def query_wdb(command):
     """Make queries to fortishield-db using the wdb socket.
@@ -37,30 +38,7 @@ def query_wdb(command):
         if not os.path.exists(FORTISHIELD_DB_SOCKET_PATH):
             raise Exception('The wdb socket is not up. fortishield-db was restarted but the socket was not found')
 
-    # Create and open the socket connection with fortishield-db socket
-    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    sock.connect(FORTISHIELD_DB_SOCKET_PATH)
-    data = []
-
-    try:
-        # Send the query request
-        sock.send(fortishield_pack(len(command)) + command.encode())
-
-        rcv = sock.recv(4)
-
-        if len(rcv) == 4:
-            data_len = fortishield_unpack(rcv)
-
-            data = sock.recv(data_len).decode()
-
-            # Remove response header and cast str to list of dictionaries
-            # From --> 'ok [ {data1}, {data2}...]' To--> [ {data1}, data2}...]
-            if len(data.split()) > 1 and data.split()[0] == 'ok':
-                data = json.loads(' '.join(data.split(' ')[1:]))
-    finally:
-        sock.close()
-
-    return data
+    return get_wdb_client().query(command)
 
 
 def execute_sqlite_query(cursor, query):
@@ -100,20 +78,9 @@ def make_sqlite_query(db_path, query_list):
         db_path (string): Path where is located the DB.
         query_list (list): List with queries to run.
     """
-    control_service('stop', daemon='fortishield-db')
-
-    try:
-        db_connection = sqlite3.connect(db_path)
-
+    with SQLiteBatchWriter(db_path) as writer:
         for item in query_list:
-            cursor = db_connection.cursor()
-            execute_sqlite_query(cursor, item)
-            cursor.close()
-
-        db_connection.commit()
-    finally:
-        db_connection.close()
-        control_service('start', daemon='fortishield-db')
+            writer.execute(item)
 
 
 def get_sqlite_query_result(db_path, query):
@@ -146,3 +113,190 @@ def get_sqlite_query_result(db_path, query):
     finally:
         db_connection.close()
         control_service('start', daemon='fortishield-db')
+
+
+class SQLiteBatchWriter:
+    """Transactional bulk writer for the SQLite databases used by Fortishield.
+
+    All the statements added to the writer are run in a single transaction, in the order they are added. The rows of
+    consecutive INSERT statements with the same query are grouped in one `executemany` call, and any other statement
+    is run on its own. The statements that can not run inside a transaction (e.g. VACUUM) commit the statements added
+    before them and run outside of the transaction. By default, fortishield-db is stopped only once, when the writer is
+    opened, and started again when it is closed. In WAL-safe mode the daemon is not stopped at all, which is only
+    possible if the database uses the WAL journal mode, so readers are not blocked and the writer waits for the daemon
+    write locks.
+
+    Args:
+        db_path (str): Path where is located the DB.
+        wal_safe (boolean): Write without stopping fortishield-db. The database must be in WAL journal mode.
+        batch_size (int): Maximum number of rows kept in memory before running them in the transaction.
+        daemon (str): Daemon stopped while the database is written.
+
+    Raises:
+        ValueError: If `wal_safe` is set and the database is not in WAL journal mode.
+
+    Examples:
+        >>> with SQLiteBatchWriter(CVE_DB_PATH) as writer:
+        ...     writer.add_many('INSERT INTO VULNERABILITIES (cveid, package) VALUES (?, ?)',
+        ...                     [(f'CVE-{index}', f'package-{index}') for index in range(10000)])
+    """
+
+    def __init__(self, db_path, wal_safe=False, batch_size=5000, daemon='fortishield-db'):
+        self.db_path = db_path
+        self.wal_safe = wal_safe
+        self.batch_size = batch_size
+        self.daemon = daemon
+        self.rows_written = 0
+        # Pending statements in order, as (query, rows) pairs. Only the consecutive INSERT rows share a pair
+        self._pending = []
+        self._pending_rows = 0
+        self._connection = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+
+    def open(self):
+        """Stop the daemon, unless in WAL-safe mode, and connect to the database.
+
+        The transaction begins with the first statement run.
+        """
+        if not self.wal_safe:
+            control_service('stop', daemon=self.daemon)
+
+        try:
+            # Wait for the locks held by the daemon in WAL-safe mode, the transaction is handled manually
+            self._connection = sqlite3.connect(self.db_path, timeout=30 if self.wal_safe else 5,
+                                               isolation_level=None)
+            if self.wal_safe:
+                journal_mode = self._connection.execute('PRAGMA journal_mode').fetchone()[0]
+                if journal_mode.lower() != 'wal':
+                    raise ValueError(f"{self.db_path} journal mode is {journal_mode}, WAL-safe mode requires WAL")
+        except BaseException:
+            self._disconnect()
+            raise
+
+    def add(self, query, parameters=()):
+        """Add a statement to the transaction.
+
+        Args:
+            query (str): SQL statement with `?` placeholders.
+            parameters (tuple): Statement parameters.
+        """
+        if self._pending and self._pending[-1][0] == query and self._is_insert(query):
+            self._pending[-1][1].append(parameters)
+        else:
+            self._pending.append((query, [parameters]))
+        self._pending_rows += 1
+
+        if self._pending_rows >= self.batch_size:
+            self.flush()
+
+    def add_many(self, query, rows):
+        """Add a statement to the transaction once for each row of parameters.
+
+        Args:
+            query (str): SQL statement with `?` placeholders.
+            rows (iterable): Parameters of each statement.
+        """
+        for parameters in rows:
+            self.add(query, parameters)
+
+    def execute(self, query):
+        """Add a statement without parameters to the transaction.
+
+        Args:
+            query (str): SQL statement.
+        """
+        self.add(query)
+
+    def flush(self):
+        """Run the pending statements in the transaction."""
+        pending, self._pending = self._pending, []
+        self._pending_rows = 0
+        cursor = self._connection.cursor()
+        try:
+            for query, rows in pending:
+                if self._requires_autocommit(query):
+                    if self._connection.in_transaction:
+                        self._run(self._connection.execute, 'COMMIT')
+                elif not self._connection.in_transaction:
+                    self._run(self._connection.execute, 'BEGIN')
+
+                if self._is_insert(query):
+                    self._run(cursor.executemany, query, rows)
+                else:
+                    for parameters in rows:
+                        self._run(cursor.execute, query, parameters)
+                self.rows_written += len(rows)
+        finally:
+            cursor.close()
+
+    def fetchall(self, query, parameters=()):
+        """Run a query in the transaction, after the pending statements.
+
+        Args:
+            query (str): SQL query. e.g(SELECT * ..).
+            parameters (tuple): Query parameters.
+
+        Returns:
+            list(tuple): Query result rows.
+        """
+        self.flush()
+        if not self._connection.in_transaction:
+            self._run(self._connection.execute, 'BEGIN')
+        return self._run(self._connection.execute, query, parameters).fetchall()
+
+    def close(self, commit=True):
+        """Commit (or roll back) the transaction and start the daemon again.
+
+        Args:
+            commit (boolean): Run the pending statements and commit the transaction. If False, it is rolled back.
+        """
+        if self._connection is None:
+            return
+
+        try:
+            if commit:
+                self.flush()
+                if self._connection.in_transaction:
+                    self._run(self._connection.execute, 'COMMIT')
+            elif self._connection.in_transaction:
+                self._connection.execute('ROLLBACK')
+        finally:
+            self._disconnect()
+
+    def _disconnect(self):
+        """Close the database connection and start the daemon again."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if not self.wal_safe:
+            control_service('start', daemon=self.daemon)
+
+    @staticmethod
+    def _is_insert(query):
+        return query.lstrip()[:6].upper() == 'INSERT'
+
+    @staticmethod
+    def _requires_autocommit(query):
+        statement = ' '.join(query.split()[:2]).upper()
+        return statement.startswith(AUTOCOMMIT_STATEMENTS)
+
+    @staticmethod
+    def _run(function, *args, max_retries=10):
+        """Run a database operation, retrying it in case the database is locked.
+
+        Raises:
+            sqlite3.OperationalError: If the database is locked after max retries or the operation fails.
+        """
+        for retry in range(max_retries):
+            try:
+                return function(*args)
+            except sqlite3.OperationalError as error:
+                if str(error) != 'database is locked' or retry == max_retries - 1:
+                    raise
+                sleep(0.5)
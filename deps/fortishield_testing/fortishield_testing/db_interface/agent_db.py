@@ -1,7 +1,27 @@
 import datetime
+import os
 from time import time
 
-from fortishield_testing.db_interface import query_wdb
+from fortishield_testing import QUEUE_DB_PATH
+from fortishield_testing.db_interface import query_wdb, SQLiteBatchWriter
+
+
+def get_agent_db_writer(agent_id='000', wal_safe=False):
+    """Get a batch writer of the agent DB, to insert many rows in a single transaction instead of a wdb query each.
+
+    Args:
+        agent_id (str): Agent ID.
+        wal_safe (boolean): Write without stopping fortishield-db. The agent DB must be in WAL journal mode.
+
+    Returns:
+        SQLiteBatchWriter: Writer of the agent DB, to be used as a context manager.
+
+    Examples:
+        >>> with get_agent_db_writer('000') as writer:
+        ...     for index in range(10000):
+        ...         insert_package(name=f'custom-package-{index}', writer=writer)
+    """
+    return SQLiteBatchWriter(os.path.join(QUEUE_DB_PATH, f"{agent_id}.db"), wal_safe=wal_safe)
 
 
 def clean_table(agent_id, table):
@@ -99,7 +119,7 @@ def insert_package(agent_id='000', scan_id=int(time()), format='rpm', name='cust
                    architecture='x64', multiarch='', description='Fortishield mocking packages', source='Fortishield QA tests',
                    location='', triaged='0', install_time=datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
                    scan_time=datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S"), checksum='dummychecksum',
-                   item_id='dummyitemid'):
+                   item_id='dummyitemid', writer=None):
     """Insert a package in the agent DB.
 
     Args:
@@ -122,7 +142,19 @@ def insert_package(agent_id='000', scan_id=int(time()), format='rpm', name='cust
         scan_time (str): Scan timestamp.
         checksum (str): Package checksum.
         item_id (str): Package ID.
+        writer (SQLiteBatchWriter): Writer of the agent DB to add the package to, see `get_agent_db_writer`. Default
+            None, to insert it right now through fortishield-db.
     """
+    if writer is not None:
+        writer.add('INSERT INTO sys_programs (scan_id, scan_time, format, name, priority, section, size, vendor, '
+                   'install_time, version, architecture, multiarch, source, description, location, triaged, checksum, '
+                   'item_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   tuple(None if value == 'NULL' else value
+                         for value in (scan_id, scan_time, format, name, priority, section, size, vendor, install_time,
+                                       version, architecture, multiarch, source, description, location, triaged,
+                                       checksum, item_id)))
+        return
+
     arguments = locals()
     for key, value in arguments.items():
         if type(value) is str:
@@ -333,7 +365,7 @@ def get_vulnerability_inventory_data(agent_id='000', name=None, status=None, cve
 def insert_vulnerability_in_agent_inventory(agent_id='000', name='', version='', architecture='', cve='',
                                             detection_time='', severity='None', cvss2_score=0, cvss3_score=0,
                                             reference='', type='PACKAGE', status='PENDING', external_references='',
-                                            condition='', title='', published='', updated=''):
+                                            condition='', title='', published='', updated='', writer=None):
     """Insert a vulnerability in the agent vulnerabilities inventory.
 
     Args:
@@ -354,7 +386,17 @@ def insert_vulnerability_in_agent_inventory(agent_id='000', name='', version='',
         title (str): Vulnerability title.
         published (str): Vulnerability published.
         updated (str): Vulnerability updated.
+        writer (SQLiteBatchWriter): Writer of the agent DB to add the vulnerability to, see `get_agent_db_writer`.
+            Default None, to insert it right now through fortishield-db.
     """
+    if writer is not None:
+        writer.add('INSERT OR REPLACE INTO vuln_cves (name, version, architecture, cve, detection_time, severity, '
+                   'cvss2_score, cvss3_score, reference, type, status, external_references, condition, title, '
+                   'published, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (name, version, architecture, cve, detection_time, severity, cvss2_score, cvss3_score, reference,
+                    type, status, external_references, condition, title, published, updated))
+        return
+
     query_wdb(f"agent {agent_id} sql INSERT OR REPLACE INTO vuln_cves (name, version, architecture, cve, "
               f"detection_time, severity, cvss2_score, cvss3_score, reference, type, status, external_references,"
               f" condition, title, published, updated) VALUES ('{name}', '{version}', '{architecture}', '{cve}', "
@@ -2,7 +2,7 @@ from datetime import datetime
 from time import sleep
 
 from fortishield_testing import CVE_DB_PATH
-from fortishield_testing.db_interface import make_sqlite_query, get_sqlite_query_result
+from fortishield_testing.db_interface import make_sqlite_query, get_sqlite_query_result, SQLiteBatchWriter
 from fortishield_testing.modules import vulnerability_detector as vd
 
 
@@ -63,7 +63,7 @@ def insert_vulnerability(cveid='CVE-000', target='RHEL7', target_minor='',
                          reference='https://github.com/fortishield/fortishield-qa', target_v='REDHAT', cvss='10.000000',
                          cvss_vector='AV:N/AC:L/Au:N/C:C/I:C/A:C', rationale='Fortishield integration test vulnerability',
                          cvss3='', bugzilla_reference='https://github.com/fortishield/fortishield-qa', cwe='WVE-000 -> WVE-001',
-                         advisory='RHSA-2010:0029', ref_target='RHEL', deps_id='0'):
+                         advisory='RHSA-2010:0029', ref_target='RHEL', deps_id='0', writer=None):
     """Insert a vulnerability in CVE database.
 
     Args:
@@ -88,42 +88,43 @@ def insert_vulnerability(cveid='CVE-000', target='RHEL7', target_minor='',
         advisory (str): Advisory ID.
         ref_target (str): OS target ID.
         deps_id (str): id of the dependencies related to the vulnerability.
+        writer (SQLiteBatchWriter): Writer of the CVE DB to add the vulnerability to, so many vulnerabilities are
+            inserted in the same transaction. Default None, to insert it right now.
     """
-    queries = [
-        'INSERT INTO VULNERABILITIES (cveid, target, target_minor, package, operation, operation_value, deps_id) VALUES'
-        f" ('{cveid}', '{target}', '{target_minor}', '{package}', '{operation}', '{operation_value}', '{deps_id}')",
-
-        'INSERT INTO VULNERABILITIES_INFO (ID, title, severity, published, updated, target, rationale, cvss, '
-        f"cvss_vector, CVSS3, cwe) VALUES ('{cveid}', '{title}', '{severity}', '{published}', '{updated}', "
-        f"'{target_v}', '{rationale}', '{cvss}', '{cvss_vector}', '{cvss3}', '{cwe}')",
-
-        f"INSERT INTO REFERENCES_INFO (id, target, reference) VALUES ('{cveid}', '{ref_target}', "
-        f"'{bugzilla_reference}')",
-
-        f"INSERT INTO BUGZILLA_REFERENCES_INFO (id, target, bugzilla_reference) VALUES ('{cveid}', '{ref_target}', "
-        f"'{bugzilla_reference}')",
-
-        f"INSERT INTO ADVISORIES_INFO (id, target, advisory) VALUES ('{cveid}', '{ref_target}', '{advisory}')"
-    ]
-
-    make_sqlite_query(CVE_DB_PATH, queries)
-
-
-def delete_vulnerability(cveid):
+    if writer is None:
+        with SQLiteBatchWriter(CVE_DB_PATH) as writer:
+            return insert_vulnerability(cveid, target, target_minor, package, operation, operation_value, title,
+                                        severity, published, updated, reference, target_v, cvss, cvss_vector,
+                                        rationale, cvss3, bugzilla_reference, cwe, advisory, ref_target, deps_id,
+                                        writer)
+
+    writer.add('INSERT INTO VULNERABILITIES (cveid, target, target_minor, package, operation, operation_value, '
+               'deps_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+               (cveid, target, target_minor, package, operation, operation_value, deps_id))
+    writer.add('INSERT INTO VULNERABILITIES_INFO (ID, title, severity, published, updated, target, rationale, cvss, '
+               'cvss_vector, CVSS3, cwe) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+               (cveid, title, severity, published, updated, target_v, rationale, cvss, cvss_vector, cvss3, cwe))
+    writer.add('INSERT INTO REFERENCES_INFO (id, target, reference) VALUES (?, ?, ?)',
+               (cveid, ref_target, bugzilla_reference))
+    writer.add('INSERT INTO BUGZILLA_REFERENCES_INFO (id, target, bugzilla_reference) VALUES (?, ?, ?)',
+               (cveid, ref_target, bugzilla_reference))
+    writer.add('INSERT INTO ADVISORIES_INFO (id, target, advisory) VALUES (?, ?, ?)', (cveid, ref_target, advisory))
+
+
+def delete_vulnerability(cveid, writer=None):
     """Remove a vulnerability from the DB.
 
     Args:
         cveid (str): Vulnerability ID.
+        writer (SQLiteBatchWriter): Writer of the CVE DB to add the deletion to. Default None, to delete it right now.
     """
-    queries = [
-        f"DELETE FROM VULNERABILITIES WHERE cveid='{cveid}'",
-        f"DELETE FROM VULNERABILITIES_INFO WHERE id='{cveid}'",
-        f"DELETE FROM REFERENCES_INFO WHERE id='{cveid}'",
-        f"DELETE FROM BUGZILLA_REFERENCES_INFO WHERE id='{cveid}'",
-        f"DELETE FROM ADVISORIES_INFO WHERE id='{cveid}'"
-    ]
-
-    make_sqlite_query(CVE_DB_PATH, queries)
+    if writer is None:
+        with SQLiteBatchWriter(CVE_DB_PATH) as writer:
+            return delete_vulnerability(cveid, writer)
+
+    writer.add('DELETE FROM VULNERABILITIES WHERE cveid=?', (cveid,))
+    for table in ['VULNERABILITIES_INFO', 'REFERENCES_INFO', 'BUGZILLA_REFERENCES_INFO', 'ADVISORIES_INFO']:
+        writer.add(f"DELETE FROM {table} WHERE id=?", (cveid,))
 
 
 def get_provider_feeds_number():
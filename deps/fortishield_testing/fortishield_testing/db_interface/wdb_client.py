@@ -0,0 +1,466 @@
+# Copyright (C) 2015-2022, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+import codecs
+import json
+import os
+import queue
+import selectors
+import socket
+import threading
+from struct import Struct
+
+from fortishield_testing import FORTISHIELD_DB_SOCKET_PATH
+
+WDB_HEADER = Struct('<I')
+RECV_BUFFER_SIZE = 65536
+DEFAULT_POOL_SIZE = 4
+# Maximum number of commands sent by a batch query before reading their responses
+DEFAULT_PIPELINE_DEPTH = 128
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+class RequestNotSentError(ConnectionError):
+    """The connection with fortishield-db failed before any command of the request was completely sent."""
+
+
+def parse_wdb_response(response):
+    """Cast a fortishield-db response to Python objects.
+
+    Args:
+        response (str): fortishield-db response. For example `ok [{"id": 0}]`.
+
+    Returns:
+        list or str: Response data if the response is `ok <json>`, the raw response otherwise.
+    """
+    # Remove response header and cast str to list of dictionaries
+    # From --> 'ok [ {data1}, {data2}...]' To--> [ {data1}, data2}...]
+    if len(response.split()) > 1 and response.split()[0] == 'ok':
+        return json.loads(response.split(' ', 1)[1])
+    return response
+
+
+class WdbClient:
+    """Client of the fortishield-db socket that keeps a pool of open connections.
+
+    The connections are reused between queries instead of opening a new one for every command. Every response frame is
+    read completely, whatever its size, and several commands can be pipelined through the same connection. A pooled
+    connection closed by fortishield-db (for example, after a restart) is replaced before it is used. A query is only
+    sent again when its connection fails before any command is completely sent, so fortishield-db never runs a command
+    twice.
+
+    Args:
+        socket_path (str): Path of the fortishield-db socket.
+        pool_size (int): Maximum number of idle connections kept open.
+        timeout (float): Seconds to wait for a response. None to wait forever.
+
+    Examples:
+        >>> client = WdbClient()
+        >>> client.query('global get-agent-info 000')
+        >>> client.batch([f'global get-agent-info {agent_id:03d}' for agent_id in range(100)])
+        >>> for agent in client.stream('global sql SELECT id, name FROM agent'):
+        ...     print(agent['name'])
+    """
+
+    def __init__(self, socket_path=FORTISHIELD_DB_SOCKET_PATH, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._pid = os.getpid()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _connect(self):
+        """Open a new connection with fortishield-db."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _acquire(self):
+        """Get an idle connection from the pool, or a new one if there are none.
+
+        Returns:
+            tuple: Connection socket and whether it comes from the pool.
+        """
+        # Connections inherited from the parent process can not be shared with it
+        if os.getpid() != self._pid:
+            self._pool = queue.LifoQueue()
+            self._pid = os.getpid()
+
+        while True:
+            try:
+                sock = self._pool.get_nowait()
+            except queue.Empty:
+                return self._connect(), False
+            if self._is_idle_connection_alive(sock):
+                return sock, True
+            sock.close()
+
+    def _is_idle_connection_alive(self, sock):
+        """Check that fortishield-db has not closed an idle connection, nor sent unexpected data through it."""
+        sock.setblocking(False)
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(self.timeout)
+        return False
+
+    def _release(self, sock):
+        """Return a connection to the pool, closing it if the pool is full."""
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(sock)
+        else:
+            sock.close()
+
+    def _run(self, request, release=True):
+        """Run a request on a pooled connection.
+
+        If a pooled connection turns out to be closed before the request is sent, the request is sent again through a
+        new connection. Once a command has been sent, a failure is never retried, as fortishield-db may have run it.
+
+        Args:
+            request (callable): Function receiving the connection socket and returning the request result, or None if
+                fortishield-db closed the connection before answering. It raises `RequestNotSentError` if the
+                connection fails before sending the request.
+            release (boolean): Return the connection to the pool once the request is done. If False, the caller gets
+                the connection and has to release or close it.
+
+        Returns:
+            Request result, or a tuple with the request result and the connection if `release` is False.
+        """
+        sock, reused = self._acquire()
+        while True:
+            try:
+                result = request(sock)
+                break
+            except RequestNotSentError:
+                sock.close()
+                if not reused:
+                    raise
+            except BaseException:
+                sock.close()
+                raise
+            sock, reused = self._connect(), False
+
+        if result is None:
+            sock.close()
+            return None if release else (None, None)
+        if not release:
+            return result, sock
+        self._release(sock)
+        return result
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        """Read exactly `size` bytes from a connection.
+
+        Raises:
+            ConnectionError: If the connection is closed before reading all the data.
+        """
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            read = sock.recv_into(view[received:], size - received)
+            if read == 0:
+                raise ConnectionError(f"fortishield-db closed the connection after {received} of {size} bytes")
+            received += read
+        return bytes(buffer)
+
+    def _read_header(self, sock):
+        """Read the length of the next response frame, or None if the connection was closed before it."""
+        header = sock.recv(WDB_HEADER.size)
+        if not header:
+            return None
+        if len(header) < WDB_HEADER.size:
+            header += self._recv_exact(sock, WDB_HEADER.size - len(header))
+        return WDB_HEADER.unpack(header)[0]
+
+    @staticmethod
+    def _send(sock, command):
+        """Send a command frame.
+
+        Raises:
+            RequestNotSentError: If the connection fails before the whole frame is sent.
+        """
+        try:
+            sock.sendall(WDB_HEADER.pack(len(command)) + command)
+        except ConnectionError as error:
+            raise RequestNotSentError(f"Could not send the command to fortishield-db: {error}") from error
+
+    def _request(self, sock, command):
+        """Send a command and read its whole response frame, or None if the connection was closed before it."""
+        self._send(sock, command)
+        data_len = self._read_header(sock)
+        return None if data_len is None else self._recv_exact(sock, data_len).decode()
+
+    def query_raw(self, command):
+        """Make a query to fortishield-db.
+
+        Args:
+            command (str): fortishield-db command alias. For example `global get-agent-info 000`.
+
+        Returns:
+            str: Raw response. Empty if fortishield-db closed the connection without answering.
+        """
+        command = command.encode()
+        response = self._run(lambda sock: self._request(sock, command))
+        return '' if response is None else response
+
+    def query(self, command):
+        """Make a query to fortishield-db.
+
+        Args:
+            command (str): fortishield-db command alias. For example `global get-agent-info 000`.
+
+        Returns:
+            list: Query response data.
+        """
+        response = self.query_raw(command)
+        return parse_wdb_response(response) if response else []
+
+    def _pipeline(self, sock, commands):
+        """Send several commands through a connection and read their responses.
+
+        Writing and reading are interleaved, so a long list of commands with large responses can not block both
+        fortishield-db and the client while they wait for each other to read.
+
+        Returns:
+            list: Raw responses, in the same order as the commands. None if the connection was closed before any
+                response arrived.
+        """
+        frames = memoryview(b''.join(WDB_HEADER.pack(len(command)) + command for command in commands))
+        # Until the first frame is completely sent, fortishield-db has not run any command
+        first_frame_size = WDB_HEADER.size + len(commands[0])
+        sent = 0
+        buffer = bytearray()
+        offset = 0
+        responses = []
+
+        selector = selectors.DefaultSelector()
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        try:
+            while len(responses) < len(commands):
+                events = selector.select(self.timeout)
+                if not events:
+                    raise socket.timeout(f"fortishield-db did not answer in {self.timeout} seconds")
+                mask = events[0][1]
+
+                if mask & selectors.EVENT_WRITE and sent < len(frames):
+                    try:
+                        sent += sock.send(frames[sent:])
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except ConnectionError as error:
+                        if sent < first_frame_size:
+                            raise RequestNotSentError(f"Could not send the commands to fortishield-db: {error}") \
+                                from error
+                        raise
+                    if sent == len(frames):
+                        selector.modify(sock, selectors.EVENT_READ)
+
+                if mask & selectors.EVENT_READ:
+                    try:
+                        data = sock.recv(RECV_BUFFER_SIZE)
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    if not data:
+                        if sent < first_frame_size:
+                            raise RequestNotSentError('fortishield-db closed the connection before the commands were '
+                                                      'sent')
+                        if not responses and not buffer:
+                            return None
+                        raise ConnectionError(f"fortishield-db closed the connection after {len(responses)} of "
+                                              f"{len(commands)} responses")
+                    buffer += data
+                    while len(buffer) - offset >= WDB_HEADER.size:
+                        data_len = WDB_HEADER.unpack_from(buffer, offset)[0]
+                        end = offset + WDB_HEADER.size + data_len
+                        if len(buffer) < end:
+                            break
+                        responses.append(buffer[offset + WDB_HEADER.size:end].decode())
+                        offset = end
+                    del buffer[:offset]
+                    offset = 0
+        finally:
+            selector.close()
+            sock.settimeout(self.timeout)
+
+        return responses
+
+    def batch_raw(self, commands, pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        """Make several queries to fortishield-db pipelining them through the same connection.
+
+        Args:
+            commands (list): fortishield-db command aliases.
+            pipeline_depth (int): Maximum number of commands sent before reading their responses.
+
+        Returns:
+            list: Raw responses, in the same order as the commands.
+        """
+        encoded_commands = [command.encode() for command in commands]
+        responses = []
+        for start in range(0, len(encoded_commands), pipeline_depth):
+            chunk = encoded_commands[start:start + pipeline_depth]
+            chunk_responses = self._run(lambda sock: self._pipeline(sock, chunk))
+            if chunk_responses is None:
+                raise ConnectionError('fortishield-db closed the connection without answering')
+            responses.extend(chunk_responses)
+        return responses
+
+    def batch(self, commands, pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        """Make several queries to fortishield-db pipelining them through the same connection.
+
+        Args:
+            commands (list): fortishield-db command aliases.
+            pipeline_depth (int): Maximum number of commands sent before reading their responses.
+
+        Returns:
+            list: Response data of every command, in the same order as the commands.
+        """
+        return [parse_wdb_response(response) if response else []
+                for response in self.batch_raw(commands, pipeline_depth)]
+
+    def stream(self, command):
+        """Make a query to fortishield-db and decode the items of its `ok [...]` response as they are received.
+
+        The response is never held completely in memory, neither as text nor as a list of decoded items.
+
+        Args:
+            command (str): fortishield-db command alias. For example `global sql SELECT * FROM agent`.
+
+        Yields:
+            Every item of the response JSON array. If the response data is not an array, the whole data is yielded.
+
+        Raises:
+            ValueError: If fortishield-db does not answer `ok <json>`.
+        """
+        encoded_command = command.encode()
+
+        def send(sock):
+            self._send(sock, encoded_command)
+            return self._read_header(sock)
+
+        # The connection is released by the stream itself once the whole response has been read
+        data_len, sock = self._run(send, release=False)
+        if data_len is None:
+            raise ConnectionError('fortishield-db closed the connection without answering')
+
+        completed = False
+        try:
+            yield from self._decode_stream(sock, data_len)
+            completed = True
+        finally:
+            if completed:
+                self._release(sock)
+            else:
+                # Part of the response is still pending, the connection can not be reused
+                sock.close()
+
+    def _decode_stream(self, sock, data_len):
+        """Decode the items of a response frame while it is read from the connection."""
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = data_len
+        text = ''
+        position = 0
+
+        def read_more():
+            nonlocal pending, text, position
+            if pending == 0:
+                return False
+            data = sock.recv(min(pending, RECV_BUFFER_SIZE))
+            if not data:
+                raise ConnectionError(f"fortishield-db closed the connection with {pending} bytes left")
+            pending -= len(data)
+            text = text[position:] + text_decoder.decode(data, final=pending == 0)
+            position = 0
+            return True
+
+        def skip(characters):
+            nonlocal position
+            while True:
+                while position < len(text) and text[position] in characters:
+                    position += 1
+                if position < len(text) or not read_more():
+                    return
+
+        # Response status
+        while ' ' not in text and read_more():
+            pass
+        status, _, _ = text.partition(' ')
+        if status != 'ok':
+            while read_more():
+                pass
+            raise ValueError(f"Unexpected fortishield-db response: {text[:256]}")
+        position = min(len(status) + 1, len(text))
+
+        skip(' \t\r\n')
+        if position == len(text):
+            return
+        if text[position] != '[':
+            while read_more():
+                pass
+            yield json.loads(text[position:])
+            return
+
+        position += 1
+        while True:
+            skip(' \t\r\n,')
+            if position == len(text):
+                raise ValueError('Truncated fortishield-db response')
+            if text[position] == ']':
+                while read_more():
+                    pass
+                return
+            while True:
+                try:
+                    item, end = decoder.raw_decode(text, position)
+                    # A number at the end of the buffer could continue in the next chunk
+                    if end < len(text) or pending == 0:
+                        break
+                except ValueError:
+                    if pending == 0:
+                        raise
+                read_more()
+            position = end
+            yield item
+
+    def close(self):
+        """Close all the idle connections of the pool."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def get_wdb_client():
+    """Get the fortishield-db client shared by the whole process.
+
+    Returns:
+        WdbClient: Shared client.
+    """
+    global _default_client
+
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WdbClient()
+    return _default_client
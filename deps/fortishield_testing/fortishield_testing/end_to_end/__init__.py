@@ -6,6 +6,7 @@ import requests
 from http import HTTPStatus
 from tempfile import gettempdir
 
+from fortishield_testing.end_to_end.indexer_api import get_indexer_client
 from fortishield_testing.tools.utils import retry
 
 
@@ -44,15 +45,12 @@ def get_alert_indexer_api(query, credentials, ip_address, index='fortishield-ale
       Returns:
           `obj`(map): Search results
      """
-    url = f"https://{ip_address}:9200/{index}/_search?"
+    response = get_indexer_client(ip_address, credentials).request('GET', f"/{index}/_search", json=query)
 
-    response = requests.get(url=url, params={'pretty': 'true'}, json=query, verify=False,
-                            auth=requests.auth.HTTPBasicAuth(credentials['user'], credentials['password']))
-
-    if '"hits" : [ ]' in response.text:
-        raise Exception('Alert not indexed')
-    elif response.status_code != HTTPStatus.OK:
+    if response.status_code != HTTPStatus.OK:
         raise Exception(f"The request wasn't successful.\nActual response: {response.text}")
+    elif not response.json()['hits']['hits']:
+        raise Exception('Alert not indexed')
 
     return response
 
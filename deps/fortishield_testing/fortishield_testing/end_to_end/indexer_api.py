@@ -4,7 +4,12 @@ Fortishield API Indexer Module.
 
 This module provides functions to interact with the Fortishield Indexer API.
 
+Classes:
+    - IndexerClient: Client of the Indexer API that pages through the search results.
+
 Functions:
+    - get_indexer_client: Get the client of an Indexer, reusing its HTTPS session.
+    - make_alerts_query: Build a query that filters the alerts in the Indexer.
     - get_indexer_values: Retrieves values from the Indexer API.
 
 Copyright (C) 2015, Fortishield Inc.
@@ -13,71 +18,246 @@ This program is a free software; you can redistribute it and/or modify it under
 """
 import requests
 import logging
-from typing import Dict
+from http import HTTPStatus
+from typing import Dict, Generator, List
+
+from requests.adapters import HTTPAdapter
 
 from fortishield_testing.tools.system import HostManager
 
 
 STATE_INDEX_NAME = 'fortishield-vulnerabilities-states'
+INDEXER_PORT = 9200
+# Number of hits requested in every page
+DEFAULT_PAGE_SIZE = 1000
+# Time that the point in time is kept alive between two pages
+PIT_KEEP_ALIVE = '1m'
+# Field used to break the ties between hits with the same sort values
+TIEBREAKER_FIELD = '_id'
+
+_clients = {}
+
+
+class IndexerClient:
+    """Client of the Indexer API that pages through the search results.
+
+    The results are read page by page with `search_after` cursors over a point in time (PIT) of the searched indices,
+    so they are not limited by the maximum result window and the hits can be processed while they are read. If the
+    Indexer does not support point in time searches, the pages are read from the live indices. All the requests reuse
+    the connections of the same session.
+
+    Args:
+        ip_address (str): Indexer IP address or hostname.
+        credentials (dict): Indexer credentials, with the `user` and `password` keys.
+        port (int, optional): Indexer API port. Default `INDEXER_PORT`
+        protocol (str, optional): Protocol of the Indexer API. Default `'https'`
+        page_size (int, optional): Number of hits requested in every page. Default `DEFAULT_PAGE_SIZE`
+        pool_size (int, optional): Maximum number of connections kept open. Default `10`
+        verify (bool, optional): Verify the certificate of the Indexer. Default `False`
+
+    Example:
+        client = IndexerClient('172.16.1.10', {'user': 'admin', 'password': 'changeme'})
+        for alert in client.iter_hits('fortishield-alerts*', make_alerts_query(agent='agent1')):
+            ...
+    """
+
+    def __init__(self, ip_address, credentials, port=INDEXER_PORT, protocol='https', page_size=DEFAULT_PAGE_SIZE,
+                 pool_size=10, verify=False):
+        self.url = f"{protocol}://{ip_address}:{port}"
+        self.page_size = page_size
+        self.session = requests.Session()
+        self.session.auth = requests.auth.HTTPBasicAuth(credentials['user'], credentials['password'])
+        self.session.verify = verify
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the connections of the session."""
+        self.session.close()
+
+    def request(self, method, endpoint, **kwargs):
+        """Make a request to the Indexer API.
+
+        Args:
+            method (str): HTTP method.
+            endpoint (str): Endpoint, starting with `/`.
+            **kwargs: Arguments of `requests.Session.request`.
+
+        Returns:
+            requests.Response: Response of the Indexer.
+        """
+        return self.session.request(method, f"{self.url}{endpoint}", **kwargs)
+
+    def search(self, index, query=None, sort=None, size=None) -> Dict:
+        """Make a single search request.
+
+        Args:
+            index (str): Index name or pattern.
+            query (dict, optional): Query of the search. Default `None` (all the documents)
+            sort (list, optional): Sort of the search. Default `None`
+            size (int, optional): Number of hits. Default `None` (the page size)
+
+        Returns:
+            dict: Search results.
+
+        Raises:
+            requests.HTTPError: If the request is not successful.
+        """
+        body = {'query': query or {'match_all': {}}, 'size': size or self.page_size}
+        if sort:
+            body['sort'] = sort
+
+        response = self.request('POST', f"/{index}/_search", json=body)
+        response.raise_for_status()
+
+        return response.json()
+
+    def iter_hits(self, index, query=None, sort=None, page_size=None, use_pit=True) -> Generator[Dict, None, None]:
+        """Get all the hits of a search, page by page.
+
+        Args:
+            index (str): Index name or pattern.
+            query (dict, optional): Query of the search. Default `None` (all the documents)
+            sort (list, optional): Sort of the search. `TIEBREAKER_FIELD` is appended to break the ties. Default
+                `None` (`TIEBREAKER_FIELD` order)
+            page_size (int, optional): Number of hits requested in every page. Default `None` (the client page size)
+            use_pit (bool, optional): Read the pages from a point in time of the indices. Default `True`
+
+        Yields:
+            dict: Hits, in the order of the search.
+
+        Raises:
+            requests.HTTPError: If a request is not successful.
+        """
+        body = {'query': query or {'match_all': {}}, 'size': page_size or self.page_size,
+                'sort': list(sort or []) + [{TIEBREAKER_FIELD: 'asc'}]}
+        pit_id = self._create_pit(index) if use_pit else None
+        endpoint = '/_search' if pit_id else f"/{index}/_search"
+
+        try:
+            while True:
+                if pit_id:
+                    body['pit'] = {'id': pit_id, 'keep_alive': PIT_KEEP_ALIVE}
+
+                response = self.request('POST', endpoint, json=body)
+                response.raise_for_status()
+                results = response.json()
+                pit_id = results.get('pit_id', pit_id)
+                hits = results['hits']['hits']
+
+                yield from hits
+
+                if len(hits) < body['size']:
+                    break
+                body['search_after'] = hits[-1]['sort']
+        finally:
+            if pit_id:
+                self._delete_pit(pit_id)
+
+    def get_hits(self, index, query=None, sort=None, page_size=None, use_pit=True) -> List[Dict]:
+        """Get all the hits of a search, see `iter_hits`.
+
+        Returns:
+            list: Hits, in the order of the search.
+        """
+        return list(self.iter_hits(index, query, sort, page_size, use_pit))
+
+    def _create_pit(self, index):
+        response = self.request('POST', f"/{index}/_search/point_in_time", params={'keep_alive': PIT_KEEP_ALIVE})
+        if response.status_code != HTTPStatus.OK:
+            logging.info(f"Point in time not available for index {index}: {response.text}")
+            return None
+
+        return response.json()['pit_id']
+
+    def _delete_pit(self, pit_id):
+        try:
+            self.request('DELETE', '/_search/point_in_time', json={'pit_id': [pit_id]})
+        except requests.RequestException as error:
+            logging.warning(f"The point in time could not be deleted: {error}")
+
+
+def get_indexer_client(ip_address, credentials, **kwargs) -> IndexerClient:
+    """Get the client of an Indexer, creating it the first time so its session is reused.
+
+    Args:
+        ip_address (str): Indexer IP address or hostname.
+        credentials (dict): Indexer credentials, with the `user` and `password` keys.
+        **kwargs: Arguments of `IndexerClient`.
+
+    Returns:
+        IndexerClient: Indexer client.
+    """
+    key = (ip_address, credentials['user'], credentials['password'], tuple(sorted(kwargs.items())))
+    if key not in _clients:
+        _clients[key] = IndexerClient(ip_address, credentials, **kwargs)
+
+    return _clients[key]
+
+
+def make_alerts_query(greater_than_timestamp=None, agent=None, rule_description_regex=None,
+                      rule_ids=None) -> Dict:
+    """Build a query that filters the alerts in the Indexer.
+
+    Args:
+        greater_than_timestamp (str, optional): Minimum timestamp of the alerts. Default `None`
+        agent (str or bool, optional): Name of the agent of the alerts, or True to get only the alerts with an agent.
+            Default `None`
+        rule_description_regex (str, optional): Regular expression (Lucene syntax) that the whole rule description must
+            match. Default `None`
+        rule_ids (list, optional): IDs of the rules of the alerts. Default `None`
+
+    Returns:
+        dict: Query.
+    """
+    filters = []
+    if greater_than_timestamp:
+        filters.append({"range": {"@timestamp": {"gte": f"{greater_than_timestamp}"}}})
+    if agent is True:
+        filters.append({"exists": {"field": "agent.name"}})
+    elif agent:
+        filters.append({"term": {"agent.name": agent}})
+    if rule_description_regex:
+        filters.append({"regexp": {"rule.description": rule_description_regex}})
+    if rule_ids:
+        filters.append({"terms": {"rule.id": [str(rule_id) for rule_id in rule_ids]}})
+
+    return {"bool": {"filter": filters}} if filters else {"match_all": {}}
 
 
 def get_indexer_values(host_manager: HostManager, credentials: dict = {'user': 'admin', 'password': 'changeme'},
-                       index: str = 'fortishield-alerts*', greater_than_timestamp=None) -> Dict:
+                       index: str = 'fortishield-alerts*', greater_than_timestamp=None, query=None) -> Dict:
     """
     Get values from the Fortishield Indexer API.
 
+    All the matching documents are read, page by page.
+
     Args:
         host_manager: An instance of the HostManager class containing information about hosts.
         credentials (Optional): A dictionary containing the Indexer credentials. Defaults to
                                  {'user': 'admin', 'password': 'changeme'}.
         index (Optional): The Indexer index name. Defaults to 'fortishield-alerts*'.
         greater_than_timestamp (Optional): The timestamp to filter the results. Defaults to None.
+        query (Optional): Query to filter the results, it replaces `greater_than_timestamp`. Defaults to None.
 
     Returns:
        Dict: A dictionary containing the values retrieved from the Indexer API.
     """
     logging.info(f"Getting values from the Indexer API for index {index}")
 
-    url = f"https://{host_manager.get_master_ip()}:9200/{index}/_search"
-    headers = {
-        'Content-Type': 'application/json',
-    }
+    if query is None:
+        query = make_alerts_query(greater_than_timestamp=greater_than_timestamp)
+    sort = [{"@timestamp": {"order": "desc"}}] if greater_than_timestamp else None
 
-    data = {
-        "query": {
-            "match_all": {}
-        }
-    }
+    client = get_indexer_client(host_manager.get_master_ip(), credentials)
+    hits = client.get_hits(index, query=query, sort=sort)
 
-    if greater_than_timestamp:
-        query = {
-                "bool": {
-                    "must": [
-                        {"match_all": {}},
-                        {"range": {"@timestamp": {"gte": f"{greater_than_timestamp}"}}}
-                    ]
-                }
-        }
-
-        sort = [
-            {
-                "@timestamp": {
-                    "order": "desc"
-                }
-            }
-        ]
-
-        data['query'] = query
-        data['sort'] = sort
-
-    param = {
-        'pretty': 'true',
-        'size': 10000,
-    }
-
-    response = requests.get(url=url, params=param, verify=False,
-                            auth=requests.auth.HTTPBasicAuth(credentials['user'], credentials['password']),
-                            headers=headers,
-                            json=data)
-
-    return response.json()
+    return {'hits': {'total': {'value': len(hits), 'relation': 'eq'}, 'hits': hits}}
@@ -32,7 +32,7 @@ def truncate_remote_host_group_files(host_manager: HostManager, host_group: str,
     - file_to_truncate (str, optional): The type of file to truncate. Default is 'logs'.
       Possible values are 'logs' for log files or 'alerts' for alert files.
     """
-    for host in host_manager.get_group_hosts(host_group):
+    def truncate_host_file(host):
         if file_to_truncate == 'logs':
             host_os_name = host_manager.get_host_variables(host)['os_name']
             log_file_path = logs_filepath_os[host_os_name]
@@ -43,6 +43,8 @@ def truncate_remote_host_group_files(host_manager: HostManager, host_group: str,
 
         host_manager.truncate_file(host, log_file_path)
 
+    host_manager.run_on_hosts(truncate_host_file, host_manager.get_group_hosts(host_group), raise_on_error=True)
+
 
 def get_hosts_logs(host_manager: HostManager, host_group: str = 'all') -> Dict[str, str]:
     """
@@ -53,9 +55,10 @@ def get_hosts_logs(host_manager: HostManager, host_group: str = 'all') -> Dict[s
     - host_group (str, optional): The name of the host group where the files will be truncated.
       Default is 'all'.
     """
-    host_logs = {}
-    for host in host_manager.get_group_hosts(host_group):
+    def get_host_logs(host):
         host_os_name = host_manager.get_host_variables(host)['os_name']
-        host_logs[host] = host_manager.get_file_content(host, logs_filepath_os[host_os_name])
+        return host_manager.get_file_content(host, logs_filepath_os[host_os_name])
+
+    results = host_manager.run_on_hosts(get_host_logs, host_manager.get_group_hosts(host_group), raise_on_error=True)
 
-    return host_logs
+    return {host: result['result'] for host, result in results.items()}
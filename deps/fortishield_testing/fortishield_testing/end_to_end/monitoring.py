@@ -5,6 +5,9 @@ Monitoring remote host files module.
 Description:
     This module provides functions for monitoring events, files, and alerts in a Fortishield environment.
 
+Classes:
+    - HostFilesMonitor: Monitor several regexes in the files of a host, reading every file once per scan.
+
 Functions:
     - monitoring_events_multihost: Monitor events on multiple hosts concurrently.
     - generate_monitoring_logs: Generate monitoring data for logs on all agent hosts.
@@ -17,7 +20,7 @@ This program is a free software; you can redistribute it and/or modify it under
 
 import re
 import logging
-from time import sleep
+from time import sleep, monotonic
 from datetime import datetime
 from typing import Dict, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -26,14 +29,140 @@ from fortishield_testing.end_to_end import logs_filepath_os
 from fortishield_testing.tools.system import HostManager
 
 
-def monitoring_events_multihost(host_manager: HostManager, monitoring_data: Dict, ignore_error: bool = False) -> Dict:
+# Seconds between two scans of the monitored files. The interval grows while the files do not change.
+MIN_SCAN_INTERVAL = 1
+MAX_SCAN_INTERVAL = 20
+SCAN_INTERVAL_FACTOR = 2
+LOG_TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S"
+PARAMETER_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def filter_events_by_timestamp(match_events: List, greater_than_timestamp: str) -> List:
+    """
+    Filter events by timestamp.
+
+    Args:
+        match_events (List): A list of events, the timestamp is the event or its first group.
+        greater_than_timestamp (str): Minimum timestamp of the events.
+
+    Returns:
+        List: A list of events that fit the timestamp.
+    """
+    greater_than_timestamp_formatted = datetime.strptime(greater_than_timestamp, PARAMETER_TIMESTAMP_FORMAT)
+    match_that_fit_timestamp = []
+    for match in match_events:
+        timestamp_str = match[0] if match.__class__ == tuple else match
+        if datetime.strptime(timestamp_str, LOG_TIMESTAMP_FORMAT) >= greater_than_timestamp_formatted:
+            match_that_fit_timestamp.append(match)
+
+    return match_that_fit_timestamp
+
+
+class HostFilesMonitor:
+    """
+    Monitor several regexes in the files of a host, reading every file once per scan.
+
+    In every scan, only the bytes appended to the files since the previous scan are transferred, with a single command
+    for all the files of the host, and all the pending regexes of every file are searched in its new complete lines.
+    The scan interval starts at `min_scan_interval` and it is multiplied by `SCAN_INTERVAL_FACTOR` while the files do
+    not change, up to `max_scan_interval`. The timeout of every element starts when the monitoring starts.
+
+    Args:
+        host_manager (HostManager): Host Manager to handle the environment.
+        host (str): The target host.
+        monitoring_elements (List): A list of dictionaries containing regex, timeout, file, n_iterations and
+            optionally greater_than_timestamp.
+        min_scan_interval (float): Minimum seconds between two scans. Defaults to MIN_SCAN_INTERVAL.
+        max_scan_interval (float): Maximum seconds between two scans. Defaults to MAX_SCAN_INTERVAL.
+    """
+
+    def __init__(self, host_manager: HostManager, host: str, monitoring_elements: List[Dict],
+                 min_scan_interval: float = MIN_SCAN_INTERVAL, max_scan_interval: float = MAX_SCAN_INTERVAL):
+        self.host_manager = host_manager
+        self.host = host
+        self.monitoring_elements = monitoring_elements
+        self.min_scan_interval = min_scan_interval
+        self.max_scan_interval = max_scan_interval
+
+    def run(self, ignore_error: bool = False) -> Dict:
+        """
+        Monitor the elements until all of them are found or their timeouts expire.
+
+        Args:
+            ignore_error (bool): If True, do not raise an error when an element is not found.
+
+        Returns:
+            dict: Elements not found and matches of the found elements of the host.
+
+        Raises:
+            TimeoutError: If an element is not found within its timeout and ignore_error is False.
+        """
+        start_time = monotonic()
+        pending = [{'element': element, 'regex': re.compile(element['regex']), 'matches': [],
+                    'deadline': start_time + element['timeout']} for element in self.monitoring_elements]
+        positions = {element['file']: (None, 0) for element in self.monitoring_elements}
+        partial_lines = {path: b'' for path in positions}
+        elements_found = []
+        elements_not_found = []
+        scan_interval = self.min_scan_interval
+
+        while pending:
+            files_position = {path: positions[path] for path in {state['element']['file'] for state in pending}}
+            new_lines = {}
+            for path, (file_id, start, offset, content) in self.host_manager.get_files_increment(
+                    self.host, files_position).items():
+                if start == 0 and positions[path][1] > 0:
+                    partial_lines[path] = b''
+                positions[path] = (file_id, offset)
+                content = partial_lines[path] + content
+                complete, _, partial_lines[path] = content.rpartition(b'\n')
+                if complete:
+                    new_lines[path] = complete.decode(errors='replace')
+
+            for state in pending:
+                element = state['element']
+                if element['file'] in new_lines:
+                    matches = state['regex'].findall(new_lines[element['file']])
+                    if matches and element.get('greater_than_timestamp'):
+                        matches = filter_events_by_timestamp(matches, element['greater_than_timestamp'])
+                    state['matches'].extend(matches)
+
+            now = monotonic()
+            still_pending = []
+            for state in pending:
+                if state['matches'] and len(state['matches']) >= state['element']['n_iterations']:
+                    elements_found.extend(state['matches'])
+                elif now >= state['deadline']:
+                    elements_not_found.append(state['element'])
+                else:
+                    still_pending.append(state)
+            pending = still_pending
+
+            if pending:
+                scan_interval = self.min_scan_interval if new_lines else \
+                    min(scan_interval * SCAN_INTERVAL_FACTOR, self.max_scan_interval)
+                sleep(max(0, min(scan_interval, min(state['deadline'] for state in pending) - now)))
+
+        if elements_not_found and not ignore_error:
+            raise TimeoutError(f"Element not found: {elements_not_found[0]}")
+
+        return {self.host: {'not_found': elements_not_found, 'found': elements_found}}
+
+
+def monitoring_events_multihost(host_manager: HostManager, monitoring_data: Dict, ignore_error: bool = False,
+                                min_scan_interval: float = MIN_SCAN_INTERVAL,
+                                max_scan_interval: float = MAX_SCAN_INTERVAL) -> Dict:
     """
     Monitor events on multiple hosts concurrently.
 
+    The elements of every host are monitored at the same time, see `HostFilesMonitor`.
+
     Args:
         host_manager: An instance of the HostManager class containing information about hosts.
         monitoring_data: A dictionary containing monitoring data for each host.
         ignore_error: If True, ignore errors and continue monitoring.
+        min_scan_interval: Minimum seconds between two scans of the files of a host.
+        max_scan_interval: Maximum seconds between two scans of the files of a host.
 
     Returns:
         dict: A dictionary containing the monitoring results.
@@ -61,96 +190,14 @@ def monitoring_events_multihost(host_manager: HostManager, monitoring_data: Dict
            }
         }
     """
-    def monitoring_event(host_manager: HostManager, host: str, monitoring_elements: List[Dict], scan_interval: int = 20,
-                         ignore_error: bool = False) -> Dict:
-        """
-        Monitor the specified elements on a host.
-
-        Args:
-            host_manager (HostManager): Host Manager to handle the environment
-            host (str): The target host.
-            monitoring_elements(List): A list of dictionaries containing regex, timeout, and file.
-            ignore_error: If True, ignore errors and continue monitoring.
-
-        Raises:
-            TimeoutError: If no match is found within the specified timeout.
-        """
-        def filter_events_by_timestamp(match_events: List) -> List:
-            """
-            Filter events by timestamp.
-
-            Args:
-                match_events (List): A list of events.
-
-            Returns:
-                List: A list of events that fit the timestamp.
-            """
-            match_that_fit_timestamp = []
-            for match in match_events:
-                if match.__class__ == tuple:
-                    timestamp_str = match[0]
-                else:
-                    timestamp_str = match
-
-                timestamp_format = "%Y/%m/%d %H:%M:%S"
-                timestamp_format_parameter = "%Y-%m-%dT%H:%M:%S.%f"
-
-                timestamp_datetime = datetime.strptime(timestamp_str, timestamp_format)
-                greater_than_timestamp_formatted = datetime.strptime(greater_than_timestamp, timestamp_format_parameter)
-
-                if timestamp_datetime >=  greater_than_timestamp_formatted:
-                    match_that_fit_timestamp.append(match)
-
-            return match_that_fit_timestamp
-
-        elements_not_found = []
-        elements_found = []
-
-        for element in monitoring_elements:
-            regex, timeout, monitoring_file, n_iterations, greater_than_timestamp = element['regex'], \
-                                                            element['timeout'], element['file'], \
-                                                            element['n_iterations'], \
-                                                            element.get('greater_than_timestamp', None)
-            current_timeout = 0
-            regex_match = None
-
-            while current_timeout < timeout:
-                file_content = host_manager.get_file_content(host, monitoring_file)
-                match_regex = re.findall(regex, file_content)
-                if greater_than_timestamp:
-                    match_that_fit_timestamp = filter_events_by_timestamp(match_regex)
-                else:
-                    match_that_fit_timestamp = list(match_regex)
-
-                if match_that_fit_timestamp and len(list(match_that_fit_timestamp)) >= n_iterations:
-                    elements_found = list(match_that_fit_timestamp)
-                    regex_match = True
-                    break
-
-                sleep(scan_interval)
-
-                current_timeout += scan_interval
-
-            if not regex_match:
-                elements_not_found.append(element)
-                if not ignore_error:
-                    raise TimeoutError(f"Element not found: {element}")
-
-        monitoring_result = {}
-
-        if host not in monitoring_result:
-            monitoring_result[host] = {}
-
-        monitoring_result = {host: {'not_found': elements_not_found, 'found': elements_found}}
-
-        return monitoring_result
-
     logging.info(f"Monitoring the following elements: {monitoring_data}")
 
     with ThreadPoolExecutor() as executor:
         futures = []
         for host, data in monitoring_data.items():
-            futures.append(executor.submit(monitoring_event, host_manager, host, data, ignore_error))
+            monitor = HostFilesMonitor(host_manager, host, data, min_scan_interval=min_scan_interval,
+                                       max_scan_interval=max_scan_interval)
+            futures.append(executor.submit(monitor.run, ignore_error=ignore_error))
 
         results = {}
         for future in as_completed(futures):
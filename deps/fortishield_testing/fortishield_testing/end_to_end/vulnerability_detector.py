@@ -23,7 +23,7 @@ import json
 from typing import Dict, List
 
 from fortishield_testing.tools.system import HostManager
-from fortishield_testing.end_to_end.indexer_api import get_indexer_values
+from fortishield_testing.end_to_end.indexer_api import get_indexer_values, make_alerts_query
 
 
 def load_packages_metadata() -> Dict:
@@ -166,11 +166,15 @@ def get_vulnerabilities_alerts_indexer(host_manager: HostManager, greater_than_t
         dict: Dictionary containing the indexed vulnerabilities by agent.
     """
 
-    indexer_alerts = get_indexer_values(host_manager, greater_than_timestamp=greater_than_timestamp)['hits']['hits']
-
     regex_to_match = "CVE.* affects .*" if not vuln_mitigated else \
         "The .* that affected .* was solved due to a package removal"
 
+    # The alerts are filtered by the Indexer, the Lucene regex must match the whole description
+    query = make_alerts_query(greater_than_timestamp=greater_than_timestamp, agent=True,
+                              rule_description_regex=f"{regex_to_match}.*")
+    indexer_alerts = get_indexer_values(host_manager, greater_than_timestamp=greater_than_timestamp,
+                                        query=query)['hits']['hits']
+
     return get_alerts_by_agent(indexer_alerts, regex_to_match)
 
 
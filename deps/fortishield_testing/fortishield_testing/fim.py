@@ -22,10 +22,11 @@ from stat import ST_ATIME, ST_MTIME
 from typing import Sequence, Union, Generator, Any
 
 import pytest
-from jsonschema import validate
 from fortishield_testing import global_parameters, logger
+from fortishield_testing.modules.fim import latency
 from fortishield_testing.tools import LOG_FILE_PATH, FORTISHIELD_PATH
 from fortishield_testing.tools.monitoring import FileMonitor
+from fortishield_testing.tools.schema_validator import get_validator
 from fortishield_testing.tools.time import TimeMachine
 from fortishield_testing.tools.file import generate_string
 
@@ -215,10 +216,7 @@ def validate_event(event, checks=None, mode=None):
                 result |= get_required_attributes(mapped, result=result)
         return result
 
-    json_file = 'syscheck_event_windows.json' if sys.platform == "win32" else 'syscheck_event.json'
-    with open(os.path.join(_data_path, json_file), 'r') as f:
-        schema = json.load(f)
-    validate(schema=schema, instance=event)
+    get_validator('syscheck_event.json', sys.platform).validate(event)
 
     # Check FIM mode
     mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode.replace('-', '')
@@ -277,11 +275,7 @@ def validate_registry_key_event(event, checks=None, mode=None):
 
         return result
 
-    json_file = 'syscheck_event_windows.json' if sys.platform == "win32" else 'syscheck_event.json'
-    with open(os.path.join(_data_path, json_file), 'r') as f:
-        schema = json.load(f)
-
-    validate(schema=schema, instance=event)
+    get_validator('syscheck_event.json', sys.platform).validate(event)
 
     # Check FIM mode
     mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode.replace('-', '')
@@ -342,11 +336,7 @@ def validate_registry_value_event(event, checks=None, mode=None):
 
         return result
 
-    json_file = 'syscheck_event_windows.json' if sys.platform == "win32" else 'syscheck_event.json'
-    with open(os.path.join(_data_path, json_file), 'r') as f:
-        schema = json.load(f)
-
-    validate(schema=schema, instance=event)
+    get_validator('syscheck_event.json', sys.platform).validate(event)
 
     # Check FIM mode
     mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode.replace('-', '')
@@ -419,6 +409,7 @@ def create_file(type_, path, name, **kwargs):
         ValueError: if `target` is missing for SYMLINK or HARDINK.
     """
 
+    start_time = time.time()
     try:
         logger.info("Creating file " + str(os.path.join(path, name)) + " of " + str(type_) + " type")
         os.makedirs(path, exist_ok=True, mode=0o777)
@@ -430,6 +421,7 @@ def create_file(type_, path, name, **kwargs):
         if type_ in (SYMLINK, HARDLINK) and 'target' not in kwargs:
             raise ValueError(f"'target' param is mandatory for type {type_}")
         getattr(sys.modules[__name__], f'_create_{type_}')(path, name, **kwargs)
+        latency.record_change(latency.CREATE, os.path.join(path, name), start_time)
     except OSError:
         logger.info("File could not be created.")
         pytest.skip("OS does not allow creating this file.")
@@ -570,7 +562,9 @@ def delete_file(path, name):
     logger.info(f"Removing file {str(os.path.join(path, name))}")
     regular_path = os.path.join(path, name)
     if os.path.exists(regular_path):
+        start_time = time.time()
         os.remove(regular_path)
+        latency.record_change(latency.DELETE, regular_path, start_time)
 
 
 def delete_registry(key, subkey, arch):
@@ -921,6 +915,7 @@ def modify_file(path, name, new_content=None, is_binary=False):
         is_binary: (boolean, optional): True if the file is binary. False otherwise. Defaults `False`
     """
     logger.info("Modifying file " + str(os.path.join(path, name)))
+    start_time = time.time()
     modify_file_inode(path, name)
     modify_file_content(path, name, new_content, is_binary)
     modify_file_mtime(path, name)
@@ -928,6 +923,7 @@ def modify_file(path, name, new_content=None, is_binary=False):
     modify_file_group(path, name)
     modify_file_permission(path, name)
     modify_file_win_attributes(path, name)
+    latency.record_change(latency.MODIFY, os.path.join(path, name), start_time)
 
 
 def change_internal_options(param, value, opt_path=None, value_regex='[0-9]*'):
@@ -3,14 +3,12 @@
 # This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
 import functools
 import hashlib
-import json
 import logging
-import socket
 import sqlite3
 import time
 
-from fortishield_testing.tools import GLOBAL_DB_PATH, FORTISHIELD_DB_SOCKET_PATH
-from fortishield_testing.tools.monitoring import fortishield_pack, fortishield_unpack
+from fortishield_testing.db_interface.wdb_client import get_wdb_client
+from fortishield_testing.tools import GLOBAL_DB_PATH
 from fortishield_testing.tools.services import control_service
 
 
@@ -134,29 +132,7 @@ def query_wdb(command):
     Returns:
         list: Query response data
     """
-    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    sock.connect(FORTISHIELD_DB_SOCKET_PATH)
-
-    data = []
-
-    try:
-        sock.send(fortishield_pack(len(command)) + command.encode())
-
-        rcv = sock.recv(4)
-
-        if len(rcv) == 4:
-            data_len = fortishield_unpack(rcv)
-
-            data = sock.recv(data_len).decode()
-
-            # Remove response header and cast str to list of dictionaries
-            # From --> 'ok [ {data1}, {data2}...]' To--> [ {data1}, data2}...]
-            if len(data.split()) > 1 and data.split()[0] == 'ok':
-                data = json.loads(' '.join(data.split(' ')[1:]))
-    finally:
-        sock.close()
-
-    return data
+    return get_wdb_client().query(command)
 
 
 def clean_agents_from_db():
@@ -0,0 +1,447 @@
+# Copyright (C) 2015-2023, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+import csv
+import os
+import queue
+import random
+import threading
+from collections import deque
+from time import monotonic, time
+
+import numpy as np
+
+from fortishield_testing import LOG_FILE_PATH, logger
+from fortishield_testing.modules.fim.event_monitor import callback_detect_event
+from fortishield_testing.tools.eps_scheduler import EPSScheduler
+from fortishield_testing.tools.monitoring import get_tail_hub
+
+CREATE = 'create'
+MODIFY = 'modify'
+CHMOD = 'chmod'
+RENAME = 'rename'
+DELETE = 'delete'
+OPERATIONS = [CREATE, MODIFY, CHMOD, RENAME, DELETE]
+DEFAULT_MIX = {CREATE: 4, MODIFY: 3, CHMOD: 1, RENAME: 1, DELETE: 1}
+LATENCY_PERCENTILES = [50, 90, 95, 99]
+# Scheduler bucket used to pace all the operations
+SCHEDULER_KEY = ('fim_churn', 'operations')
+
+
+class ChurnJournal:
+    """Thread safe record of the operations done by a `FIMChurnGenerator`.
+
+    Every entry has the operation `id`, its `operation` name, the `path` of the file, the `new_path` of renamed files,
+    the `time` (`time.time` clock) when the operation started and the FIM events it should raise (`expected`, list of
+    event type and path tuples).
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def add(self, operation, path, new_path=None, start_time=None):
+        """Record an operation.
+
+        Args:
+            operation (str): Operation name.
+            path (str): File path.
+            new_path (str, optional): New file path of a renamed file. Default `None`
+            start_time (float, optional): Time (`time.time` clock) when the operation started. Default `None` (now)
+
+        Returns:
+            dict: Journal entry.
+        """
+        if operation == CREATE:
+            expected = [('added', path)]
+        elif operation == RENAME:
+            expected = [('deleted', path), ('added', new_path)]
+        elif operation == DELETE:
+            expected = [('deleted', path)]
+        else:
+            expected = [('modified', path)]
+
+        entry = {'operation': operation, 'path': path, 'new_path': new_path,
+                 'time': time() if start_time is None else start_time, 'expected': expected}
+        with self._lock:
+            entry['id'] = len(self.entries)
+            self.entries.append(entry)
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def export_csv(self, path):
+        """Write the journal into a CSV file.
+
+        Args:
+            path (str): Path of the CSV file.
+        """
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=['id', 'time', 'operation', 'path', 'new_path'],
+                                    extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.entries)
+
+
+class FIMChurnGenerator:
+    """Generate file churn in monitored directories at a target rate of operations per second.
+
+    The operations are picked randomly following the weights of `mix`, and they are run by a pool of threads that share
+    the same rate limit. Every thread owns its files, so the operations of different threads never collide. The files
+    are spread over a tree of subdirectories of every monitored directory.
+
+    Args:
+        directories (list): Monitored directories.
+        ops (float): Target operations per second.
+        mix (dict, optional): Weight of every operation (`create`, `modify`, `chmod`, `rename`, `delete`).
+            Default `DEFAULT_MIX`
+        workers (int, optional): Number of threads. Default `4`
+        depth (int, optional): Levels of subdirectories of every monitored directory. Default `0`
+        width (int, optional): Subdirectories of every directory of the tree. Default `1`
+        file_size (int, optional): Bytes written by every create and modify operation. Default `128`
+        max_files (int, optional): Maximum number of files of every thread, creations become deletions when it is
+            reached. Default `1000`
+        profile (str, optional): Load profile of the rate, see `eps_scheduler.create_load_profile`. Default `None`
+            (constant)
+        seed (int, optional): Seed of the random operations. Default `None`
+
+    Examples:
+        >>> generator = FIMChurnGenerator(['/testdir1', '/testdir2'], ops=2000, depth=3, width=2)
+        >>> reconciler = FIMChurnReconciler(generator.journal).start()
+        >>> generator.run(duration=30)
+        >>> reconciler.wait(timeout=60)
+        >>> reconciler.report()
+    """
+
+    def __init__(self, directories, ops, mix=None, workers=4, depth=0, width=1, file_size=128, max_files=1000,
+                 profile=None, seed=None):
+        mix = DEFAULT_MIX if mix is None else mix
+        unknown_operations = set(mix) - set(OPERATIONS)
+        if unknown_operations:
+            raise ValueError(f"Unknown operations {sorted(unknown_operations)}. Valid ones are {OPERATIONS}")
+
+        self.directories = directories
+        self.ops = ops
+        self.operations = [operation for operation in mix if mix[operation] > 0]
+        self.weights = [mix[operation] for operation in self.operations]
+        self.workers = workers
+        self.depth = depth
+        self.width = width
+        self.content = b'0' * file_size
+        self.max_files = max_files
+        self.scheduler = EPSScheduler(profile=profile)
+        self.journal = ChurnJournal()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._done = 0
+        self._limit = None
+        self._tree = []
+        self._run_id = None
+
+    def create_tree(self):
+        """Create the subdirectories of every monitored directory.
+
+        Returns:
+            list: All the directories where files can be created.
+        """
+        tree = []
+        for directory in self.directories:
+            level = [directory]
+            tree += level
+            for _ in range(self.depth):
+                level = [os.path.join(parent, f"churn_{index}") for parent in level for index in range(self.width)]
+                tree += level
+
+        for directory in tree:
+            os.makedirs(directory, exist_ok=True)
+
+        return tree
+
+    def run(self, duration=None, operations=None):
+        """Run the churn until the duration is over, the operations are done or `stop` is called.
+
+        Args:
+            duration (float, optional): Seconds to run. Default `None`
+            operations (int, optional): Total number of operations. Default `None`
+
+        Returns:
+            ChurnJournal: Journal of the operations done.
+        """
+        self._tree = self.create_tree()
+        # File names are unique among runs, so the files of previous runs are never reused
+        self._run_id = f"{int(time() * 1000):x}"
+        self._stop.clear()
+        self._done = 0
+        self._limit = operations
+        self.scheduler.add_module(*SCHEDULER_KEY, eps=self.ops)
+
+        threads = [threading.Thread(target=self._worker, args=(index, self._random.getrandbits(32)), daemon=True)
+                   for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        self._stop.wait(duration)
+        self._stop.set()
+        for thread in threads:
+            thread.join()
+
+        logger.info(f"FIM churn: {len(self.journal)} operations done, {self.errors} failed, accuracy "
+                    f"{self.achieved_accuracy():.2f}")
+        return self.journal
+
+    def stop(self):
+        """Stop the running churn."""
+        self._stop.set()
+
+    def achieved_accuracy(self):
+        """Get the ratio between the achieved and target operations per second."""
+        return self.scheduler.accuracy().get(SCHEDULER_KEY, 0.0)
+
+    def _take_operation(self):
+        """Count a new operation, returning False if the limit of operations is reached."""
+        with self._lock:
+            if self._limit is not None and self._done >= self._limit:
+                self._stop.set()
+                return False
+            self._done += 1
+            return True
+
+    def _worker(self, index, seed):
+        """Do operations paced by the shared scheduler until the churn is stopped."""
+        worker_random = random.Random(seed)
+        files = []
+        counter = 0
+
+        while not self._stop.is_set() and self._take_operation():
+            self.scheduler.wait(*SCHEDULER_KEY)
+            if self._stop.is_set():
+                break
+
+            operation = worker_random.choices(self.operations, self.weights)[0]
+            if operation != CREATE and not files:
+                operation = CREATE
+            elif operation == CREATE and len(files) >= self.max_files:
+                operation = DELETE
+
+            start_time = time()
+            try:
+                if operation == CREATE:
+                    path = os.path.join(worker_random.choice(self._tree), f"churn_{self._run_id}_w{index}_{counter}")
+                    counter += 1
+                    self._create(path)
+                    files.append(path)
+                    self.journal.add(CREATE, path, start_time=start_time)
+                else:
+                    position = worker_random.randrange(len(files))
+                    path = files[position]
+                    if operation == MODIFY:
+                        self._modify(path)
+                        self.journal.add(MODIFY, path, start_time=start_time)
+                    elif operation == CHMOD:
+                        os.chmod(path, 0o600 if os.stat(path).st_mode & 0o044 else 0o644)
+                        self.journal.add(CHMOD, path, start_time=start_time)
+                    elif operation == RENAME:
+                        new_path = os.path.join(os.path.dirname(path), f"churn_{self._run_id}_w{index}_{counter}")
+                        counter += 1
+                        os.replace(path, new_path)
+                        files[position] = new_path
+                        self.journal.add(RENAME, path, new_path, start_time=start_time)
+                    else:
+                        os.remove(path)
+                        files[position] = files[-1]
+                        files.pop()
+                        self.journal.add(DELETE, path, start_time=start_time)
+            except OSError as e:
+                with self._lock:
+                    self.errors += 1
+                logger.warning(f"FIM churn {operation} operation failed: {e}")
+
+    def _create(self, path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.write(fd, self.content)
+        finally:
+            os.close(fd)
+
+    def _modify(self, path):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, self.content)
+        finally:
+            os.close(fd)
+
+
+class FIMChurnReconciler:
+    """Match the FIM events sent by syscheckd with the operations of a `ChurnJournal`.
+
+    The `Sending FIM event` lines are read from the shared tailer of the log file, so it should be started before the
+    churn. Every event is matched with the oldest pending expected event of the same type and path, and the detection
+    latency of the operation is the time from its start until the event line is read. An event read before its
+    operation is in the journal is kept, and matched with the operation once it is added if the operation started
+    before the event was read. When FIM joins several operations of a file in one event, the expected events left
+    pending that are older than the last event of their file are counted as coalesced instead of missing.
+
+    Args:
+        journal (ChurnJournal): Journal of the operations.
+        file_path (str, optional): Log file path. Default `LOG_FILE_PATH`
+        hub (TailHub, optional): Hub to subscribe to. Default `None` (the one returned by `get_tail_hub`)
+        time_step (float, optional): Time to wait for new lines in every read. Default `0.1`
+    """
+
+    def __init__(self, journal, file_path=LOG_FILE_PATH, hub=None, time_step=0.1):
+        self.journal = journal
+        self.file_path = file_path
+        self.hub = get_tail_hub() if hub is None else hub
+        self.time_step = time_step
+        self.latencies = {}
+        self.mode_latencies = {}
+        # Key, event and detection time of the events that did not match any operation
+        self._unmatched = []
+        self._last_detection = {}
+        self._pending = {}
+        self._next_entry = 0
+        self._cursor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Subscribe to the log file and start reading the events in background.
+
+        Returns:
+            FIMChurnReconciler: The reconciler itself.
+        """
+        self._cursor = self.hub.subscribe(self.file_path)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop reading events and unsubscribe from the log file."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+    def wait(self, timeout):
+        """Wait until every operation of the journal has been matched, then stop reading.
+
+        Args:
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            boolean: True if all the operations were matched, False otherwise.
+        """
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            with self._lock:
+                self._load_journal()
+                if not any(self._pending.values()):
+                    break
+            self._stop.wait(self.time_step)
+        self.stop()
+
+        with self._lock:
+            self._load_journal()
+            return not any(self._pending.values())
+
+    def _consume(self):
+        while not self._stop.is_set():
+            try:
+                line = self._cursor.get(timeout=self.time_step)
+            except queue.Empty:
+                continue
+            event = callback_detect_event(line)
+            if event is not None:
+                self.process_event(event, time())
+
+    @property
+    def unexpected(self):
+        """FIM events that did not match any operation."""
+        with self._lock:
+            return [event for _, event, _ in self._unmatched]
+
+    def _load_journal(self):
+        """Add the expected events of the new journal entries to the pending ones.
+
+        The expected events that were read before their entry was added are matched right away.
+        """
+        entries = self.journal.entries
+        for entry in entries[self._next_entry:len(entries)]:
+            for event_type, path in entry['expected']:
+                key = (event_type, os.path.normcase(path))
+                unmatched = next((unmatched for unmatched in self._unmatched
+                                  if unmatched[0] == key and unmatched[2] >= entry['time']), None)
+                if unmatched is None:
+                    self._pending.setdefault(key, deque()).append(entry)
+                else:
+                    self._unmatched.remove(unmatched)
+                    self._match(entry, *unmatched)
+        self._next_entry = len(entries)
+
+    def _match(self, entry, key, event, detection_time):
+        """Record the detection latency of an operation."""
+        latency = detection_time - entry['time']
+        self.latencies.setdefault(entry['operation'], []).append(latency)
+        self.mode_latencies.setdefault(event.get('data', {}).get('mode'), []).append(latency)
+        self._last_detection[key] = max(detection_time, self._last_detection.get(key, 0))
+
+    def process_event(self, event, detection_time):
+        """Match a FIM event with the operations waiting for it.
+
+        Args:
+            event (dict): FIM event.
+            detection_time (float): Time (`time.time` clock) when the event was read.
+        """
+        data = event.get('data', {})
+        key = (data.get('type'), os.path.normcase(data.get('path', '')))
+        with self._lock:
+            self._load_journal()
+            pending = self._pending.get(key)
+            if not pending:
+                self._unmatched.append((key, event, detection_time))
+                return
+
+            self._match(pending.popleft(), key, event, detection_time)
+
+    def report(self):
+        """Get the reconciliation results and the detection latency percentiles.
+
+        Returns:
+            dict: Number of `operations`, `matched`, `coalesced` and `missing` expected events, `unexpected` events, and
+                latency percentiles in seconds of all the operations (`latency`), of every operation
+                (`latency_by_operation`) and of every FIM mode of the events (`latency_by_mode`).
+        """
+        with self._lock:
+            self._load_journal()
+            latencies = {operation: np.array(values) for operation, values in self.latencies.items()}
+            coalesced = sum(1 for key, pending in self._pending.items() for entry in pending
+                            if entry['time'] < self._last_detection.get(key, 0))
+            report = {
+                'operations': len(self.journal),
+                'matched': sum(len(values) for values in latencies.values()),
+                'coalesced': coalesced,
+                'missing': sum(len(pending) for pending in self._pending.values()) - coalesced,
+                'unexpected': len(self._unmatched),
+                'latency': self._percentiles(np.concatenate(list(latencies.values())) if latencies else np.array([])),
+                'latency_by_operation': {operation: self._percentiles(values) for operation, values in
+                                         latencies.items()},
+                'latency_by_mode': {mode: self._percentiles(np.array(values)) for mode, values in
+                                    self.mode_latencies.items()}
+            }
+        return report
+
+    @staticmethod
+    def _percentiles(values):
+        if not len(values):
+            return {}
+        percentiles = {f"p{percentile}": float(value)
+                       for percentile, value in zip(LATENCY_PERCENTILES, np.percentile(values, LATENCY_PERCENTILES))}
+        return {**percentiles, 'max': float(values.max()), 'mean': float(values.mean()), 'count': len(values)}
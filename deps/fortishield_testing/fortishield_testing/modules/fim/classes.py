@@ -4,16 +4,11 @@
 
 import os
 import sys
-import subprocess
-import json
-from jsonschema import validate
 from collections import Counter
-from fortishield_testing import global_parameters, logger, FORTISHIELD_TESTING_DATA_PATH
+from fortishield_testing import global_parameters, logger
 from fortishield_testing.modules.fim import REQUIRED_ATTRIBUTES, REQUIRED_REG_KEY_ATTRIBUTES, REQUIRED_REG_VALUE_ATTRIBUTES, CHECK_GROUP
 from fortishield_testing.modules.fim.event_monitor import callback_detect_event
-
-if sys.platform == 'linux2' or sys.platform == 'linux':
-    from jq import jq
+from fortishield_testing.tools.schema_validator import get_validator
 
 
 def validate_event(event, checks=None, mode=None):
@@ -37,10 +32,7 @@ def validate_event(event, checks=None, mode=None):
                 result |= get_required_attributes(mapped, result=result)
         return result
 
-    json_file = 'syscheck_event_windows.json' if sys.platform == "win32" else 'syscheck_event.json'
-    with open(os.path.join(FORTISHIELD_TESTING_DATA_PATH, json_file), 'r') as f:
-        schema = json.load(f)
-    validate(schema=schema, instance=event)
+    get_validator('syscheck_event.json', sys.platform).validate(event)
 
     # Check FIM mode
     mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode.replace('-', '')
@@ -100,11 +92,7 @@ def validate_registry_event(event, checks=None, mode=None, is_key=True):
 
         return result
 
-    json_file = 'syscheck_event_windows.json' if sys.platform == "win32" else 'syscheck_event.json'
-    with open(os.path.join(FORTISHIELD_TESTING_DATA_PATH, json_file), 'r') as f:
-        schema = json.load(f)
-
-    validate(schema=schema, instance=event)
+    get_validator('syscheck_event.json', sys.platform).validate(event)
 
     # Check FIM mode
     mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode.replace('-', '')
@@ -197,6 +185,95 @@ class CustomValidator:
                     validator(event)
 
 
+class EventBatch:
+    """Index of a list of FIM events by path, type and value name, built once to check the events.
+
+    The paths are compared with `os.path.normcase`, so they are case insensitive on Windows.
+
+    Args:
+        events (list): FIM events.
+
+    Attributes:
+        events (list): FIM events.
+        paths (dict): Events of every path.
+        types (Counter): Number of events of every type.
+        value_names (Counter): Number of events of every registry value name.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.paths = {}
+        self.types = Counter()
+        self.value_names = Counter()
+
+        for event in events:
+            data = event.get('data', {})
+            self.paths.setdefault(self._normalize(data.get('path')), []).append(event)
+            self.types[data.get('type')] += 1
+            if 'value_name' in data:
+                self.value_names[data['value_name']] += 1
+
+    @staticmethod
+    def _normalize(path):
+        """Normalize a path to use it as key of the index."""
+        return os.path.normcase(path) if isinstance(path, str) else path
+
+    def count(self, event_type):
+        """Get the number of events of a type.
+
+        Args:
+            event_type (str): Event type {'added', 'modified', 'deleted'}.
+
+        Returns:
+            int: Number of events.
+        """
+        return self.types[event_type]
+
+    def get_events(self, path):
+        """Get the events of a path.
+
+        Args:
+            path (str): Path of the events.
+
+        Returns:
+            list: Events of the path.
+        """
+        return self.paths.get(self._normalize(path), [])
+
+    def has_path(self, path, partial=False):
+        """Check if there is any event of a path.
+
+        Args:
+            path (str): Path of the events.
+            partial (boolean): Also accept the events whose path contains the given one. Default `False`
+
+        Returns:
+            boolean: True if there is any event of the path, False otherwise.
+        """
+        normalized_path = self._normalize(path)
+        if normalized_path in self.paths:
+            return True
+
+        return partial and any(isinstance(event_path, str) and normalized_path in event_path
+                               for event_path in self.paths)
+
+    def get_missing_paths(self, paths, partial=False):
+        """Get the paths without events.
+
+        Args:
+            paths (list): Expected paths.
+            partial (boolean): Also accept the events whose path contains the expected one. Default `False`
+
+        Returns:
+            list: Paths without events.
+        """
+        return [path for path in paths if not self.has_path(path, partial)]
+
+    def get_paths(self):
+        """Get the paths of all the events, in the same order as the events."""
+        return [event.get('data', {}).get('path') for event in self.events]
+
+
 class EventChecker:
     """Utility to allow fetch events and validate them."""
 
@@ -277,40 +354,32 @@ class EventChecker:
             for ev in events:
                 validate_event(ev, options, mode)
 
-        def check_events_type(events, ev_type, file_list=['testfile0']):
-            event_types = Counter(filter_events(events, ".[].data.type"))
-            msg = f"Non expected number of events. {event_types[ev_type]} != {len(file_list)}"
-            assert (event_types[ev_type] == len(file_list)), msg
-
-        def check_events_path(events, folder, file_list=['testfile0'], mode=None, escaped=False):
-            mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode
-            data_path = filter_events(events, ".[].data.path")
-            for file_name in file_list:
-                expected_path = os.path.join(folder, file_name)
-                if escaped:
-                    expected_path = expected_path.replace("\\", "\\\\")
-                if self.encoding is not None:
-                    for index, item in enumerate(data_path):
-                        data_path[index] = item.encode(encoding=self.encoding)
-                if sys.platform == 'darwin' and self.encoding and self.encoding != 'utf-8':
-                    logger.info(f"Not asserting {expected_path} in event.data.path. "
-                                f'Reason: using non-utf-8 encoding in darwin.')
-                else:
-                    error_msg = f"Expected data path was '{expected_path}' but event data path is '{data_path}'"
-                    assert (expected_path in str(data_path)), error_msg
-
-        def filter_events(events, mask):
-            """Returns a list of elements matching a specified mask in the events list using jq module."""
-            if sys.platform in ("win32", 'sunos5', 'darwin'):
-                stdout = subprocess.check_output(["jq", "-r", mask], input=json.dumps(events).encode())
-                return stdout.decode("utf8").strip().split(os.linesep)
-            else:
-                return jq(mask).transform(events, multiple_output=True)
+        def check_events_type(event_batch, ev_type, file_list=['testfile0']):
+            msg = f"Non expected number of events. {event_batch.count(ev_type)} != {len(file_list)}"
+            assert (event_batch.count(ev_type) == len(file_list)), msg
+
+        def check_events_path(event_batch, folder, file_list=['testfile0'], mode=None, escaped=False):
+            """Check that there is an event for every expected file.
+
+            The paths of the events are compared as they are, so `escaped` is not needed anymore and it is only kept
+            for compatibility.
+            """
+            if sys.platform == 'darwin' and self.encoding and self.encoding != 'utf-8':
+                logger.info(f"Not asserting {self._get_file_list()} in event.data.path. "
+                            f'Reason: using non-utf-8 encoding in darwin.')
+                return
+
+            expected_paths = [os.path.join(folder, file_name) for file_name in file_list]
+            missing_paths = event_batch.get_missing_paths(expected_paths, partial=True)
+            error_msg = f"Expected data paths {missing_paths} were not found in the event data paths " \
+                        f"{event_batch.get_paths()}"
+            assert not missing_paths, error_msg
 
         if self.events is not None:
+            event_batch = EventBatch(self.events)
             validate_checkers_per_event(self.events, self.options, mode)
-            check_events_type(self.events, event_type, self.file_list)
-            check_events_path(self.events, self.folder, file_list=self.file_list, mode=mode, escaped=escaped)
+            check_events_type(event_batch, event_type, self.file_list)
+            check_events_path(event_batch, self.folder, file_list=self.file_list, mode=mode, escaped=escaped)
 
             if self.custom_validator is not None:
                 self.custom_validator.validate_after_cud(self.events)
@@ -429,85 +498,62 @@ class RegistryEventChecker:
                 else:
                     validate_registry_event(ev, options, mode, is_key=True)
 
-        def check_events_type(events, ev_type, reg_list=['testkey0']):
+        def check_events_type(event_batch, ev_type, reg_list=['testkey0']):
             """Checks the event type of each events in a list.
 
             Args:
-                events (list): event list to be checked.
+                event_batch (EventBatch): indexed events to be checked.
                 ev_type (str): type of expected event.
                 reg_list (list): list of keys that are being checked.
             """
-            event_types = Counter(filter_events(events, ".[].data.type"))
+            assert (event_batch.count(ev_type) == len(reg_list)), f'Non expected number of \
+                                                              events. {event_batch.count(ev_type)} != {len(reg_list)}'
 
-            assert (event_types[ev_type] == len(reg_list)), f'Non expected number of \
-                                                              events. {event_types[ev_type]} != {len(reg_list)}'
-
-        def check_events_key_path(events, registry_key, reg_list=['testkey0'], mode=None):
+        def check_events_key_path(event_batch, registry_key, reg_list=['testkey0'], mode=None):
             """Checks the path for a registry_key event in a list.
 
             Args:
-                events (list): event list to be checked.
+                event_batch (EventBatch): indexed events to be checked.
                 registry_key (str): path to the key being checked.
                 reg_list (list, optional): list of keys that are being checked.
                 mode(str, optional): defines the type of FIM monitoring mode configured
             """
-            mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode
-            key_path = filter_events(events, ".[].data.path")
-
-            for reg in reg_list:
-                expected_path = os.path.join(registry_key, reg)
-
-                if self.encoding is not None:
-                    for index, item in enumerate(key_path):
-                        key_path[index] = item.encode(encoding=self.encoding)
+            expected_paths = [os.path.join(registry_key, reg) for reg in reg_list]
+            missing_paths = event_batch.get_missing_paths(expected_paths)
 
-                error_msg = f"Expected key path was '{expected_path}' but event key path is '{key_path}'"
-                assert (expected_path in key_path), error_msg
+            error_msg = f"Expected key paths {missing_paths} were not found in the event key paths " \
+                        f"{event_batch.get_paths()}"
+            assert not missing_paths, error_msg
 
-        def check_events_registry_value(events, key, value_list=['testvalue0'], mode=None):
+        def check_events_registry_value(event_batch, key, value_list=['testvalue0'], mode=None):
             """Checks the path for a registry_value event in a list.
 
             Args:
-                events (list): event list to be checked.
+                event_batch (EventBatch): indexed events to be checked.
                 key (str): path to the key being checked where the value has been added.
                 value_list (list, optional): list of values that are being checked.
                 mode(str, optional): defines the type of FIM monitoring mode configured
             """
-            mode = global_parameters.current_configuration['metadata']['fim_mode'] if mode is None else mode
-            key_path = filter_events(events, ".[].data.path")
-            value_name = filter_events(events, ".[].data.value_name")
-
-            for value in value_list:
-                error_msg = f"Expected value name was '{value}' but event value name is '{value_name}'"
-                assert (value in value_name), error_msg
-
-                error_msg = f"Expected key path was '{key}' but event key path is '{key_path}'"
-                assert (key in key_path), error_msg
+            missing_values = [value for value in value_list if value not in event_batch.value_names]
+            error_msg = f"Expected value names {missing_values} were not found in the event value names " \
+                        f"{list(event_batch.value_names)}"
+            assert not missing_values, error_msg
 
-        def filter_events(events, mask):
-            """Returns a list of elements matching a specified mask in the events list using jq module.
-
-            Args:
-                events (list): event list to be checked.
-                mask(str): mask to be used to check events using jq module
-            """
-            if sys.platform in ("win32", 'sunos5', 'darwin'):
-                stdout = subprocess.check_output(["jq", "-r", mask], input=json.dumps(events).encode())
-
-                return stdout.decode("utf8").strip().split(os.linesep)
-            else:
-                return jq(mask).transform(events, multiple_output=True)
+            if value_list:
+                error_msg = f"Expected key path was '{key}' but event key path is '{event_batch.get_paths()}'"
+                assert event_batch.has_path(key), error_msg
 
         if self.events is not None:
+            event_batch = EventBatch(self.events)
             validate_checkers_per_event(self.events, self.options, mode)
 
             if self.is_value:
-                check_events_type(self.events, event_type, self.registry_dict)
-                check_events_registry_value(self.events, self.registry_key, value_list=self.registry_dict,
+                check_events_type(event_batch, event_type, self.registry_dict)
+                check_events_registry_value(event_batch, self.registry_key, value_list=self.registry_dict,
                                             mode=mode)
             else:
-                check_events_type(self.events, event_type, self.registry_dict)
-                check_events_key_path(self.events, self.registry_key, reg_list=self.registry_dict, mode=mode)
+                check_events_type(event_batch, event_type, self.registry_dict)
+                check_events_key_path(event_batch, self.registry_key, reg_list=self.registry_dict, mode=mode)
 
             if self.custom_validator is not None:
                 self.custom_validator.validate_after_cud(self.events)
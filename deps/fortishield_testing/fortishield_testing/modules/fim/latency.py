@@ -0,0 +1,129 @@
+# Copyright (C) 2015-2023, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+'''
+Detection latency of the FIM events raised by the filesystem changes of the tests.
+
+The FIM helpers stamp every file they create, modify or delete while the recording is started, and the stamped
+changes are matched with the `Sending FIM event` lines of the log to get the latency percentiles of every FIM mode.
+'''
+import json
+
+from fortishield_testing import LOG_FILE_PATH, logger
+from fortishield_testing.modules.fim.churn import ChurnJournal, FIMChurnReconciler, CREATE, MODIFY, DELETE
+
+# Seconds to wait for the events of the last changes when the recording is stopped
+DEFAULT_DRAIN_TIMEOUT = 10
+
+_recorder = None
+
+
+class FIMLatencyRecorder:
+    """Match the filesystem changes with their FIM events to measure the detection latency.
+
+    Args:
+        file_path (str, optional): Log file path. Default `LOG_FILE_PATH`
+        hub (TailHub, optional): Hub to subscribe to. Default `None` (the one returned by `get_tail_hub`)
+    """
+
+    def __init__(self, file_path=LOG_FILE_PATH, hub=None):
+        self.journal = ChurnJournal()
+        self.reconciler = FIMChurnReconciler(self.journal, file_path=file_path, hub=hub)
+
+    def start(self):
+        """Start reading the FIM events."""
+        self.reconciler.start()
+        return self
+
+    def stop(self, timeout=DEFAULT_DRAIN_TIMEOUT):
+        """Wait for the events of the pending changes and stop reading the FIM events.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the pending events. Default `DEFAULT_DRAIN_TIMEOUT`
+        """
+        self.reconciler.wait(timeout)
+
+    def record(self, operation, path, start_time=None):
+        """Stamp a filesystem change.
+
+        Args:
+            operation (str): `create`, `modify` or `delete`.
+            path (str): Path of the changed file.
+            start_time (float, optional): Time (`time.time` clock) before the first change to the file. Default `None`
+                (now)
+        """
+        self.journal.add(operation, path, start_time=start_time)
+
+    def report(self):
+        """Get the latency report, see `FIMChurnReconciler.report`."""
+        return self.reconciler.report()
+
+    def export_json(self, path):
+        """Write the latency percentiles of every FIM mode into a JSON file.
+
+        Args:
+            path (str): Path of the JSON file.
+        """
+        report = self.report()
+        with open(path, 'w') as json_file:
+            json.dump({'fim_mode': report['latency_by_mode'],
+                       'summary': {key: report[key] for key in ('operations', 'matched', 'coalesced', 'missing',
+                                                                 'unexpected')}},
+                      json_file, indent=4)
+
+
+def start_latency_recording(file_path=LOG_FILE_PATH):
+    """Start stamping the filesystem changes done by the FIM helpers.
+
+    Args:
+        file_path (str, optional): Log file path. Default `LOG_FILE_PATH`
+
+    Returns:
+        FIMLatencyRecorder: Started recorder.
+    """
+    global _recorder
+    _recorder = FIMLatencyRecorder(file_path).start()
+    return _recorder
+
+
+def stop_latency_recording(report_path=None, timeout=DEFAULT_DRAIN_TIMEOUT):
+    """Stop the recording started by `start_latency_recording`.
+
+    Args:
+        report_path (str, optional): Path of the JSON report to write. Default `None`
+        timeout (float, optional): Maximum seconds to wait for the pending events. Default `DEFAULT_DRAIN_TIMEOUT`
+
+    Returns:
+        dict: Latency report, see `FIMChurnReconciler.report`. None if the recording was not started.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is None:
+        return None
+
+    recorder.stop(timeout)
+    if report_path is not None:
+        recorder.export_json(report_path)
+        logger.info(f"FIM latency report written to {report_path}")
+
+    return recorder.report()
+
+
+def record_change(operation, path, start_time=None):
+    """Stamp a filesystem change if the latency recording is started.
+
+    The change should be stamped with the time taken before the file is changed, the events read before the change
+    is stamped are matched with it anyway.
+
+    Args:
+        operation (str): `create`, `modify` or `delete`.
+        path (str): Path of the changed file.
+        start_time (float, optional): Time (`time.time` clock) before the first change to the file. Default `None`
+            (now)
+    """
+    if _recorder is not None:
+        _recorder.record(operation, path, start_time)
+
+
+__all__ = ['FIMLatencyRecorder', 'start_latency_recording', 'stop_latency_recording', 'record_change', 'CREATE',
+           'MODIFY', 'DELETE']
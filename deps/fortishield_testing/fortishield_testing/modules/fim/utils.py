@@ -16,7 +16,7 @@ from fortishield_testing.tools.file import create_file, modify_file_content, del
 from fortishield_testing.tools.monitoring import FileMonitor, generate_monitoring_callback
 from fortishield_testing.tools.time import TimeMachine
 from fortishield_testing.modules import fim
-from fortishield_testing.modules.fim import event_monitor as ev
+from fortishield_testing.modules.fim import event_monitor as ev, latency
 from fortishield_testing.modules.fim.classes import CustomValidator, EventChecker, RegistryEventChecker
 
 
@@ -738,7 +738,9 @@ def regular_file_cud(folder, log_monitor, file_list=['testfile0'], min_timeout=1
 
     # Create text files
     for name, content in file_list.items():
+        start_time = time.time()
         create_file(REGULAR, folder, name, content=content)
+        latency.record_change(latency.CREATE, os.path.join(folder, name), start_time)
 
     event_checker.fetch_and_check('added', min_timeout=min_timeout, triggers_event=triggers_event,
                                   event_mode=event_mode, escaped=escaped)
@@ -748,7 +750,9 @@ def regular_file_cud(folder, log_monitor, file_list=['testfile0'], min_timeout=1
     # Modify previous text files
     if triggers_modified_event:
         for name, content in file_list.items():
+            start_time = time.time()
             modify_file_content(folder, name, is_binary=isinstance(content, bytes))
+            latency.record_change(latency.MODIFY, os.path.join(folder, name), start_time)
     
         event_checker = EventChecker(log_monitor=log_monitor, folder=folder, file_list=file_list, options=options,
                                      custom_validator=custom_validator, encoding=encoding,
@@ -760,7 +764,9 @@ def regular_file_cud(folder, log_monitor, file_list=['testfile0'], min_timeout=1
 
     # Delete previous text files
     for name in file_list:
+        start_time = time.time()
         delete_file(os.path.join(folder, name))
+        latency.record_change(latency.DELETE, os.path.join(folder, name), start_time)
 
     event_checker = EventChecker(log_monitor=log_monitor, folder=folder, file_list=file_list, options=options,
                                  custom_validator=custom_validator, encoding=encoding,
@@ -1,13 +1,15 @@
 import sys
 
 from fortishield_testing.tools import CLIENT_KEYS_PATH
+from fortishield_testing.tools.client_keys import ClientKeysStore
 
 
 def main():
     """Add fake agents to client.keys. To use the script, pass two arguments indicating the first agent ID and the last
     agent ID from the range of agents to be added.
 
-    The agents added will have ID={agent_id}, name=new_agent_{agent_id}, address=any; and password={agent_id}.
+    The agents added will have ID={agent_id}, name=new_agent_{agent_id}, address=any; and password={agent_id}. The
+    agents that already exist are overwritten, and the file is written once.
 
     This script must be used in the Fortishield master node.
     """
@@ -20,10 +22,8 @@ def main():
 
     agents_list = [str(agent_id).zfill(3) for agent_id in range(first_id, last_id + 1)]
 
-    with open(file=CLIENT_KEYS_PATH, mode='a') as f:
-        for agent_id in agents_list:
-            f.write(f"{agent_id} new_agent_{agent_id} any {agent_id}\n")
-            f.flush()  # Avoid bytes staying in the buffer until the loop has finished
+    with ClientKeysStore(CLIENT_KEYS_PATH) as client_keys:
+        client_keys.add_many((agent_id, f"new_agent_{agent_id}", 'any', agent_id) for agent_id in agents_list)
     exit(0)
 
 
@@ -0,0 +1,104 @@
+# Copyright (C) 2015-2023, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+import argparse
+import json
+import os
+from copy import deepcopy
+from time import perf_counter
+
+from jsonschema import validate
+
+from fortishield_testing import FORTISHIELD_TESTING_DATA_PATH
+from fortishield_testing.tools.schema_validator import SchemaValidator, get_validator, validate_events
+
+SCHEMA_FILE = 'syscheck_event.json'
+SAMPLE_EVENT = {
+    'type': 'event',
+    'data': {
+        'path': '/testdir1/file', 'mode': 'scheduled', 'type': 'added', 'timestamp': 1570473876,
+        'attributes': {
+            'type': 'file', 'size': 10, 'perm': 'rw-r--r--', 'uid': '0', 'gid': '0', 'user_name': 'root',
+            'group_name': 'root', 'inode': 1, 'mtime': 1, 'hash_md5': 'd41d8cd98f00b204e9800998ecf8427e',
+            'hash_sha1': 'da39a3ee5e6b4b0d3255bfef95601890afd80709',
+            'hash_sha256': 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+            'checksum': 'da39a3ee5e6b4b0d3255bfef95601890afd80709'
+        }
+    }
+}
+
+
+def generate_events(events_number):
+    """Generate valid FIM events of different files.
+
+    Args:
+        events_number (int): Number of events.
+
+    Returns:
+        list: FIM events.
+    """
+    events = []
+    for index in range(events_number):
+        event = deepcopy(SAMPLE_EVENT)
+        event['data']['path'] = f"/testdir1/file_{index}"
+        events.append(event)
+
+    return events
+
+
+def validate_per_event(events):
+    """Validate every event as it was done before the validators were cached: loading the schema and building its
+    validator for each event.
+
+    Args:
+        events (list): Events to validate.
+    """
+    for event in events:
+        with open(os.path.join(FORTISHIELD_TESTING_DATA_PATH, SCHEMA_FILE), 'r') as f:
+            schema = json.load(f)
+        validate(schema=schema, instance=event)
+
+
+def measure(function, *args):
+    """Get the seconds spent by a function call."""
+    start = perf_counter()
+    function(*args)
+    return perf_counter() - start
+
+
+def get_script_parameters():
+    """Process the script parameters
+
+    Returns:
+        ArgumentParser: Parameters and their values
+    """
+    arg_parser = argparse.ArgumentParser(description='Compare the validation time of FIM events with a new jsonschema '
+                                                     'validator per event and with the cached validators')
+    arg_parser.add_argument('-n', '--events', type=int, default=2000, help='Number of events to validate')
+
+    return arg_parser.parse_args()
+
+
+def main():
+    arguments = get_script_parameters()
+    events = generate_events(arguments.events)
+
+    cached_validator = get_validator(SCHEMA_FILE)
+    # Build the cached validator before measuring, as it is only built once per session
+    cached_validator.validate(events[0])
+    prebuilt_validator = SchemaValidator(cached_validator.schema, compile=False)
+
+    results = {
+        'per-event validate': measure(validate_per_event, events),
+        'prebuilt validator': measure(prebuilt_validator.validate_events, events),
+        'cached validate_events': measure(validate_events, events, SCHEMA_FILE)
+    }
+
+    print(f"Validated {arguments.events} events of {SCHEMA_FILE} "
+          f"(fastjsonschema {'enabled' if cached_validator.compiled else 'not installed'})")
+    for name, seconds in results.items():
+        print(f"{name:>24}: {seconds:.3f}s  x{results['per-event validate'] / seconds:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,21 @@
 import argparse
 import os
 import stat
+import sys
 import grp
 import pwd
 import json
 import logging
 import hashlib
 from datetime import datetime
+from functools import lru_cache
+from multiprocessing import Pool
 
 script_logger = logging.getLogger('check_files')
+# Bytes read at once to calculate the checksum of a file
+HASH_CHUNK_SIZE = 1024 * 1024
+# Entries whose checksums are calculated together by the worker processes
+HASH_BATCH_SIZE = 512
 _filemode_list = [
     {
         stat.S_IFLNK: "l",
@@ -93,12 +100,193 @@ def get_human_readable_bytes(bytes):
         return f"{bytes}B"
 
 
-def get_check_files_data(path='/', ignored_paths=[]):
+class IgnoredPathsTrie:
+    """Prefix tree of the ignored paths, by path components.
+
+    A path is ignored if it is one of the ignored paths or it is inside one of them.
+
+    Args:
+        ignored_paths (list): Path list to be ignored
+    """
+
+    def __init__(self, ignored_paths):
+        self.root = {}
+        for ignored_path in ignored_paths:
+            node = self.root
+            for component in self._split(ignored_path):
+                node = node.setdefault(component, {})
+            node[None] = True
+
+    @staticmethod
+    def _split(path):
+        return [component for component in os.path.normpath(path).split(os.sep) if component]
+
+    def is_ignored(self, path):
+        """Check if a path is ignored.
+
+        Args:
+            path (string): Path to check.
+
+        Returns:
+            boolean: True if the path is ignored, False otherwise.
+        """
+        node = self.root
+        if None in node:
+            return True
+        for component in self._split(path):
+            node = node.get(component)
+            if node is None:
+                return False
+            if None in node:
+                return True
+
+        return False
+
+
+def walk_check_files_paths(path, ignored_trie):
+    """Walk the tree of a path getting the stat of every file and directory, with a single call per entry.
+
+    Every directory is returned before its files, and its files before its subdirectories. The symbolic links to
+    directories are not followed nor returned, and the broken symbolic links are not returned.
+
+    Args:
+        path (string): Root path from which to obtain the information
+        ignored_trie (IgnoredPathsTrie): Ignored paths
+
+    Yields:
+        tuple: Path and stat result (following symbolic links) of every file and directory.
+    """
+    if ignored_trie.is_ignored(path):
+        return
+
+    try:
+        stat_info = os.stat(path)
+    except OSError:  # Ignore errors like "No such device or address" due to dynamic and temporary files
+        return
+
+    yield path, stat_info
+    if not stat.S_ISDIR(stat_info.st_mode):
+        return
+
+    directories = [path]
+    while directories:
+        dirpath = directories.pop()
+        subdirectories = []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if ignored_trie.is_ignored(entry.path):
+                        continue
+                    try:
+                        entry_stat = entry.stat()
+                        is_symlink = entry.is_symlink()
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(entry_stat.st_mode):
+                        if not is_symlink:
+                            subdirectories.append((entry.path, entry_stat))
+                    else:
+                        yield entry.path, entry_stat
+        except OSError:  # Ignore the directories that can not be listed
+            continue
+
+        for subdirectory, subdirectory_stat in subdirectories:
+            yield subdirectory, subdirectory_stat
+        directories.extend(reversed([subdirectory for subdirectory, _ in subdirectories]))
+
+
+def get_md5sum(item):
+    """Calculate the MD5 checksum of a file, reading it in chunks.
+
+    Args:
+        item (string): File path.
+
+    Returns:
+        string: MD5 checksum, or None if the file could not be read.
+    """
+    md5 = hashlib.md5()
+    try:
+        with open(item, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                md5.update(chunk)
+    except OSError:
+        return None
+
+    return md5.hexdigest()
+
+
+def iter_check_files_data(path='/', ignored_paths=[], processes=None, previous_data=None, incremental=False):
+    """Get the check-files information of every file and directory recursively from a specific path.
+
+    The checksums of the regular files are calculated by a pool of worker processes. If the check-files data of a
+    previous scan is given, the checksum of the files whose size in bytes and modification time in nanoseconds have
+    not changed is not calculated again. Both values are only stored, in the `size_bytes` and `last_update_ns` fields
+    of the regular files, for incremental scans.
+
+    Args:
+        path (string): Root path from which to obtain the information
+        ignored_paths (list): Path list to be ignored
+        processes (int): Number of worker processes. Default one per CPU core.
+        previous_data (dict): Check-files data of a previous scan. Default None
+        incremental (boolean): Store the raw size and modification time of the regular files, so the data can be used
+            as the previous data of a later scan. Default False
+
+    Yields:
+        tuple: Path and check-files data of every file and directory, see `get_check_files_data`.
+    """
+    script_logger.info(f"Ignoring the following paths: {ignored_paths}")
+    script_logger.info(f"Getting check-files data from {path}")
+
+    previous_data = previous_data or {}
+    entries = walk_check_files_paths(path, IgnoredPathsTrie(ignored_paths))
+    pool = Pool(processes) if processes != 1 else None
+    try:
+        while True:
+            batch = []
+            for item, stat_info in entries:
+                batch.append((item, get_stat_information(stat_info)))
+                if len(batch) == HASH_BATCH_SIZE:
+                    break
+            if not batch:
+                break
+
+            to_hash = []
+            for item, data in batch:
+                st_mode, st_size, st_mtime_ns = data.pop('st_mode'), data.pop('st_size'), data.pop('st_mtime_ns')
+                if stat.S_ISREG(st_mode):
+                    if incremental:
+                        data['size_bytes'], data['last_update_ns'] = st_size, st_mtime_ns
+                    previous = previous_data.get(item, {})
+                    if 'md5sum' in previous and previous.get('size_bytes') == st_size and \
+                            previous.get('last_update_ns') == st_mtime_ns:
+                        data['md5sum'] = previous['md5sum']
+                    else:
+                        to_hash.append(item)
+
+            checksums = dict(zip(to_hash, pool.map(get_md5sum, to_hash) if pool else map(get_md5sum, to_hash)))
+
+            for item, data in batch:
+                if item in checksums:
+                    if checksums[item] is None:  # Ignore the files that can not be read
+                        continue
+                    data['md5sum'] = checksums[item]
+                yield item, data
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def get_check_files_data(path='/', ignored_paths=[], processes=None, previous_data=None, incremental=False):
     """Get a dictionary with all check-files information recursively from a specific path
 
     Args:
         path (string): Root path from which to obtain the information
         ignored_paths (list): Path list to be ignored
+        processes (int): Number of worker processes that calculate the checksums. Default one per CPU core.
+        previous_data (dict): Check-files data of a previous scan, to reuse the checksums of the unchanged files.
+            Default None
+        incremental (boolean): Store the raw size and modification time of the regular files. Default False
 
     Returns:
         dict: Dictonary with all check files corresponding to the analized path. It has the following format:
@@ -110,45 +298,7 @@ def get_check_files_data(path='/', ignored_paths=[]):
                     "user": "root"
             }, ...
     """
-    files_items_dict = {}
-
-    script_logger.info(f"Ignoring the following paths: {ignored_paths}")
-    script_logger.info(f"Getting check-files data from {path}")
-
-    # If the given path is not a dir
-    if os.path.exists(path) and not os.path.isdir(path):
-        try:
-            files_items_dict[path] = get_data_information(path)
-        except OSError:  # Ignore errors like "No such device or address" due to dynamic and temporary files
-            pass
-
-    # If the given path is a dir, walk through the dir tree
-    for (dirpath, _, filenames) in os.walk(path, followlinks=False):
-        skip_path_checking = False
-
-        for ignore_path in ignored_paths:
-            if ignore_path == dirpath[0:len(ignore_path)]:
-                skip_path_checking = True
-
-        if not skip_path_checking:
-            # Get the dir data
-            if os.path.exists(dirpath):
-                try:
-                    files_items_dict[dirpath] = get_data_information(dirpath)
-                except OSError:  # Ignore errors like "No such device or address" due to dynamic and temporary files
-                    pass
-
-            # Get the dir content data
-            for filename in filenames:
-                file_path = os.path.join(dirpath, filename)
-
-                if file_path not in ignored_paths and os.path.exists(file_path):
-                    try:
-                        files_items_dict[file_path] = get_data_information(file_path)
-                    except OSError:  # Ignore errors like "No such device or address" due to dynamic and temporary files
-                        pass
-
-    return files_items_dict
+    return dict(iter_check_files_data(path, ignored_paths, processes, previous_data, incremental))
 
 
 def get_filemode(mode):
@@ -176,39 +326,78 @@ def get_filemode(mode):
     return ''.join(file_permission)
 
 
-def get_data_information(item):
-    """Get the check-file data from a file or directory.
+@lru_cache(maxsize=None)
+def get_user_name(uid):
+    """Get the name of a user, caching the result.
 
     Args:
-        item (string): File path or directory.
+        uid (int): User ID.
 
     Returns:
-        dict: Dictionary with checkfile data.
+        string: User name.
     """
-    stat_info = os.stat(item)
     try:
-        user = pwd.getpwuid(stat_info.st_uid)[0]
+        return pwd.getpwuid(uid)[0]
     except KeyError:
-        user = 'user has no entry in etc/passwd.'
+        return 'user has no entry in etc/passwd.'
+
+
+@lru_cache(maxsize=None)
+def get_group_name(gid):
+    """Get the name of a group, caching the result.
+
+    Args:
+        gid (int): Group ID.
+
+    Returns:
+        string: Group name.
+    """
     try:
-        group = grp.getgrgid(stat_info.st_gid)[0]
+        return grp.getgrgid(gid)[0]
     except KeyError:
-        group = 'group has no entry in /etc/group.'
+        return 'group has no entry in /etc/group.'
+
+
+def get_stat_information(stat_info):
+    """Get the check-file data that comes from the stat of a file or directory, without the checksum.
+
+    Args:
+        stat_info (os.stat_result): Stat of the file or directory.
+
+    Returns:
+        dict: Dictionary with checkfile data, and the `st_mode`, `st_size` and `st_mtime_ns` of the stat.
+    """
     mode = oct(stat.S_IMODE(stat_info.st_mode))
     mode_str = str(mode).replace('o', '')
     mode = mode_str[-3:] if len(mode_str) > 3 else mode_str
-    _type = 'directory' if os.path.isdir(item) else 'file'
-    permissions = get_filemode(stat_info.st_mode)
-    last_update = datetime.fromtimestamp(os.path.getmtime(item)).strftime('%Y-%m-%d %H:%M:%S')
-    size = get_human_readable_bytes(stat_info.st_size)
-    if _type != 'directory':
-        checksum = hashlib.md5(open(item, 'rb').read()).hexdigest()
-
-        return {'type': _type, 'user': user, 'group': group, 'mode': mode, 'permissions': permissions,
-                'last_update': last_update, 'md5sum': checksum, 'size': size}
-    else:
-        return {'type': _type, 'user': user, 'group': group, 'mode': mode, 'permissions': permissions,
-                'last_update': last_update, 'size': size}
+
+    return {'type': 'directory' if stat.S_ISDIR(stat_info.st_mode) else 'file',
+            'user': get_user_name(stat_info.st_uid), 'group': get_group_name(stat_info.st_gid), 'mode': mode,
+            'permissions': get_filemode(stat_info.st_mode),
+            'last_update': datetime.fromtimestamp(stat_info.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            'size': get_human_readable_bytes(stat_info.st_size), 'st_mode': stat_info.st_mode,
+            'st_size': stat_info.st_size, 'st_mtime_ns': stat_info.st_mtime_ns}
+
+
+def get_data_information(item):
+    """Get the check-file data from a file or directory.
+
+    Args:
+        item (string): File path or directory.
+
+    Returns:
+        dict: Dictionary with checkfile data.
+    """
+    data = get_stat_information(os.stat(item))
+    for field in ('st_mode', 'st_size', 'st_mtime_ns'):
+        data.pop(field)
+    if data['type'] != 'directory':
+        checksum = get_md5sum(item)
+        if checksum is None:
+            raise OSError(f"Could not read {item}")
+        data['md5sum'] = checksum
+
+    return data
 
 
 def write_data_to_file(data, output_file_path):
@@ -229,6 +418,22 @@ def write_data_to_file(data, output_file_path):
     script_logger.info(f"The check-files data has been written in {output_file_path} file")
 
 
+def write_check_files_data(entries, output_file):
+    """Write the check-files data of every path to a file as they are obtained, in JSON format.
+
+    Args:
+        entries (iterable): Path and check-files data of every file and directory.
+        output_file (file): File object to write the data to.
+    """
+    output_file.write('{')
+    empty = True
+    for item, data in entries:
+        content = json.dumps(data, indent=4).replace('\n', '\n    ')
+        output_file.write(f"{'' if empty else ','}\n    {json.dumps(item)}: {content}")
+        empty = False
+    output_file.write('}' if empty else '\n}')
+
+
 def get_script_parameters():
     """Process the script parameters
 
@@ -240,6 +445,15 @@ def get_script_parameters():
                             help="Path base to inspect files recursively")
     arg_parser.add_argument("-i", "--ignore", type=str, nargs='+', help='List of paths to ignore')
     arg_parser.add_argument("-o", "--output-file", type=str, help='path to store the results')
+    arg_parser.add_argument("-w", "--processes", type=int, default=None,
+                            help='Number of processes that calculate the checksums. Default one per CPU core')
+    arg_parser.add_argument("-b", "--previous-file", type=str, default=None,
+                            help='Check-files data of a previous scan. The checksum of the files with the same size '
+                                 'and modification time is not calculated again. It must come from an incremental '
+                                 'scan')
+    arg_parser.add_argument("-n", "--incremental", action='store_true',
+                            help='Store the size in bytes and the modification time in nanoseconds of the regular '
+                                 'files, so the results can be used as the previous file of a later scan')
     arg_parser.add_argument('-d', '--debug', action='store_true', help='Run in debug mode.')
 
     return arg_parser.parse_args()
@@ -249,16 +463,33 @@ def main():
     arguments = get_script_parameters()
     set_parameters(arguments)
 
-    ignored_paths = arguments.ignore if arguments.ignore else []
+    ignored_paths = list(arguments.ignore) if arguments.ignore else []
+    if arguments.output_file:
+        # The output file is written while the path is walked, so it must not be part of the data
+        relative_output_path = os.path.relpath(os.path.abspath(arguments.output_file), os.path.abspath(arguments.path))
+        if relative_output_path.split(os.sep)[0] != os.pardir:
+            ignored_paths.append(os.path.join(arguments.path, relative_output_path))
+    previous_data = None
+    if arguments.previous_file:
+        with open(arguments.previous_file) as previous_file:
+            previous_data = json.load(previous_file)
 
     # Get the check-files info
-    check_files_data = get_check_files_data(arguments.path, ignored_paths)
+    check_files_data = iter_check_files_data(arguments.path, ignored_paths, arguments.processes, previous_data,
+                                             arguments.incremental)
 
-    # Save the check-files data to a file if specified, otherwise will be logged in the stdout
+    # Save the check-files data to a file if specified, otherwise will be written in the stdout
     if arguments.output_file:
-        write_data_to_file(check_files_data, arguments.output_file)
+        output_dir = os.path.split(arguments.output_file)[0]
+        if output_dir and not os.path.exists(output_dir):
+            os.mkdir(output_dir)
+
+        with open(arguments.output_file, 'w') as output_file:
+            write_check_files_data(check_files_data, output_file)
+
+        script_logger.info(f"The check-files data has been written in {arguments.output_file} file")
     else:
-        script_logger.info(json.dumps(check_files_data, indent=4))
+        write_check_files_data(check_files_data, sys.stdout)
 
 
 if __name__ == '__main__':
@@ -15,12 +15,16 @@ def get_script_arguments():
 
     parser.add_argument('-r', '--report', dest='report_path', default='report.json',
                         help='Report path.', action='store')
+
+    parser.add_argument('--processes', dest='processes', default=None, type=int,
+                        help='Number of processes used to scan the log files. Default one per CPU core.',
+                        action='store')
     return parser.parse_args()
 
 
 def main():
     options = get_script_arguments()
-    parser = ReportGenerator(options.artifact_path)
+    parser = ReportGenerator(options.artifact_path, options.processes)
 
     json_report = parser.make_report()
 
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import logging
 import os
 import fortishield_testing.tools.agent_simulator as ag
@@ -7,6 +8,7 @@ from multiprocessing import Process
 from time import sleep
 from fortishield_testing.modules.syscollector import SYSCOLLECTOR_DELTA_EVENT_TYPES
 from fortishield_testing import TCP
+from fortishield_testing.tools.eps_scheduler import EPSScheduler, create_load_profile
 
 
 logging.basicConfig(level=logging.INFO)
@@ -57,10 +59,30 @@ def process_script_parameters(args):
         if any(event_type not in SYSCOLLECTOR_DELTA_EVENT_TYPES for event_type in args.syscollector_event_types):
             raise ValueError(f'Invalid syscollector event type. Valid values are: {SYSCOLLECTOR_DELTA_EVENT_TYPES}')
 
+    if args.eps_profile is not None:
+        # Raise an error for invalid profiles before starting the agents
+        create_load_profile(1, args.eps_profile)
+
+    # Fractional EPS and the agent EPS limit can only be paced by the rate scheduler
+    if args.eps_profile is None and (args.agent_eps is not None or
+                                     any(isinstance(parse_eps(eps), float) for eps in args.modules_eps)):
+        args.eps_profile = 'constant'
+
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
 
+def parse_eps(eps):
+    """Parse an EPS value, that can be fractional.
+    Args:
+        eps (str): EPS value.
+    Returns:
+        int or float: EPS, as int if it has no decimals.
+    """
+    eps = float(eps)
+    return int(eps) if eps.is_integer() else eps
+
+
 def set_agent_modules_and_eps(agent, active_modules, modules_eps):
     """Set active modules and EPS to an agent.
     Args:
@@ -87,7 +109,7 @@ def set_agent_modules_and_eps(agent, active_modules, modules_eps):
             if module in ['keepalive', 'receive_messages']:
                 continue
 
-            agent.modules[module]['eps'] = int(modules_eps[index])
+            agent.modules[module]['eps'] = parse_eps(modules_eps[index])
         else:
             agent.modules[module]['status'] = 'disabled'
             agent.modules[module]['eps'] = 0
@@ -108,7 +130,8 @@ def create_agent(args, custom_labels):
         'syscollector_frequency': args.syscollector_frequency,
         'syscollector_event_types': args.syscollector_event_types,
         'syscollector_legacy_messages': args.syscollector_legacy_messages,
-        'syscollector_packages_vuln_content': args.syscollector_packages_list_file
+        'syscollector_packages_vuln_content': args.syscollector_packages_list_file,
+        'event_pool_size': args.event_pool_size
     }
 
     agent = ag.Agent(**agent_args)
@@ -154,13 +177,36 @@ def create_agents(args):
     return agents
 
 
-def create_injectors(agents, manager_address, protocol, limit_msg=None):
+def create_scheduler(agents, eps_profile=None, agent_eps=None):
+    """Create the rate scheduler of a group of agents.
+    The scheduler is shared by the agents run in the same process. Its buckets are per agent module and per agent, and
+    every agent runs in a single process, so the targets are the same whatever the number of processes.
+    Args:
+        agents (list): Agents paced by the scheduler.
+        eps_profile (str): Load profile of the rate scheduler. Default None (no scheduler, one second bursts).
+        agent_eps (float): Maximum EPS of every agent, all its modules together. Default None (no limit).
+    Returns:
+        EPSScheduler: Rate scheduler, or None if there is no load profile.
+    """
+    if eps_profile is None:
+        return None
+
+    scheduler = EPSScheduler(eps_profile)
+    if agent_eps is not None:
+        for agent in agents:
+            scheduler.set_agent_eps(agent.id, agent_eps)
+
+    return scheduler
+
+
+def create_injectors(agents, manager_address, protocol, limit_msg=None, scheduler=None):
     """Create injectos objects from list of agents and connection parameters.
     Args:
         agents (list): List of agents to create the injectors (1 injector/agent).
         manager_address (str): Manager IP address to connect the agents.
         protocol (str): TCP or UDP protocol to connect the agents to the manager.
         limit_msg (int): Maximum amount of message to be sent.
+        scheduler (EPSScheduler): Rate scheduler to pace the events. Default None (one second bursts).
     Returns:
         list: List of injector objects.
     """
@@ -170,17 +216,18 @@ def create_injectors(agents, manager_address, protocol, limit_msg=None):
 
     for agent in agents:
         sender = ag.Sender(manager_address, protocol=protocol)
-        injectors.append(ag.Injector(sender, agent, limit_msg))
+        injectors.append(ag.Injector(sender, agent, limit_msg, scheduler))
 
     return injectors
 
 
-def start(injector, time_alive, limit_msg_enable=None):
+def start(injector, time_alive, limit_msg_enable=None, eps_report_dir=None):
     """Start the injector process for a specified time.
     Args:
         injector (Injector): Injector object.
         time_alive (int): Period of time in seconds during the injector will be running.
         limit_msg_enable (int): Amount of message to be sent.
+        eps_report_dir (str): Directory to write the achieved EPS report into.
     """
     try:
         injector.run()
@@ -190,6 +237,8 @@ def start(injector, time_alive, limit_msg_enable=None):
             injector.wait()
     finally:
         stop(injector)
+        export_eps_report(injector.scheduler, eps_report_dir)
+        report_encode_throughput([injector.agent])
 
 
 def stop(injector):
@@ -200,17 +249,46 @@ def stop(injector):
     injector.stop_receive()
 
 
-def run(injectors, time_alive, limit_msg_enable=None):
+def export_eps_report(scheduler, eps_report_dir):
+    """Write the target and achieved EPS of the agents run by the current process.
+    Args:
+        scheduler (EPSScheduler): Rate scheduler used by the agents. Nothing is written if it is None.
+        eps_report_dir (str): Directory to write the report into. Nothing is written if it is None.
+    """
+    if scheduler is None or eps_report_dir is None:
+        return
+
+    os.makedirs(eps_report_dir, exist_ok=True)
+    scheduler.export_csv(os.path.join(eps_report_dir, f'eps_report_{os.getpid()}.csv'))
+    for (agent_id, module), accuracy in scheduler.accuracy().items():
+        logger.info(f"Agent {agent_id} - {module}: sent {accuracy:.1%} of the target events")
+
+
+def report_encode_throughput(agents):
+    """Log the events encoded by the agents run by the current process and the encode throughput.
+    Args:
+        agents (list): List of agents.
+    """
+    encoders = [agent.event_encoder for agent in agents]
+    encoded_events = sum(encoder.encoded_events for encoder in encoders)
+    encode_time = sum(encoder.encode_time for encoder in encoders)
+    if encoded_events:
+        logger.info(f"Encoded {encoded_events} events in {encode_time:.3f}s: "
+                    f"{encoded_events / max(encode_time, 1e-9):.0f} events/s")
+
+
+def run(injectors, time_alive, limit_msg_enable=None, eps_report_dir=None):
     """Run each injector in a separated process.
     Args:
         injectors (list): List of injector objects.
         time_alive (int): Period of time in seconds during the injector will be running.
         limit_msg_enable (int): Amount of message to be sent.
+        eps_report_dir (str): Directory to write the achieved EPS reports into.
     """
     processes = []
 
     for injector in injectors:
-        processes.append(Process(target=start, args=(injector, time_alive, limit_msg_enable)))
+        processes.append(Process(target=start, args=(injector, time_alive, limit_msg_enable, eps_report_dir)))
 
     for agent_process in processes:
         agent_process.start()
@@ -219,6 +297,57 @@ def run(injectors, time_alive, limit_msg_enable=None):
         agent_process.join()
 
 
+def start_async(agents, manager_address, protocol, time_alive, limit_msg=None, eps_profile=None,
+                eps_report_dir=None, agent_eps=None):
+    """Run a group of agents in a single asyncio event loop.
+    Args:
+        agents (list): List of agents to run.
+        manager_address (str): Manager IP address to connect the agents.
+        protocol (str): TCP or UDP protocol to connect the agents to the manager.
+        time_alive (int): Period of time in seconds during the agents will be running.
+        limit_msg (int): Maximum amount of message to be sent.
+        eps_profile (str): Load profile of the rate scheduler. Default None (one second bursts).
+        eps_report_dir (str): Directory to write the achieved EPS report into.
+        agent_eps (float): Maximum EPS of every agent, all its modules together. Default None (no limit).
+    """
+    scheduler = create_scheduler(agents, eps_profile, agent_eps)
+    injectors = [ag.AsyncInjector(ag.AsyncSender(manager_address, protocol=protocol), agent, limit_msg, scheduler)
+                 for agent in agents]
+    try:
+        asyncio.run(ag.run_async_injectors(injectors, time_alive if limit_msg is None else None))
+    finally:
+        export_eps_report(scheduler, eps_report_dir)
+        report_encode_throughput(agents)
+
+
+def run_async(agents, manager_address, protocol, time_alive, limit_msg=None, workers=None, eps_profile=None,
+              eps_report_dir=None, agent_eps=None):
+    """Run the agents split among `workers` processes, each one running an asyncio event loop.
+    Args:
+        agents (list): List of agents to run.
+        manager_address (str): Manager IP address to connect the agents.
+        protocol (str): TCP or UDP protocol to connect the agents to the manager.
+        time_alive (int): Period of time in seconds during the agents will be running.
+        limit_msg (int): Maximum amount of message to be sent.
+        workers (int): Number of processes. Default one per CPU core.
+        eps_profile (str): Load profile of the rate scheduler. Default None (one second bursts).
+        eps_report_dir (str): Directory to write the achieved EPS reports into.
+        agent_eps (float): Maximum EPS of every agent, all its modules together. Default None (no limit).
+    """
+    workers = min(workers or os.cpu_count() or 1, len(agents))
+    logger.info(f"Starting {len(agents)} agents in {workers} asyncio workers.")
+
+    processes = [Process(target=start_async, args=(agents[worker::workers], manager_address, protocol, time_alive,
+                                                   limit_msg, eps_profile, eps_report_dir, agent_eps))
+                 for worker in range(workers)]
+
+    for worker_process in processes:
+        worker_process.start()
+
+    for worker_process in processes:
+        worker_process.join()
+
+
 def calculate_eps_distribution(data, max_eps_per_agent):
     """Calculate the distribution of agents and EPS according to the input ratio.
     Args:
@@ -404,6 +533,37 @@ def main():
                             One package per line. Default is None.''', required=False, default=None,
                             dest='syscollector_packages_list_file')
 
+    arg_parser.add_argument('--engine', metavar='<engine>', type=str, required=False, default='process',
+                            choices=['process', 'asyncio'], dest='engine',
+                            help='''Simulation engine. "process" runs each agent in its own process with a thread
+                            per module. "asyncio" runs many agents over non-blocking sockets in one event loop per
+                            worker. Default is "process".''')
+
+    arg_parser.add_argument('--workers', metavar='<workers>', type=int, required=False, default=None,
+                            help='Number of asyncio engine worker processes. Default is one per CPU core.',
+                            dest='workers')
+
+    arg_parser.add_argument('--eps-profile', metavar='<eps_profile>', type=str, required=False, default=None,
+                            help='''Pace the module events with a token bucket rate scheduler following this
+                            load profile: "constant", "ramp:<ramp_seconds>", "step:<step_seconds>:<steps>" or
+                            "sine:<period_seconds>[:<amplitude>]". Required for fractional EPS values. Default is
+                            None (events are sent in one second bursts).''', dest='eps_profile')
+
+    arg_parser.add_argument('--eps-report-dir', metavar='<eps_report_dir>', type=str, required=False, default=None,
+                            help='Directory to write CSV reports with the target and achieved EPS per second. '
+                                 'Requires --eps-profile.', dest='eps_report_dir')
+
+    arg_parser.add_argument('--agent-eps', metavar='<agent_eps>', type=float, required=False, default=None,
+                            help='''Maximum EPS of every agent, all its modules together. The events are paced by the
+                            rate scheduler, with a constant profile if --eps-profile is not set. Default is None (no
+                            limit).''', dest='agent_eps')
+
+    arg_parser.add_argument('--event-pool-size', metavar='<event_pool_size>', type=int, required=False,
+                            default=None, help='''Pre-render this number of encrypted events for each agent module
+                            and send them in a loop, so the simulator CPU is not spent encoding every event. Default
+                            is None (every event is generated and encoded when it is sent).''',
+                            dest='event_pool_size')
+
     args = arg_parser.parse_args()
 
     process_script_parameters(args)
@@ -415,9 +575,14 @@ def main():
     # Waiting time to prevent CPU overload when registering many agents (registration + event generation).
     sleep(args.waiting_connection_time)
 
-    injectors = create_injectors(agents, args.manager_address, args.agent_protocol, args.limit_msg)
+    if args.engine == 'asyncio':
+        run_async(agents, args.manager_address, args.agent_protocol, args.simulation_time, args.limit_msg,
+                  args.workers, args.eps_profile, args.eps_report_dir, args.agent_eps)
+    else:
+        scheduler = create_scheduler(agents, args.eps_profile, args.agent_eps)
+        injectors = create_injectors(agents, args.manager_address, args.agent_protocol, args.limit_msg, scheduler)
 
-    run(injectors, args.simulation_time, args.limit_msg)
+        run(injectors, args.simulation_time, args.limit_msg, args.eps_report_dir)
 
 
 if __name__ == "__main__":
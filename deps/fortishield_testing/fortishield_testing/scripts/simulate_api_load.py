@@ -1,4 +1,5 @@
 import argparse
+import os
 from time import sleep
 
 import yaml
@@ -23,6 +24,12 @@ def get_arguments():
                         help='Path to the Kibana request template')
     parser.add_argument('-et', '--extraload-template', dest='extraload_template', action='store', required=True,
                         type=str, help='Path to the ExtraLoad request template')
+    parser.add_argument('-w', '--workers', dest='workers', action='store', default=1, type=int,
+                        help='Number of threads sending the requests of every simulator')
+    parser.add_argument('-r', '--rps', dest='rps', action='store', default=None, type=float,
+                        help='Target ExtraLoad requests per second, instead of the API requests percentage')
+    parser.add_argument('-s', '--stats-path', dest='stats_path', action='store', default=None, type=str,
+                        help='Directory where the requests and latency percentiles CSV files are written')
 
     return parser.parse_args()
 
@@ -50,9 +57,10 @@ def main():
         try:
             request_percentage = configuration['extra_load']['api_requests_percentage']
             extra_load_thread = APISimulator(HOST, PORT, request_template=options.extraload_template,
-                                             request_percentage=request_percentage, external_logger=extra_logger)
+                                             request_percentage=request_percentage, external_logger=extra_logger,
+                                             workers=options.workers, rps=options.rps)
             extra_load_thread.start()
-            thread_list.append(extra_load_thread)
+            thread_list.append(('extra_load', extra_load_thread))
         except Exception as extra_exception:
             extra_logger.error(f'Unhandled exception: {extra_exception}')
 
@@ -61,15 +69,21 @@ def main():
                                      tag='Kibana').get_logger()
         try:
             kibana_thread = APISimulator(HOST, PORT, request_template=options.kibana_template,
-                                         frequency=options.frequency, external_logger=kibana_logger)
+                                         frequency=options.frequency, external_logger=kibana_logger,
+                                         workers=options.workers)
             kibana_thread.start()
-            thread_list.append(kibana_thread)
+            thread_list.append(('kibana', kibana_thread))
         except Exception as kibana_exception:
             kibana_logger.error(f'Unhandled exception: {kibana_exception}')
 
     sleep(options.time)
-    for thread in thread_list:
+    for name, thread in thread_list:
         thread.shutdown()
+        if options.stats_path:
+            os.makedirs(options.stats_path, exist_ok=True)
+            thread.stats.export_csv(os.path.join(options.stats_path, f'api_{name}_requests.csv'))
+            thread.stats.export_summary_csv(os.path.join(options.stats_path, f'api_{name}_summary.csv'))
+            main_logger.info(f'{name} statistics written to {options.stats_path}')
 
 
 if __name__ == '__main__':
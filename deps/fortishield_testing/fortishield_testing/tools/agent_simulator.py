@@ -11,6 +11,7 @@
 # Python 3.7 or greater
 # Dependencies: pip3 install pycryptodome
 
+import asyncio
 import hashlib
 import json
 import logging
@@ -21,13 +22,17 @@ import threading
 import zlib
 import re
 from datetime import date
+from functools import partial
 from itertools import cycle
 from random import randint, sample, choice, getrandbits
 from stat import S_IFLNK, S_IFREG, S_IRWXU, S_IRWXG, S_IRWXO
 from string import ascii_letters, digits
 from struct import pack
 from sys import getsizeof
-from time import mktime, localtime, sleep, time
+from time import mktime, localtime, perf_counter, sleep, time
+
+from Crypto.Cipher import AES, Blowfish
+from Crypto.Util.Padding import pad
 
 import fortishield_testing.data.syscollector as syscollector
 import fortishield_testing.data.winevt as winevt
@@ -45,6 +50,96 @@ os_list = ["debian7", "debian8", "debian9", "debian10", "ubuntu12.04",
 agent_count = 1
 
 
+class EventEncoder:
+    """Encoder of the secure messages sent by an agent, with the agent cipher state built only once.
+
+    The result is the same as composing, compressing, padding, encrypting and adding the headers of each message
+    through the `Agent` static methods, but the key, the headers and the cipher factory are computed beforehand and the
+    messages can be encoded in batches.
+
+    Args:
+        agent_id (str): Agent ID.
+        encryption_key (bytes): Agent encryption key.
+        cypher (str, optional): Cypher method. It can be [aes, blowfish]. Default aes.
+
+    Attributes:
+        encoded_events (int): Number of events encoded.
+        encode_time (float): Seconds spent encoding events.
+    """
+    AES_IV = b'FEDCBA0987654321'
+    BLOWFISH_IV = b'\xfe\xdc\xba\x98\x76\x54\x32\x10'
+    # Random number, global counter and local counter of the composed events
+    EVENT_PREFIX = b'55555' + b'1234567891' + b':' + b'5555' + b':'
+
+    def __init__(self, agent_id, encryption_key, cypher='aes'):
+        self.agent_id = agent_id
+        self.encryption_key = encryption_key
+        self.cypher = cypher
+        self.encoded_events = 0
+        self.encode_time = 0.0
+
+        # CBC cipher objects can not be reused once they have encrypted a message, so only the factory is kept
+        if cypher == 'aes':
+            self._new_cipher = partial(AES.new, encryption_key[:32], AES.MODE_CBC, self.AES_IV)
+            self._block_size = 16
+            self.header = f"!{agent_id}!#AES:".encode()
+        elif cypher == 'blowfish':
+            self._new_cipher = partial(Blowfish.new, encryption_key, Blowfish.MODE_CBC, self.BLOWFISH_IV)
+            self._block_size = None
+            self.header = f"!{agent_id}!:".encode()
+        else:
+            raise ValueError(f"Invalid cypher '{cypher}'. Valid ones are aes and blowfish")
+
+    def encode_batch(self, messages):
+        """Build the events of several raw string messages.
+        Args:
+            messages (list): Raw messages.
+        Returns:
+            list: Built events (compressed, padded, encrypted and with headers).
+        """
+        start = perf_counter()
+        md5 = hashlib.md5
+        prefix = self.EVENT_PREFIX
+
+        composed_events = []
+        for message in messages:
+            msg = prefix + message.encode()
+            composed_events.append(md5(msg).hexdigest().encode() + msg)
+
+        compress = zlib.compress
+        compressed_events = [compress(event) for event in composed_events]
+
+        new_cipher = self._new_cipher
+        block_size = self._block_size
+        header = self.header
+        events = []
+        for compressed_event in compressed_events:
+            padded_event = b'!' * (8 - len(compressed_event) % 8) + compressed_event
+            if block_size is not None:
+                padded_event = pad(padded_event, block_size)
+            events.append(header + new_cipher().encrypt(padded_event))
+
+        self.encode_time += perf_counter() - start
+        self.encoded_events += len(events)
+        return events
+
+    def encode(self, message):
+        """Build an event from a raw string message.
+        Args:
+            message (str): Raw message.
+        Returns:
+            bytes: Built event (compressed, padded, encrypted and with headers).
+        """
+        return self.encode_batch([message])[0]
+
+    def throughput(self):
+        """Get the encoded events per second of encoding time.
+        Returns:
+            float: Encode throughput in events/s, 0 if nothing has been encoded yet.
+        """
+        return self.encoded_events / self.encode_time if self.encode_time > 0 else 0.0
+
+
 class Agent:
     """Class that allows us to simulate an agent registered in a manager.
     This simulated agent allows sending-receiving messages and commands. In order to simulate
@@ -113,6 +208,8 @@ class Agent:
         syscollector_batch_size (int): Size of the syscollector type batch events.
         fixed_message_size (int): Fixed size of the agent modules messages in KB.
         registration_address (str): Manager registration IP address.
+        event_pool_size (int): Number of events of each module pre-rendered and sent in a loop, instead of encoding
+            every event when it is sent. None to disable the event pool.
     """
     def __init__(self, manager_address, cypher="aes", os=None, rootcheck_sample=None, id=None, name=None, key=None,
                  version="v4.3.0", fim_eps=100, fim_integrity_eps=100, sca_eps=100, syscollector_eps=100, labels=None,
@@ -123,7 +220,7 @@ class Agent:
                  logcollector_msg_number=None, custom_logcollector_message='',
                  syscollector_event_types=['network', 'port', 'hotfix', 'process', 'packages', 'osinfo', 'hwinfo'],
                  syscollector_packages_vuln_content=None,
-                 syscollector_legacy_messages=False):
+                 syscollector_legacy_messages=False, event_pool_size=None):
         self.id = id
         self.name = name
         self.key = key
@@ -194,6 +291,8 @@ class Agent:
         self.fixed_message_size = fixed_message_size * 1024 if fixed_message_size is not None else None
         self.logcollector_msg_number = logcollector_msg_number
         self.custom_logcollector_message = custom_logcollector_message
+        self.event_pool_size = event_pool_size
+        self._event_encoder = None
         self.setup(disable_all_modules=disable_all_modules)
 
     def update_checksum(self, new_checksum):
@@ -392,18 +491,46 @@ class Agent:
             \\x03\\x06\\x1aN\\x86 \\xc2\\x98\\x93U\\xcc\\xf5\\xe3@%\\xabS!\\xd3\\x9d!\\xea\\xabR\\xf9\\xd3\\x0b\\
             xcc\\xe8Y\\xe31*c\\x17g\\xa6M\\x0b&\\xc0>\\xc64\\x815\\xae\\xb8[bg\\xe3\\x83\\x0e'
         """
-        # Compose event
-        event = self.compose_event(message)
-        # Compress
-        compressed_event = zlib.compress(event)
-        # Padding
-        padded_event = self.fortishield_padding(compressed_event)
-        # Encrypt
-        encrypted_event = self.encrypt(padded_event)
-        # Add headers
-        headers_event = self.headers(self.id, encrypted_event)
-
-        return headers_event
+        return self.event_encoder.encode(message)
+
+    @property
+    def event_encoder(self):
+        """EventEncoder: Encoder with the current agent ID, key and cypher, rebuilt only when any of them changes."""
+        encoder = self._event_encoder
+        if encoder is None or (encoder.agent_id, encoder.encryption_key, encoder.cypher) != \
+                (self.id, self.encryption_key, self.cypher):
+            encoder = self._event_encoder = EventEncoder(self.id, self.encryption_key, self.cypher)
+        return encoder
+
+    def create_event_pool(self, module_event_generator, size):
+        """Pre-render the events of a module.
+        Args:
+            module_event_generator (callable): Function that generates a new event message of the module.
+            size (int): Number of events of the pool.
+        Returns:
+            list: Built events, filled up to the agent fixed message size if it is set.
+        """
+        return self.event_encoder.encode_batch([self.fill_message(module_event_generator()) for _ in range(size)])
+
+    def get_module_events(self, module):
+        """Initialize a module and get a function returning its next built event.
+
+        If the agent has an event pool size, the events are pre-rendered once and then sent in a loop. Otherwise, every
+        event is generated and encoded when it is requested.
+        Args:
+            module (str): Module name.
+        Returns:
+            tuple: Function that returns the next built event of the module and number of messages of each batch.
+        """
+        module_event_generator, batch_messages = self.get_module_generator(module)
+        if self.event_pool_size:
+            return partial(next, cycle(self.create_event_pool(module_event_generator, self.event_pool_size))), \
+                batch_messages
+
+        def next_event():
+            return self.create_event(self.fill_message(module_event_generator()))
+
+        return next_event, batch_messages
 
     def receive_message(self, sender):
         """Agent listener to receive messages and process the accepted commands.
@@ -428,30 +555,40 @@ class Agent:
                     return
             else:
                 buffer_array, client_address = sender.socket.recvfrom(65536)
-            index = buffer_array.find(b'!')
-            if index == 0:
-                index = buffer_array[1:].find(b'!')
-                buffer_array = buffer_array[index + 2:]
-            if self.cypher == "aes":
-                msg_remove_header = bytes(buffer_array[5:])
-                msg_decrypted = Cipher(msg_remove_header, self.encryption_key).decrypt_aes()
-            else:
-                msg_remove_header = bytes(buffer_array[1:])
-                msg_decrypted = Cipher(msg_remove_header, self.encryption_key).decrypt_blowfish()
             try:
-                padding = 0
-                while msg_decrypted:
-                    if msg_decrypted[padding] == 33:
-                        padding += 1
-                    else:
-                        break
-                msg_remove_padding = msg_decrypted[padding:]
-                msg_decompress = zlib.decompress(msg_remove_padding)
-                msg_decoded = msg_decompress.decode('ISO-8859-1')
-                self.process_message(sender, msg_decoded)
+                self.process_message(sender, self.decode_message(buffer_array))
             except zlib.error:
                 logging.error("Corrupted message from the manager. Continuing.")
 
+    def decode_message(self, buffer_array):
+        """Decrypt and decompress a message received from the manager.
+        Args:
+            buffer_array (bytes): Received message, with headers.
+        Returns:
+            str: Decoded message in ISO-8859-1 format.
+        Raises:
+            zlib.error: If the message is corrupted.
+        """
+        index = buffer_array.find(b'!')
+        if index == 0:
+            index = buffer_array[1:].find(b'!')
+            buffer_array = buffer_array[index + 2:]
+        if self.cypher == "aes":
+            msg_remove_header = bytes(buffer_array[5:])
+            msg_decrypted = Cipher(msg_remove_header, self.encryption_key).decrypt_aes()
+        else:
+            msg_remove_header = bytes(buffer_array[1:])
+            msg_decrypted = Cipher(msg_remove_header, self.encryption_key).decrypt_blowfish()
+        padding = 0
+        while msg_decrypted:
+            if msg_decrypted[padding] == 33:
+                padding += 1
+            else:
+                break
+        msg_remove_padding = msg_decrypted[padding:]
+        msg_decompress = zlib.decompress(msg_remove_padding)
+        return msg_decompress.decode('ISO-8859-1')
+
     def stop_receiver(self):
         """Stop Agent listener."""
         self.stop_receive = 1
@@ -694,6 +831,66 @@ class Agent:
         if self.winevt is None:
             self.winevt = GeneratorWinevt(self.name, self.id)
 
+    def get_module_generator(self, module):
+        """Initialize a module and get its event generator.
+        Args:
+            module (str): Module name.
+        Returns:
+            tuple: Function that generates a new event message of the module and number of messages of each batch.
+        Raises:
+            ValueError: If the module does not generate events.
+        """
+        module_info = self.modules[module]
+        eps = module_info['eps'] if 'eps' in module_info else 1
+        frequency = module_info["frequency"] if 'frequency' in module_info else 1
+        if frequency > 1:
+            batch_messages = eps * 0.5 * frequency
+        else:
+            batch_messages = eps
+
+        if module == 'hostinfo':
+            self.init_hostinfo()
+            module_event_generator = self.hostinfo.generate_event
+        elif module == 'rootcheck':
+            self.init_rootcheck()
+            module_event_generator = self.rootcheck.get_message
+            batch_messages = len(self.rootcheck.messages_list) * eps
+        elif module == 'syscollector':
+            self.init_syscollector()
+            module_event_generator = self.syscollector.generate_event
+        elif module == 'fim_integrity':
+            self.init_fim_integrity()
+            module_event_generator = self.fim_integrity.get_message
+        elif module == 'fim':
+            module_event_generator = self.fim.get_message
+        elif module == 'sca':
+            self.init_sca()
+            module_event_generator = self.sca.get_message
+        elif module == 'winevt':
+            self.init_winevt()
+            module_event_generator = self.winevt.generate_event
+        elif module == 'logcollector':
+            self.init_logcollector()
+            module_event_generator = self.logcollector.generate_event
+        else:
+            raise ValueError('Invalid module selected')
+
+        return module_event_generator, batch_messages
+
+    def fill_message(self, event_msg):
+        """Fill a module message up to the agent fixed message size, if it is set.
+        Args:
+            event_msg (str): Module message.
+        Returns:
+            str: Filled message.
+        """
+        if self.fixed_message_size is not None:
+            event_msg_size = getsizeof(event_msg)
+            dummy_message_size = self.fixed_message_size - event_msg_size
+            char_size = getsizeof(event_msg[0]) - getsizeof('')
+            event_msg += 'A' * (dummy_message_size//char_size)
+        return event_msg
+
     def get_agent_info(self, field):
         agent_info = wdb.query_wdb(f"global get-agent-info {self.id}")
 
@@ -1642,6 +1839,7 @@ class Injector:
                              agent.
         threads (list): list containing all the threads created.
         limit_msg (int): Maximum amount of message to be sent.
+        scheduler (EPSScheduler): Rate scheduler used to pace the module events instead of sending them in bursts.
     Examples:
         To create an Injector, you need to create an agent, a sender and then, create the injector using both of them.
         >>> import fortishield_testing.tools.agent_simulator as ag
@@ -1652,17 +1850,18 @@ class Injector:
         >>> injector.run()
     """
 
-    def __init__(self, sender, agent, limit=None):
+    def __init__(self, sender, agent, limit=None, scheduler=None):
         self.sender = sender
         self.agent = agent
         self.limit_msg = limit
+        self.scheduler = scheduler
         self.thread_number = 0
         self.threads = []
         for module, config in self.agent.modules.items():
             if config["status"] == "enabled":
                 self.threads.append(
                     InjectorThread(self.thread_number, f"Thread-{self.agent.id}{module}", self.sender,
-                                   self.agent, module, self.limit_msg))
+                                   self.agent, module, self.limit_msg, self.scheduler))
                 self.thread_number += 1
 
     def run(self):
@@ -1695,8 +1894,9 @@ class InjectorThread(threading.Thread):
         module (str): module used to send events (fim, syscollector, etc).
         stop_thread (int): 0 if the thread is running, 1 if it is stopped.
         limit_msg (int): Maximum amount of message to be sent.
+        scheduler (EPSScheduler): Rate scheduler used to pace the module events instead of sending them in bursts.
     """
-    def __init__(self, thread_id, name, sender, agent, module, limit_msg=None):
+    def __init__(self, thread_id, name, sender, agent, module, limit_msg=None, scheduler=None):
         super(InjectorThread, self).__init__()
         self.thread_id = thread_id
         self.name = name
@@ -1706,6 +1906,7 @@ class InjectorThread(threading.Thread):
         self.module = module
         self.stop_thread = 0
         self.limit_msg = limit_msg
+        self.scheduler = scheduler
 
     def keep_alive(self):
         """Send a keep alive message from the agent to the manager."""
@@ -1744,60 +1945,27 @@ class InjectorThread(threading.Thread):
 
         sleep(10)
         start_time = time()
-        if frequency > 1:
-            batch_messages = eps * 0.5 * frequency
-        else:
-            batch_messages = eps
-
-        if module == 'hostinfo':
-            self.agent.init_hostinfo()
-            module_event_generator = self.agent.hostinfo.generate_event
-        elif module == 'rootcheck':
-            self.agent.init_rootcheck()
-            module_event_generator = self.agent.rootcheck.get_message
-            batch_messages = len(self.agent.rootcheck.messages_list) * eps
-        elif module == 'syscollector':
-            self.agent.init_syscollector()
-            module_event_generator = self.agent.syscollector.generate_event
-        elif module == 'fim_integrity':
-            self.agent.init_fim_integrity()
-            module_event_generator = self.agent.fim_integrity.get_message
-        elif module == 'fim':
-            module_event_generator = self.agent.fim.get_message
-        elif module == 'sca':
-            self.agent.init_sca()
-            module_event_generator = self.agent.sca.get_message
-        elif module == 'winevt':
-            self.agent.init_winevt()
-            module_event_generator = self.agent.winevt.generate_event
-        elif module == 'logcollector':
-            self.agent.init_logcollector()
-            module_event_generator = self.agent.logcollector.generate_event
-        else:
-            raise ValueError('Invalid module selected')
+        next_event, batch_messages = self.agent.get_module_events(module)
+        if self.scheduler is not None:
+            self.scheduler.add_module(self.agent.id, module, eps)
 
         # Loop events
         while self.stop_thread == 0:
             sent_messages = 0
             while sent_messages < batch_messages:
-                event_msg = module_event_generator()
-                if self.agent.fixed_message_size is not None:
-                    event_msg_size = getsizeof(event_msg)
-                    dummy_message_size = self.agent.fixed_message_size - event_msg_size
-                    char_size = getsizeof(event_msg[0]) - getsizeof('')
-                    event_msg += 'A' * (dummy_message_size//char_size)
-
                 # Add message limitiation
                 if self.limit_msg:
                     if self.totalMessages >= self.limit_msg:
                         self.stop_thread = 1
                         break
 
-                event = self.agent.create_event(event_msg)
+                event = next_event()
+                if self.scheduler is not None:
+                    self.scheduler.wait(self.agent.id, module)
                 self.sender.send_event(event)
                 self.totalMessages += 1
                 sent_messages += 1
-                if self.totalMessages % eps == 0:
+                if self.scheduler is None and self.totalMessages % eps == 0:
                     sleep(1.0 - ((time() - start_time) % 1.0))
 
             if frequency > 1:
@@ -1824,6 +1992,274 @@ class InjectorThread(threading.Thread):
             self.stop_thread = 1
 
 
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    """Datagram protocol that stores the received messages in a queue."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait(data)
+
+
+class AsyncSender:
+    """Non blocking counterpart of `Sender`, used by `AsyncInjector`.
+    Events are written to the transport buffer without blocking the event loop, so coroutines sending many events
+    should await `drain` to apply the socket backpressure.
+    Attributes:
+        manager_address (str): IP of the manager.
+        manager_port (str, optional): port used by remoted in the manager.
+        protocol (str, optional): protocol used by remoted. TCP or UDP.
+        reader (asyncio.StreamReader): TCP stream reader.
+        writer (asyncio.StreamWriter): TCP stream writer.
+        transport (asyncio.DatagramTransport): UDP transport.
+    """
+    def __init__(self, manager_address, manager_port='1514', protocol=TCP):
+        self.manager_address = manager_address
+        self.manager_port = manager_port
+        self.protocol = protocol.upper()
+        self.reader = None
+        self.writer = None
+        self.transport = None
+        self._datagram_receiver = None
+        self._reconnection = None
+
+    async def connect(self):
+        if is_tcp(self.protocol):
+            self.reader, self.writer = await asyncio.open_connection(self.manager_address, int(self.manager_port))
+        if is_udp(self.protocol):
+            loop = asyncio.get_running_loop()
+            self.transport, self._datagram_receiver = await loop.create_datagram_endpoint(
+                _DatagramReceiver, remote_addr=(self.manager_address, int(self.manager_port)))
+
+    def reconnect(self, event, delay=0):
+        """Reconnect in the background, unless there is already a pending reconnection.
+        Args:
+            event (bytes): Event sent once connected, or None.
+            delay (float, optional): Seconds to wait before reconnecting.
+        Returns:
+            asyncio.Future: Pending reconnection.
+        """
+        if self._reconnection is None or self._reconnection.done():
+            self._reconnection = asyncio.ensure_future(self._reconnect(event, delay))
+        return self._reconnection
+
+    async def _reconnect(self, event, delay=0):
+        if is_tcp(self.protocol):
+            if delay:
+                await asyncio.sleep(delay)
+            self.close()
+            await self.connect()
+            if event:
+                self.send_event(event)
+
+    def send_event(self, event):
+        if is_tcp(self.protocol):
+            if not self.writer.is_closing():
+                self.writer.write(pack('<I', len(event)) + event)
+        if is_udp(self.protocol):
+            self.transport.sendto(event)
+
+    async def drain(self):
+        """Wait until the TCP write buffer is below its high watermark."""
+        if is_tcp(self.protocol):
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                logging.warning("Connection lost while sending events. Creating new socket...")
+                await asyncio.shield(self.reconnect(None, delay=5))
+
+    async def receive(self):
+        """Receive a message from the manager.
+        If the connection is closed by a reconnection, the message is read from the new connection once it is open.
+        Returns:
+            bytes: Received message, or None if the connection was closed.
+        """
+        if is_tcp(self.protocol):
+            while True:
+                reader = self.reader
+                try:
+                    data_len = fortishield_unpack(await reader.readexactly(4))
+                    return await reader.readexactly(data_len)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    if self._reconnection is None or (self._reconnection.done() and self.reader is reader):
+                        return None
+                try:
+                    await asyncio.shield(self._reconnection)
+                except OSError:
+                    return None
+                if self.reader is reader:
+                    return None
+        return await self._datagram_receiver.queue.get()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.transport is not None:
+            self.transport.close()
+
+
+class AsyncInjector:
+    """Asyncio counterpart of `Injector`.
+    Instead of one thread per module, each module of the agent runs as a coroutine, so thousands of agents can be
+    multiplexed over non blocking sockets in a single event loop. The module generators and pacing are the same used by
+    `InjectorThread`.
+    Attributes:
+        sender (AsyncSender): sender used to connect to the manager and send messages.
+        agent (Agent): agent owner of the injector and the sender.
+        limit_msg (int): Maximum amount of message to be sent by each module.
+        total_messages (dict): Number of messages sent by each module.
+        stop_thread (int): 0 if the injector is running, 1 if it is stopped.
+        scheduler (EPSScheduler): Rate scheduler used to pace the module events instead of sending them in bursts.
+    Examples:
+        >>> import asyncio
+        >>> import fortishield_testing.tools.agent_simulator as ag
+        >>> agents = ag.create_agents(100, "172.17.0.2")
+        >>> injectors = [ag.AsyncInjector(ag.AsyncSender("172.17.0.2"), agent) for agent in agents]
+        >>> asyncio.run(ag.run_async_injectors(injectors, time_alive=60))
+    """
+
+    def __init__(self, sender, agent, limit=None, scheduler=None):
+        self.sender = sender
+        self.agent = agent
+        self.limit_msg = limit
+        self.scheduler = scheduler
+        self.total_messages = {}
+        self.stop_thread = 0
+
+    async def run(self, time_alive=None):
+        """Connect the agent and run its enabled modules.
+        Args:
+            time_alive (int, optional): Period of time in seconds during the injector will be running. If None, it runs
+                until `limit_msg` messages are sent by every module, or forever if there is no limit.
+        """
+        await self.sender.connect()
+        background_tasks = []
+        module_tasks = []
+        for module, config in self.agent.modules.items():
+            if config["status"] != "enabled":
+                continue
+            logging.debug(f"Starting - {self.agent.name}({self.agent.id})({self.agent.os}) - {module}")
+            self.total_messages[module] = 0
+            if module == "keepalive":
+                background_tasks.append(asyncio.ensure_future(self.keep_alive()))
+            elif module == "receive_messages":
+                background_tasks.append(asyncio.ensure_future(self.receive_messages()))
+            else:
+                module_tasks.append(asyncio.ensure_future(self.run_module(module)))
+
+        try:
+            if time_alive is not None:
+                await asyncio.sleep(time_alive)
+            elif self.limit_msg is not None:
+                await asyncio.gather(*module_tasks)
+            else:
+                await asyncio.gather(*background_tasks, *module_tasks)
+        finally:
+            self.stop()
+            for task in background_tasks + module_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, *module_tasks, return_exceptions=True)
+            self.sender.close()
+
+    async def keep_alive(self):
+        """Send keep alive messages from the agent to the manager."""
+        await asyncio.sleep(10)
+        logging.debug("Startup - {}({})".format(self.agent.name, self.agent.id))
+        self.sender.send_event(self.agent.startup_msg)
+        self.sender.send_event(self.agent.keep_alive_event)
+        start_time = time()
+        frequency = self.agent.modules["keepalive"]["frequency"]
+        eps = 1
+        if 'eps' in self.agent.modules["keepalive"]:
+            frequency = 0
+            eps = self.agent.modules["keepalive"]["eps"]
+        while self.stop_thread == 0:
+            logging.debug(f"KeepAlive - {self.agent.name}({self.agent.id})")
+            self.sender.send_event(self.agent.keep_alive_event)
+            self.total_messages['keepalive'] += 1
+            await self.sender.drain()
+            if frequency > 0:
+                await asyncio.sleep(frequency - ((time() - start_time) % frequency))
+            else:
+                new_checksum = str(getrandbits(128))
+                self.agent.update_checksum(new_checksum)
+                if self.total_messages['keepalive'] % eps == 0:
+                    await asyncio.sleep(1.0 - ((time() - start_time) % 1.0))
+
+    async def run_module(self, module):
+        """Send module messages from the agent to the manager.
+        Args:
+            module (str): Module name
+        """
+        module_info = self.agent.modules[module]
+        eps = module_info['eps'] if 'eps' in module_info else 1
+        frequency = module_info["frequency"] if 'frequency' in module_info else 1
+
+        await asyncio.sleep(10)
+        start_time = time()
+        next_event, batch_messages = self.agent.get_module_events(module)
+        if self.scheduler is not None:
+            self.scheduler.add_module(self.agent.id, module, eps)
+
+        while self.stop_thread == 0:
+            sent_messages = 0
+            while sent_messages < batch_messages:
+                if self.limit_msg and self.total_messages[module] >= self.limit_msg:
+                    return
+
+                event = next_event()
+                if self.scheduler is not None:
+                    await self.scheduler.wait_async(self.agent.id, module)
+                self.sender.send_event(event)
+                self.total_messages[module] += 1
+                sent_messages += 1
+                if self.scheduler is not None:
+                    await self.sender.drain()
+                elif self.total_messages[module] % eps == 0:
+                    await self.sender.drain()
+                    await asyncio.sleep(1.0 - ((time() - start_time) % 1.0))
+
+            if frequency > 1:
+                await asyncio.sleep(frequency - ((time() - start_time) % frequency))
+
+    async def receive_messages(self):
+        """Receive messages from the manager and process the accepted commands."""
+        while self.agent.stop_receive == 0:
+            message = await self.sender.receive()
+            if message is None:
+                return
+            try:
+                self.agent.process_message(self.sender, self.agent.decode_message(message))
+            except zlib.error:
+                logging.error("Corrupted message from the manager. Continuing.")
+
+    def stop(self):
+        """Stop sending and receiving messages."""
+        self.stop_thread = 1
+        self.agent.stop_receiver()
+
+
+async def run_async_injectors(injectors, time_alive=None):
+    """Run several async injectors concurrently in the running event loop.
+    The failure of an injector, for example if its agent can not connect to the manager, is logged and does not stop
+    the rest of them.
+    Args:
+        injectors (list): List of `AsyncInjector` objects.
+        time_alive (int, optional): Period of time in seconds during the injectors will be running.
+    Returns:
+        list: Injectors that failed.
+    """
+    results = await asyncio.gather(*(injector.run(time_alive) for injector in injectors), return_exceptions=True)
+    failed_injectors = []
+    for injector, result in zip(injectors, results):
+        if isinstance(result, Exception):
+            logging.error(f"Injector of {injector.agent.name}({injector.agent.id}) failed: {result}")
+            failed_injectors.append(injector)
+
+    return failed_injectors
+
+
 def create_agents(agents_number, manager_address, cypher='aes', fim_eps=100, authd_password=None, agents_os=None,
                   agents_version=None, disable_all_modules=False):
     """Create a list of generic agents
@@ -1,15 +1,27 @@
+import csv
 import json
 import logging
+import random
 from base64 import b64encode
-from threading import Thread, Event
-from time import sleep, time
+from datetime import datetime
+from threading import Thread, Event, Lock, local
+from time import perf_counter, sleep, time
 
+import numpy as np
 import requests
 import urllib3
 import yaml
+from requests.adapters import HTTPAdapter
+
+from fortishield_testing.tools.eps_scheduler import EPSScheduler
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+LATENCY_PERCENTILES = [50, 95, 99]
+THROTTLED_STATUS = 429
+# Scheduler bucket used to pace the requests of the concurrent mode
+SCHEDULER_KEY = ('api', 'requests')
+
 
 class ThreadFilter(logging.Filter):
     def __init__(self, thread_name):
@@ -43,9 +55,105 @@ class CustomLogger:
         return self.logger
 
 
+class APIRequestStats:
+    """Response time and status of every request sent to the API.
+
+    The requests are identified by their method and endpoint (`GET /agents`), and the samples can be exported as a CSV
+    with the `Timestamp`, `endpoint` and `time_spent(s)` columns of the API dataset of `DataVisualizer`.
+    """
+
+    def __init__(self):
+        self.samples = []
+        self._lock = Lock()
+
+    def record(self, endpoint, status, time_spent):
+        """Record a request.
+
+        Args:
+            endpoint (str): Method and endpoint of the request.
+            status (int): Status code of the response, or None if the request failed.
+            time_spent (float): Response time in seconds.
+        """
+        with self._lock:
+            self.samples.append((datetime.now().strftime('%Y/%m/%d %H:%M:%S'), endpoint, status, time_spent))
+
+    def summary(self):
+        """Get the response time percentiles, errors and throttled requests of every endpoint.
+
+        Returns:
+            dict: Number of `requests`, `errors` (failed requests and error status codes except 429), `throttled`
+                (429 status codes), and response time percentiles, `max` and `mean` in seconds of every endpoint.
+        """
+        with self._lock:
+            samples = list(self.samples)
+
+        endpoints = {}
+        for _, endpoint, status, time_spent in samples:
+            endpoints.setdefault(endpoint, []).append((status, time_spent))
+
+        summary = {}
+        for endpoint, values in endpoints.items():
+            times = np.array([time_spent for _, time_spent in values])
+            summary[endpoint] = {
+                'requests': len(values),
+                'errors': sum(1 for status, _ in values
+                              if status is None or (status >= 400 and status != THROTTLED_STATUS)),
+                'throttled': sum(1 for status, _ in values if status == THROTTLED_STATUS),
+                **{f"p{percentile}": float(value) for percentile, value in
+                   zip(LATENCY_PERCENTILES, np.percentile(times, LATENCY_PERCENTILES))},
+                'max': float(times.max()),
+                'mean': float(times.mean())
+            }
+
+        return summary
+
+    def export_csv(self, path):
+        """Write every request to a CSV file, compatible with the `api` target of `DataVisualizer`.
+
+        Args:
+            path (str): CSV file path.
+        """
+        with self._lock:
+            samples = list(self.samples)
+
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['Timestamp', 'endpoint', 'status', 'time_spent(s)'])
+            writer.writerows((timestamp, endpoint, '' if status is None else status, round(time_spent, 6))
+                             for timestamp, endpoint, status, time_spent in samples)
+
+    def export_summary_csv(self, path):
+        """Write the summary of every endpoint to a CSV file, see `summary`.
+
+        Args:
+            path (str): CSV file path.
+        """
+        fields = ['requests', 'errors', 'throttled'] + [f"p{percentile}" for percentile in LATENCY_PERCENTILES] + \
+            ['max', 'mean']
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['endpoint'] + fields)
+            writer.writerows([endpoint] + [values[field] for field in fields]
+                             for endpoint, values in self.summary().items())
+
+
 class APISimulator:
+    """Send the requests of a template to the API.
+
+    By default the requests are sent one after another from a single thread. With several workers or a target rate,
+    the requests are sent concurrently by a pool of threads, paced by an `EPSScheduler` to the target requests per
+    second and picked randomly by the `weight` of every request in the template (`1` by default). Every thread keeps
+    its connections alive, and the response time of every request is recorded in `stats`.
+
+    Args:
+        workers (int): Number of threads sending requests. Default `1`
+        rps (float): Target requests per second of the concurrent mode. Default `None` (the `request_percentage` of
+            the API max requests per minute if it is set, or a loop of the template every `frequency` seconds)
+        profile (str): Load profile of the concurrent mode, see `create_load_profile`. Default `None` (constant)
+    """
+
     def __init__(self, host, port, protocol='https', frequency=60, user='fortishield-wui', password='fortishield-wui',
-                 external_logger=None, request_percentage=0, request_template=None):
+                 external_logger=None, request_percentage=0, request_template=None, workers=1, rps=None, profile=None):
         self.host = host
         self.port = port
         self.protocol = protocol
@@ -57,8 +165,15 @@ class APISimulator:
         self.requests = None
         self.request_percentage = request_percentage
 
+        self.workers = workers
+        self.rps = rps
+        self.profile = profile
+        self.stats = APIRequestStats()
+
         self.thread = None
         self.event = None
+        self._sessions = local()
+        self._token_lock = Lock()
 
         self.base_url = f'{self.protocol}://{self.host}:{self.port}'
         self.load_template(request_template)
@@ -108,15 +223,41 @@ class APISimulator:
         else:
             raise RuntimeError('Could not obtain an API token after 10 tries')
 
-    def make_request(self, request, result=False):
-        endpoint = f"{self.base_url}{request['endpoint']}"
-        headers = {'Authorization': f'Bearer {self.token}'}
+    def _get_session(self):
+        """Get the session of the current thread, which keeps its connections alive."""
+        if not hasattr(self._sessions, 'session'):
+            self._sessions.session = requests.Session()
+            self._sessions.session.mount(f'{self.protocol}://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return self._sessions.session
+
+    def _send(self, request, endpoint):
+        token = self.token
+        headers = {'Authorization': f'Bearer {token}'}
         if request['body']:
             headers['Content-Type'] = 'application/json'
 
+        name = f"{request['method'].upper()} {request['endpoint']}"
+        tic = perf_counter()
+        try:
+            response = self._get_session().request(request['method'], endpoint, headers=headers,
+                                                   params=request['parameters'], data=request['body'], verify=False)
+        except Exception:
+            self.stats.record(name, None, perf_counter() - tic)
+            raise
+        self.stats.record(name, response.status_code, perf_counter() - tic)
+
+        return response, token
+
+    def _refresh_token(self, expired_token):
+        with self._token_lock:
+            if self.token == expired_token:
+                self.get_token()
+
+    def make_request(self, request, result=False):
+        endpoint = f"{self.base_url}{request['endpoint']}"
+
         try:
-            response = getattr(requests, request['method'])(endpoint, headers=headers, params=request['parameters'],
-                                                            data=request['body'], verify=False)
+            response, token = self._send(request, endpoint)
             if result:
                 return response
 
@@ -128,11 +269,9 @@ class APISimulator:
 
         if response.status_code == 401:
             self.logger.warning('API token expired')
-            self.get_token()
+            self._refresh_token(token)
             try:
-                headers = {'Authorization': f'Bearer {self.token}'}
-                response = getattr(requests, request['method'])(endpoint, headers=headers, params=request['parameters'],
-                                                                data=request['body'], verify=False)
+                response, _ = self._send(request, endpoint)
                 if result:
                     return response
 
@@ -197,10 +336,41 @@ class APISimulator:
                     minute_timer = time()
                     request_per_minute = 0
 
+    def _concurrent_request_loop(self):
+        if not self.requests:
+            self.logger.info('There are no requests to do. Process aborted')
+            exit(0)
+        self.get_token()
+
+        if self.rps:
+            rps = self.rps
+        elif self.request_percentage:
+            rps = self._calculate_mrpm() / 60
+        else:
+            rps = len(self.requests) / self.frequency
+        self.logger.info(f'{self.workers} workers, target requests per second: {rps}')
+
+        scheduler = EPSScheduler(profile=self.profile)
+        scheduler.add_module(*SCHEDULER_KEY, eps=rps)
+        weights = [request.get('weight', 1) for request in self.requests]
+
+        def worker():
+            while not self.event.is_set():
+                scheduler.wait(*SCHEDULER_KEY)
+                if not self.event.is_set():
+                    self.make_request(random.choices(self.requests, weights)[0])
+
+        workers = [Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+
     def start(self):
         self.logger.info('Initializing process')
         self.event = Event()
-        self.thread = Thread(target=self._request_loop)
+        concurrent = self.workers > 1 or self.rps
+        self.thread = Thread(target=self._concurrent_request_loop if concurrent else self._request_loop)
         self.thread.start()
 
     def shutdown(self):
@@ -1,62 +1,225 @@
+import os
 import random
+import tempfile
 
 import fortishield_testing
 
+KEY_CHARACTERS = '0123456789abcdef'
+KEY_LENGTH = 64
 
-def add_client_keys_entry(agent_id, agent_name, agent_ip='any', agent_key=None):
-    """Add new entry to client keys file. If the agent_id already exists, this will be overwritten.
+
+def generate_agent_key():
+    """Generate a random agent key.
+
+    Returns:
+        str: Agent key.
+    """
+    return ''.join(random.choice(KEY_CHARACTERS) for i in range(KEY_LENGTH))
+
+
+def format_client_keys_entry(agent_id, agent_name, agent_ip, agent_key):
+    """Get the line of an agent in the client keys file.
 
     Args:
         agent_id (str): Agent identifier.
         agent_name (str): Agent name.
         agent_ip (str): Agent ip.
         agent_key (str): Agent key.
+
+    Returns:
+        str: Client keys entry, without line break.
     """
-    registered_client_key_entries_dict = {}
+    return f"{agent_id} {agent_name} {agent_ip} {agent_key}"
+
 
-    # Generate new key if necessary
-    if agent_key is None:
-        agent_key = ''.join(random.choice('0123456789abcdef') for i in range(64))
+class ClientKeysStore:
+    """Content of a client keys file, indexed by agent ID and name.
 
-    # Read client keys data
-    with open(fortishield_testing.CLIENT_KEYS_PATH, 'r') as client_keys:
-        registered_client_key_entries_str = client_keys.readlines()
+    The file is read once, the entries are added, updated and removed in memory, and the file is written once when the
+    changes are saved. The file is replaced atomically, so its readers never see it partially written.
 
-    # Process current client key entries
-    for client_key_entry in registered_client_key_entries_str:
-        _agent_id, _agent_name, _agent_ip, _agent_key = client_key_entry.split()
-        registered_client_key_entries_dict[_agent_id] = f"{_agent_id} {_agent_name} {_agent_ip} {_agent_key}"
+    Args:
+        path (str): Client keys file path. Default `None` (`CLIENT_KEYS_PATH`)
 
-    # Add the new client key entry
-    registered_client_key_entries_dict[agent_id] = f"{agent_id} {agent_name} {agent_ip} {agent_key}"
+    Attributes:
+        entries (dict): Name, ip and key of every agent ID, in file order.
 
-    # Save new client keys content
-    with open(fortishield_testing.CLIENT_KEYS_PATH, 'w') as client_keys:
-        for _, client_key_entry in registered_client_key_entries_dict.items():
-            client_keys.write(f"{client_key_entry}\n")
+    Example:
+        with ClientKeysStore() as client_keys:
+            client_keys.add_many((str(agent_id).zfill(3), f"agent_{agent_id}") for agent_id in range(1, 50001))
+    """
 
+    def __init__(self, path=None):
+        self.path = fortishield_testing.CLIENT_KEYS_PATH if path is None else path
+        self.entries = {}
+        self._names = {}
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.save()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, agent_id):
+        return agent_id in self.entries
+
+    def load(self):
+        """Read the client keys file, discarding the unsaved changes. A missing file is read as empty."""
+        self.entries = {}
+        self._names = {}
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r') as client_keys:
+            for client_key_entry in client_keys:
+                if client_key_entry.strip():
+                    agent_id, agent_name, agent_ip, agent_key = client_key_entry.split()
+                    self.add(agent_id, agent_name, agent_ip, agent_key)
+
+    def get(self, agent_id):
+        """Get the entry of an agent.
+
+        Args:
+            agent_id (str): Agent identifier.
+
+        Returns:
+            tuple: Name, ip and key of the agent, or None if it is not in the client keys.
+        """
+        return self.entries.get(agent_id)
+
+    def get_id(self, agent_name):
+        """Get the ID of an agent by its name.
+
+        Args:
+            agent_name (str): Agent name.
+
+        Returns:
+            str: Agent identifier, or None if the name is not in the client keys.
+        """
+        return self._names.get(agent_name)
+
+    def add(self, agent_id, agent_name, agent_ip='any', agent_key=None):
+        """Add an entry. If the agent_id already exists, this will be overwritten.
+
+        Args:
+            agent_id (str): Agent identifier.
+            agent_name (str): Agent name.
+            agent_ip (str): Agent ip.
+            agent_key (str): Agent key. Default `None` (a random one)
+
+        Returns:
+            str: Agent key.
+        """
+        if agent_key is None:
+            agent_key = generate_agent_key()
+
+        current_entry = self.entries.get(agent_id)
+        if current_entry is not None and self._names.get(current_entry[0]) == agent_id:
+            del self._names[current_entry[0]]
+        self.entries[agent_id] = (agent_name, agent_ip, agent_key)
+        self._names[agent_name] = agent_id
+
+        return agent_key
+
+    def add_many(self, entries):
+        """Add several entries, see `add`.
+
+        Args:
+            entries (iterable): Tuples with the agent ID, name, and optionally the ip and key of every agent.
+        """
+        for entry in entries:
+            self.add(*entry)
+
+    def update(self, agent_id, agent_name=None, agent_ip=None, agent_key=None):
+        """Update the fields of an entry, keeping its position in the file.
+
+        Args:
+            agent_id (str): Agent identifier.
+            agent_name (str): New agent name. Default `None` (not changed)
+            agent_ip (str): New agent ip. Default `None` (not changed)
+            agent_key (str): New agent key. Default `None` (not changed)
+
+        Raises:
+            KeyError: If the agent is not in the client keys.
+        """
+        current_name, current_ip, current_key = self.entries[agent_id]
+        if agent_name is not None and agent_name != current_name:
+            if self._names.get(current_name) == agent_id:
+                del self._names[current_name]
+            self._names[agent_name] = agent_id
+
+        self.entries[agent_id] = (current_name if agent_name is None else agent_name,
+                                  current_ip if agent_ip is None else agent_ip,
+                                  current_key if agent_key is None else agent_key)
+
+    def remove(self, agent_id):
+        """Remove an entry, if it exists.
+
+        Args:
+            agent_id (str): Agent identifier.
+        """
+        entry = self.entries.pop(agent_id, None)
+        if entry is not None and self._names.get(entry[0]) == agent_id:
+            del self._names[entry[0]]
+
+    def remove_many(self, agent_ids):
+        """Remove several entries, see `remove`.
+
+        Args:
+            agent_ids (iterable): Agent identifiers.
+        """
+        for agent_id in agent_ids:
+            self.remove(agent_id)
+
+    def save(self):
+        """Write the entries to the client keys file, through a temporary file that replaces it.
+
+        The permissions and the owner of the current file are kept.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=directory, prefix='.client.keys.')
+        try:
+            with os.fdopen(file_descriptor, 'w') as client_keys:
+                client_keys.writelines(f"{format_client_keys_entry(agent_id, *entry)}\n"
+                                       for agent_id, entry in self.entries.items())
+
+            if os.path.exists(self.path):
+                stat_info = os.stat(self.path)
+                os.chmod(tmp_path, stat_info.st_mode)
+                try:
+                    os.chown(tmp_path, stat_info.st_uid, stat_info.st_gid)
+                except (PermissionError, AttributeError):
+                    pass
+
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
 
-def delete_client_keys_entry(agent_id):
-    """Delete an entry from client keys file.
+
+def add_client_keys_entry(agent_id, agent_name, agent_ip='any', agent_key=None):
+    """Add new entry to client keys file. If the agent_id already exists, this will be overwritten.
 
     Args:
         agent_id (str): Agent identifier.
+        agent_name (str): Agent name.
+        agent_ip (str): Agent ip.
+        agent_key (str): Agent key.
     """
-    registered_client_key_entries_dict = {}
+    with ClientKeysStore() as client_keys:
+        client_keys.add(agent_id, agent_name, agent_ip, agent_key)
 
-    # Read client keys data
-    with open(fortishield_testing.CLIENT_KEYS_PATH, 'r') as client_keys:
-        registered_client_key_entries_str = client_keys.readlines()
 
-    # Process current client key entries
-    for client_key_entry in registered_client_key_entries_str:
-        _agent_id, _agent_name, _agent_ip, _agent_key = client_key_entry.split()
-        registered_client_key_entries_dict[_agent_id] = f"{_agent_id} {_agent_name} {_agent_ip} {_agent_key}"
-
-    # Remove client key entry
-    registered_client_key_entries_dict.pop(agent_id, None)
+def delete_client_keys_entry(agent_id):
+    """Delete an entry from client keys file.
 
-    # Save new client keys content
-    with open(fortishield_testing.CLIENT_KEYS_PATH, 'w') as client_keys:
-        for _, client_key_entry in registered_client_key_entries_dict.items():
-            client_keys.write(f"{client_key_entry}\n")
+    Args:
+        agent_id (str): Agent identifier.
+    """
+    with ClientKeysStore() as client_keys:
+        client_keys.remove(agent_id)
@@ -0,0 +1,349 @@
+# Copyright (C) 2015-2021, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+
+import asyncio
+import csv
+import math
+import threading
+from collections import defaultdict
+from time import monotonic, sleep
+
+# Delays shorter than this are not slept, the bucket debt makes the next delays longer to compensate
+MIN_SLEEP_TIME = 0.001
+# Time to wait before asking again for a token while the target rate is 0
+IDLE_WAIT_TIME = 0.1
+# Maximum time slept before checking the bucket again, so changes of the target rate are taken into account
+MAX_WAIT_STEP = 0.5
+
+
+class LoadProfile:
+    """Target EPS that can change along the time.
+
+    Args:
+        eps (float): Target events per second once the profile is fully applied.
+    """
+
+    def __init__(self, eps):
+        self.eps = eps
+
+    def rate(self, elapsed):
+        """Get the target EPS.
+
+        Args:
+            elapsed (float): Seconds since the profile started.
+
+        Returns:
+            float: Target EPS at that moment.
+        """
+        return self.eps
+
+
+class RampUpProfile(LoadProfile):
+    """Linear increase of the EPS from `start_eps` to `eps` during `ramp_time` seconds.
+
+    Args:
+        eps (float): Final target EPS.
+        ramp_time (float): Seconds to reach the final EPS.
+        start_eps (float, optional): Initial EPS. Default `0`
+    """
+
+    def __init__(self, eps, ramp_time, start_eps=0):
+        super().__init__(eps)
+        self.ramp_time = ramp_time
+        self.start_eps = start_eps
+
+    def rate(self, elapsed):
+        if elapsed >= self.ramp_time:
+            return self.eps
+        return self.start_eps + (self.eps - self.start_eps) * elapsed / self.ramp_time
+
+
+class StepProfile(LoadProfile):
+    """Increase the EPS in `steps` equal steps of `step_time` seconds until reaching `eps`.
+
+    Args:
+        eps (float): Final target EPS.
+        step_time (float): Duration of each step in seconds.
+        steps (int): Number of steps.
+    """
+
+    def __init__(self, eps, step_time, steps):
+        super().__init__(eps)
+        self.step_time = step_time
+        self.steps = steps
+
+    def rate(self, elapsed):
+        return self.eps * min(int(elapsed // self.step_time) + 1, self.steps) / self.steps
+
+
+class SinusoidalProfile(LoadProfile):
+    """EPS oscillating around `eps`.
+
+    Args:
+        eps (float): Mean target EPS.
+        period (float): Period of the oscillation in seconds.
+        amplitude (float, optional): Amplitude of the oscillation relative to `eps`, between 0 and 1. Default `0.5`
+    """
+
+    def __init__(self, eps, period, amplitude=0.5):
+        super().__init__(eps)
+        self.period = period
+        self.amplitude = amplitude
+
+    def rate(self, elapsed):
+        return self.eps * (1 + self.amplitude * math.sin(2 * math.pi * elapsed / self.period))
+
+
+def create_load_profile(eps, profile=None):
+    """Create a load profile from its string definition.
+
+    Args:
+        eps (float): Target EPS of the profile.
+        profile (str, optional): Profile definition. Default `None` (constant)
+            - `constant`
+            - `ramp:<ramp_seconds>`
+            - `step:<step_seconds>:<steps>`
+            - `sine:<period_seconds>[:<amplitude>]`
+
+    Returns:
+        LoadProfile: Load profile.
+
+    Raises:
+        ValueError: If the profile definition is not valid.
+    """
+    if profile is None or profile == 'constant':
+        return LoadProfile(eps)
+
+    name, *parameters = profile.split(':')
+    try:
+        if name == 'ramp' and len(parameters) == 1:
+            return RampUpProfile(eps, float(parameters[0]))
+        if name == 'step' and len(parameters) == 2:
+            return StepProfile(eps, float(parameters[0]), int(parameters[1]))
+        if name == 'sine' and len(parameters) in (1, 2):
+            return SinusoidalProfile(eps, *map(float, parameters))
+    except ValueError:
+        pass
+
+    raise ValueError(f"Invalid load profile '{profile}'. Valid ones are constant, ramp:<ramp_seconds>, "
+                     "step:<step_seconds>:<steps> and sine:<period_seconds>[:<amplitude>]")
+
+
+class TokenBucket:
+    """Token bucket whose refill rate follows a load profile.
+
+    Tokens are reserved even if the bucket is empty, the bucket gets into debt and the caller is told how long it has to
+    wait. That way sleeping inaccuracies do not accumulate and the achieved rate converges to the target one.
+
+    Args:
+        profile (LoadProfile): Refill rate along the time.
+        start_time (float): Reference time of the profile (`time.monotonic` clock), usually when the first event is
+            sent.
+        burst (float, optional): Maximum number of tokens that can be accumulated. Default `1`
+    """
+
+    def __init__(self, profile, start_time, burst=1):
+        self.profile = profile
+        self.start_time = start_time
+        self.burst = burst
+        self.tokens = burst
+        self.last_update = start_time
+
+    def _refill(self, now):
+        """Add the tokens generated since the last update and return the current rate."""
+        elapsed = now - self.start_time
+        middle_rate = self.profile.rate((self.last_update - self.start_time + elapsed) / 2)
+        self.tokens = min(self.burst, self.tokens + middle_rate * (now - self.last_update))
+        self.last_update = now
+        return self.profile.rate(elapsed)
+
+    def reserve(self, now, tokens=1):
+        """Reserve tokens from the bucket.
+
+        Args:
+            now (float): Current time (`time.monotonic` clock).
+            tokens (int, optional): Number of tokens to reserve. Default `1`
+
+        Returns:
+            float: Seconds to wait before using the tokens, or None if the target rate is 0 and nothing was reserved.
+        """
+        if self._refill(now) <= 0:
+            return None
+
+        self.tokens -= tokens
+        return self.delay(now)
+
+    def delay(self, now):
+        """Get the estimated time until the bucket debt is paid, with the current rate.
+
+        Args:
+            now (float): Current time (`time.monotonic` clock).
+
+        Returns:
+            float: Seconds to wait.
+        """
+        rate = self._refill(now)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / rate if rate > 0 else IDLE_WAIT_TIME
+
+
+class EPSScheduler:
+    """Central rate scheduler for the events sent by the simulated agents.
+
+    Every agent module has its own token bucket, and optionally every agent has another one limiting the EPS of all its
+    modules together. The events sent are counted per second, so the achieved EPS can be compared with the target one.
+
+    The scheduler is shared by the threads or coroutines of a process. A scheduler passed to other processes is copied,
+    so its limits apply per process, and every process paces and counts only the events it sends. The limits of an
+    agent are only kept if all its modules are run by the same process.
+
+    Args:
+        profile (str, optional): Load profile definition applied to every module, see `create_load_profile`.
+            Default `None` (constant)
+        burst (float, optional): Maximum number of tokens that the buckets can accumulate. Default `1`
+
+    Examples:
+        >>> scheduler = EPSScheduler(profile='ramp:60')
+        >>> scheduler.add_module('001', 'fim', eps=100)
+        >>> scheduler.wait('001', 'fim')
+        >>> scheduler.export_csv('/tmp/eps.csv')
+    """
+
+    def __init__(self, profile=None, burst=1):
+        self.profile = profile
+        self.burst = burst
+        self.start_time = monotonic()
+        self._buckets = {}
+        self._agent_buckets = {}
+        self._sent = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add_module(self, agent_id, module, eps):
+        """Add the token bucket of an agent module. Its load profile starts when it is added.
+
+        Args:
+            agent_id (str): Agent ID.
+            module (str): Module name.
+            eps (float): Target EPS of the module.
+        """
+        self._buckets[(agent_id, module)] = TokenBucket(create_load_profile(eps, self.profile), monotonic(),
+                                                        self.burst)
+
+    def set_agent_eps(self, agent_id, eps):
+        """Limit the EPS of all the modules of an agent together. Its load profile starts when it is set.
+
+        Args:
+            agent_id (str): Agent ID.
+            eps (float): Maximum EPS of the agent.
+        """
+        self._agent_buckets[agent_id] = TokenBucket(create_load_profile(eps, self.profile), monotonic(), self.burst)
+
+    def reserve(self, agent_id, module):
+        """Reserve a token for the next event of an agent module.
+
+        Returns:
+            float: Seconds to wait before sending the event, or None if it can not be sent yet.
+        """
+        with self._lock:
+            now = monotonic()
+            delay = self._buckets[(agent_id, module)].reserve(now)
+            agent_bucket = self._agent_buckets.get(agent_id)
+            if delay is None or agent_bucket is None:
+                return delay
+
+            agent_delay = agent_bucket.reserve(now)
+            if agent_delay is None:
+                # Give back the module token, the event will be retried later
+                self._buckets[(agent_id, module)].tokens += 1
+                return None
+            return max(delay, agent_delay)
+
+    def delay(self, agent_id, module):
+        """Get the time left until the reserved token of an agent module can be used.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        with self._lock:
+            now = monotonic()
+            delay = self._buckets[(agent_id, module)].delay(now)
+            agent_bucket = self._agent_buckets.get(agent_id)
+            return delay if agent_bucket is None else max(delay, agent_bucket.delay(now))
+
+    def record(self, agent_id, module, events=1):
+        """Count events as sent in the current second."""
+        with self._lock:
+            self._sent[(agent_id, module)][int(monotonic() - self.start_time)] += events
+
+    def wait(self, agent_id, module):
+        """Block until the next event of an agent module can be sent, and count it as sent."""
+        delay = self.reserve(agent_id, module)
+        while delay is None:
+            sleep(IDLE_WAIT_TIME)
+            delay = self.reserve(agent_id, module)
+        while delay > MIN_SLEEP_TIME:
+            sleep(min(delay, MAX_WAIT_STEP))
+            delay = self.delay(agent_id, module)
+        self.record(agent_id, module)
+
+    async def wait_async(self, agent_id, module):
+        """Asyncio counterpart of `wait`."""
+        delay = self.reserve(agent_id, module)
+        while delay is None:
+            await asyncio.sleep(IDLE_WAIT_TIME)
+            delay = self.reserve(agent_id, module)
+        while delay > MIN_SLEEP_TIME:
+            await asyncio.sleep(min(delay, MAX_WAIT_STEP))
+            delay = self.delay(agent_id, module)
+        self.record(agent_id, module)
+
+    def report(self):
+        """Get the target and achieved EPS of every agent module in every second of the simulation.
+
+        The report of each module goes from its first second to its last one with events sent, the current second is
+        not included as it is not complete yet.
+
+        Returns:
+            list(dict): Rows with the `second`, `agent_id`, `module`, `target_eps` and `achieved_eps` fields.
+        """
+        current_second = int(monotonic() - self.start_time)
+        with self._lock:
+            sent_by_module = {key: dict(sent) for key, sent in self._sent.items()}
+
+        rows = []
+        for (agent_id, module), sent in sorted(sent_by_module.items()):
+            bucket = self._buckets[(agent_id, module)]
+            offset = bucket.start_time - self.start_time
+            for second in range(min(sent), min(max(sent) + 1, current_second)):
+                # Mean target rate along the second
+                target_eps = sum(bucket.profile.rate(max(second + (sample + 0.5) / 10 - offset, 0))
+                                 for sample in range(10)) / 10
+                rows.append({'second': second, 'agent_id': agent_id, 'module': module,
+                             'target_eps': round(target_eps, 3), 'achieved_eps': sent.get(second, 0)})
+        return rows
+
+    def accuracy(self):
+        """Get the ratio between the achieved and target events of every agent module.
+
+        Returns:
+            dict: Achieved/target ratio by (agent_id, module).
+        """
+        totals = defaultdict(lambda: [0, 0])
+        for row in self.report():
+            totals[(row['agent_id'], row['module'])][0] += row['achieved_eps']
+            totals[(row['agent_id'], row['module'])][1] += row['target_eps']
+        return {key: achieved / target if target else 0.0 for key, (achieved, target) in totals.items()}
+
+    def export_csv(self, path):
+        """Write the EPS report into a CSV file.
+
+        Args:
+            path (str): Path of the CSV file.
+        """
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=['second', 'agent_id', 'module', 'target_eps',
+                                                         'achieved_eps'])
+            writer.writeheader()
+            writer.writerows(self.report())
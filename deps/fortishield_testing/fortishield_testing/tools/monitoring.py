@@ -3,6 +3,7 @@
 # This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
 
 # Unix only modules
+import atexit
 import logging
 
 try:
@@ -14,19 +15,32 @@ except ModuleNotFoundError:
 import os
 import queue
 import re
+import select
 import socket
 import socketserver
 import ssl
 import sys
 import threading
 import time
+import weakref
 
+from collections import deque
 from copy import copy
 from datetime import datetime
-from struct import pack, unpack
+from struct import Struct, pack, unpack
 
 from fortishield_testing import logger
 
+# Linux only, used to wait for file changes with inotify
+try:
+    import ctypes
+
+    _libc = ctypes.CDLL(None, use_errno=True) if sys.platform.startswith('linux') else None
+    if _libc is not None and not hasattr(_libc, 'inotify_init1'):
+        _libc = None
+except (ImportError, OSError):
+    _libc = None
+
 
 REMOTED_DETECTOR_PREFIX = r'.*fortishield-remoted.*'
 LOG_COLLECTOR_DETECTOR_PREFIX = r'.*fortishield-logcollector.*'
@@ -38,6 +52,12 @@ FORTISHIELD_DB_PREFIX = r'.*fortishield-db.*'
 
 DEFAULT_POLL_FILE_TIME = 1
 DEFAULT_WAIT_FILE_TIMEOUT = 30
+DEFAULT_TAIL_CHUNK_SIZE = 64 * 1024
+DEFAULT_HUB_MAX_PENDING = 100000
+# Seconds the shared reader waits for a subscriber that is too far behind before detaching it
+DEFAULT_HUB_DETACH_TIMEOUT = 5
+# Numbered backreferences and conditionals, which point to other groups once a pattern is inside an alternation
+NUMBERED_GROUP_REFERENCE = re.compile(r'(?:^|[^\\])(?:\\\\)*\\[1-9]|\(\?\(\d')
 
 
 def fortishield_unpack(data, format_: str = "<I"):
@@ -95,18 +115,109 @@ def _callback_default(line):
     return None
 
 
+class _Inotify:
+    """Minimal inotify watcher used by `FileTailer` to wake up as soon as the tailed file changes.
+
+    The parent directory is watched instead of the file itself, so creations and renames of the path (log rotation)
+    are reported too. Only events related to the tailed file name are taken into account.
+
+    Args:
+        file_path (str): Path of the tailed file.
+
+    Raises:
+        OSError: If the inotify instance or the watch could not be created.
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = Struct('iIII')
+
+    def __init__(self, file_path):
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        directory = os.path.dirname(os.path.abspath(file_path))
+        self._file_name = os.fsencode(os.path.basename(file_path))
+        if _libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'Could not watch {directory}')
+
+    @staticmethod
+    def available():
+        """Check if inotify can be used in the current platform."""
+        return _libc is not None
+
+    def wait(self, timeout):
+        """Block until the tailed file changes or the timeout expires.
+
+        Args:
+            timeout (float): Maximum time to wait, in seconds.
+
+        Returns:
+            bool: True if the tailed file changed, False otherwise.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+
+        changed = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, name_len = self.EVENT_HEADER.unpack_from(buffer, offset)
+                offset += self.EVENT_HEADER.size
+                name = buffer[offset:offset + name_len].rstrip(b'\x00')
+                offset += name_len
+                if mask & self.IN_Q_OVERFLOW or name == self._file_name:
+                    changed = True
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
 class FileTailer:
+    """Tail a file publishing every new line in its queue.
 
-    def __init__(self, file_path, encoding=None, time_step=0.5):
+    The file is read in chunks of `chunk_size` characters that are split into lines in bulk. When inotify is available
+    the tailer sleeps until the file is modified, otherwise it polls the file every `time_step` seconds. Truncated files
+    are read again from the beginning and rotated files are reopened once the previous one has been fully read.
+
+    Args:
+        file_path (str): Path of the file to tail.
+        encoding (str, optional): File encoding. Default `None` (`utf-8` in non Windows systems).
+        time_step (float, optional): Polling interval, also used as the maximum inotify wait. Default `0.5`
+        use_inotify (bool, optional): Use inotify to wait for changes if it is available. Default `True`
+        chunk_size (int, optional): Number of characters read from the file at once. Default `DEFAULT_TAIL_CHUNK_SIZE`
+    """
+
+    def __init__(self, file_path, encoding=None, time_step=0.5, use_inotify=True, chunk_size=DEFAULT_TAIL_CHUNK_SIZE):
         self.file_path = file_path
         self._position = 0
+        self._pending_line = ''
         self.time_step = time_step
+        self.use_inotify = use_inotify
+        self.chunk_size = chunk_size
         self._queue = Queue()
         self.event = threading.Event()
         self.thread = None
-        if sys.platform == 'win32':
-            self.encoding = None if encoding is None else encoding
-        elif encoding is None:
+        if sys.platform == 'win32' or encoding is not None:
+            self.encoding = encoding
+        else:
             self.encoding = 'utf-8'
 
     def __copy__(self):
@@ -117,9 +228,7 @@ class FileTailer:
             elif attr != '_queue':
                 setattr(new_tailer, attr, value)
             else:
-                new_queue = Queue()
-                new_queue.queue = copy(getattr(self, attr).queue)
-                setattr(new_tailer, attr, new_queue)
+                setattr(new_tailer, attr, copy(value))
         return new_tailer
 
     @property
@@ -129,6 +238,9 @@ class FileTailer:
     def add_item(self, item):
         self._queue.put(item)
 
+    def add_items(self, items):
+        self._queue.put_many(items)
+
     def start(self):
         self.run()
 
@@ -141,18 +253,88 @@ class FileTailer:
         self.event.set()
         self.thread.join()
 
+    def _open(self):
+        return open(self.file_path, encoding=self.encoding, errors='backslashreplace')
+
+    def _create_watcher(self):
+        """Create an inotify watcher for the file, or return None to fall back to polling."""
+        if not self.use_inotify or not _Inotify.available():
+            return None
+        try:
+            return _Inotify(self.file_path)
+        except OSError as e:
+            logger.debug(f"Could not watch {self.file_path} using inotify, polling it instead: {e}")
+            return None
+
+    def _publish(self, data):
+        """Split the read data into lines and add them to the queue, keeping the unterminated line for later."""
+        lines = (self._pending_line + data).split('\n')
+        self._pending_line = lines.pop()
+        if lines:
+            self.add_items([f'{line}\n' for line in lines])
+
+    def _check_rotation(self, f):
+        """Detect if the file has been truncated or rotated once all its content has been read.
+
+        Args:
+            f (TextIOWrapper): Current file object, already at EOF.
+
+        Returns:
+            TextIOWrapper: File object to continue reading from.
+        """
+        try:
+            path_stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            # The file is being rotated, keep waiting on the old one until the new one is created
+            return f
+
+        file_stat = os.fstat(f.fileno())
+        if (path_stat.st_dev, path_stat.st_ino) != (file_stat.st_dev, file_stat.st_ino):
+            f.close()
+            f = self._open()
+        elif file_stat.st_size < f.buffer.tell():
+            f.seek(0)
+        else:
+            return f
+
+        self._position = 0
+        self._pending_line = ''
+        return f
+
     def _tail_forever(self):
         """Wait for new lines to be appended to the file."""
-        with open(self.file_path, encoding=self.encoding, errors='backslashreplace') as f:
+        watcher = self._create_watcher()
+        f = self._open()
+        try:
             f.seek(self._position)
+            last_data_time = time.monotonic()
             while not self.event.is_set():
-                line = f.readline()
-                if not line:
-                    f.seek(self._position)
-                    time.sleep(self.time_step)
+                data = f.read(self.chunk_size)
+                if data:
+                    self._position = f.tell()
+                    self._publish(data)
+                    last_data_time = time.monotonic()
+                    continue
+
+                wait_time = self.time_step
+                if self._pending_line:
+                    # The watcher also wakes up for other files of the directory, so the unterminated line is only
+                    # published as readline() would once this file has not grown for a whole step
+                    wait_time = last_data_time + self.time_step - time.monotonic()
+                    if wait_time <= 0:
+                        self.add_item(self._pending_line)
+                        self._pending_line = ''
+                        wait_time = self.time_step
+
+                f = self._check_rotation(f)
+                if watcher is None:
+                    self.event.wait(wait_time)
                 else:
-                    self.add_item(line)
-                self._position = f.tell()
+                    watcher.wait(wait_time)
+        finally:
+            f.close()
+            if watcher is not None:
+                watcher.close()
 
 
 def make_callback(pattern, prefix="fortishield", escape=False):
@@ -206,6 +388,368 @@ class FileMonitor:
         return self._result
 
 
+class _SharedFileTailer(FileTailer):
+    """FileTailer owned by a `TailHub`.
+
+    It starts reading from the end of the file and consumes its own queue as soon as lines are published, so they are
+    only kept until every subscribed cursor has read them. If any subscriber falls more than `max_pending` lines behind,
+    reading is paused until it catches up, the pending data stays in the file meanwhile. A subscriber that does not
+    catch up in `detach_timeout` seconds (e.g. a monitor that is never closed) is detached, so it can not stall the
+    rest of them.
+    """
+
+    def __init__(self, file_path, encoding=None, time_step=0.5, max_pending=DEFAULT_HUB_MAX_PENDING,
+                 detach_timeout=DEFAULT_HUB_DETACH_TIMEOUT):
+        super().__init__(file_path, encoding=encoding, time_step=time_step)
+        self.max_pending = max_pending
+        self.detach_timeout = detach_timeout
+        self._position = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+    def run(self):
+        self.event = threading.Event()
+        self.thread = threading.Thread(target=self._tail_forever, daemon=True)
+        self.thread.start()
+
+    def add_item(self, item):
+        self.add_items([item])
+
+    def add_items(self, items):
+        self._queue.put_many(items)
+        self._queue.skip_pending()
+        deadline = time.monotonic() + self.detach_timeout
+        while self._queue.cursors_lag() > self.max_pending and not self.event.is_set():
+            if time.monotonic() >= deadline:
+                for cursor in self._queue.lagging_cursors(self.max_pending):
+                    cursor.detach()
+                    logger.warning(f"A subscriber of {self.file_path} is more than {self.max_pending} lines behind "
+                                   f"for {self.detach_timeout}s, detaching it. It may miss lines")
+                break
+            self.event.wait(self.time_step / 10)
+
+
+class TailHub:
+    """Share a single reader thread per file among all the monitors of a session.
+
+    Every subscriber gets its own cursor on the lines read by the shared tailer, starting at the lines read after the
+    subscription, so history is never read again.
+
+    Args:
+        time_step (float, optional): Polling interval of the shared tailers. Default `0.5`
+        max_pending (int, optional): Lines a subscriber can fall behind before the reader is paused.
+            Default `DEFAULT_HUB_MAX_PENDING`
+        detach_timeout (float, optional): Seconds the reader is paused by a subscriber before it is detached.
+            Default `DEFAULT_HUB_DETACH_TIMEOUT`
+    """
+
+    def __init__(self, time_step=0.5, max_pending=DEFAULT_HUB_MAX_PENDING, detach_timeout=DEFAULT_HUB_DETACH_TIMEOUT):
+        self.time_step = time_step
+        self.max_pending = max_pending
+        self.detach_timeout = detach_timeout
+        self._tailers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, file_path, encoding=None):
+        """Create a cursor on the lines appended to a file from now on.
+
+        The shared tailer of the file is started with the first subscription.
+
+        Args:
+            file_path (str): Path of the file.
+            encoding (str, optional): File encoding. Default `None`
+
+        Returns:
+            QueueCursor: Cursor to read the new lines. It should be closed when it is not needed anymore.
+        """
+        key = (os.path.abspath(file_path), encoding)
+        with self._lock:
+            tailer = self._tailers.get(key)
+            if tailer is None:
+                tailer = _SharedFileTailer(file_path, encoding=encoding, time_step=self.time_step,
+                                           max_pending=self.max_pending, detach_timeout=self.detach_timeout)
+                tailer.start()
+                self._tailers[key] = tailer
+
+        return tailer.queue.cursor()
+
+    def shutdown(self):
+        """Stop all the shared tailers."""
+        with self._lock:
+            for tailer in self._tailers.values():
+                tailer.shutdown()
+            self._tailers.clear()
+
+
+_tail_hub = None
+_tail_hub_lock = threading.Lock()
+
+
+def get_tail_hub():
+    """Return the tail hub shared by the whole process, creating it if needed."""
+    global _tail_hub
+    with _tail_hub_lock:
+        if _tail_hub is None:
+            _tail_hub = TailHub()
+            atexit.register(_tail_hub.shutdown)
+        return _tail_hub
+
+
+class SharedFileMonitor:
+    """FileMonitor counterpart that reads from the shared tailer of a `TailHub` instead of starting its own.
+
+    Only the lines appended to the file after the monitor is created are monitored.
+
+    Args:
+        file_path (str): Path of the file to monitor.
+        time_step (float, optional): Fraction of time to wait in every get. Default `0.5`
+        encoding (str, optional): File encoding. Default `None`
+        hub (TailHub, optional): Hub to subscribe to. Default `None` (the one returned by `get_tail_hub`)
+    """
+
+    def __init__(self, file_path, time_step=0.5, encoding=None, hub=None):
+        self._cursor = (get_tail_hub() if hub is None else hub).subscribe(file_path, encoding=encoding)
+        self._result = None
+        self._time_step = time_step
+
+    def start(self, timeout=-1, callback=_callback_default, accum_results=1, update_position=True, timeout_extra=0,
+              error_message=''):
+        """Start the file monitoring until the stop method is called."""
+        cursor = self._cursor if update_position else self._cursor.copy()
+        try:
+            monitor = QueueMonitor(cursor, time_step=self._time_step)
+            self._result = monitor.start(timeout=timeout, callback=callback, accum_results=accum_results,
+                                         update_position=True, timeout_extra=timeout_extra,
+                                         error_message=error_message).result()
+        finally:
+            if cursor is not self._cursor:
+                cursor.close()
+
+        return self
+
+    def result(self):
+        return self._result
+
+    def close(self):
+        """Unsubscribe from the hub."""
+        self._cursor.close()
+
+
+class _PatternSubscription:
+    """Pattern registered in a `MultiPatternMonitor` together with its results and statistics."""
+
+    def __init__(self, name, pattern, callback, accum_results):
+        self.name = name
+        self.pattern = pattern
+        # A leading `.*` is only needed by `re.match`, searching without it is equivalent and much cheaper
+        if pattern.startswith('.*'):
+            self.regex = re.compile(pattern[2:])
+            self.find = self.regex.search
+        else:
+            self.regex = re.compile(pattern)
+            self.find = self.regex.match
+        self.callback = callback
+        self.accum_results = accum_results
+        self.results = []
+        self.matches = 0
+        self.time = 0.0
+
+    @property
+    def combinable(self):
+        """Whether the pattern can be part of the combined alternation, that is, it has no numbered group references."""
+        return self.regex.groups == 0 or NUMBERED_GROUP_REFERENCE.search(self.regex.pattern) is None
+
+    @property
+    def combinable_pattern(self):
+        """Pattern to be used inside the combined alternation, anchored if it has to match from the start."""
+        return f'(?:{self.regex.pattern})' if self.find == self.regex.search else f'^(?:{self.regex.pattern})'
+
+    @property
+    def satisfied(self):
+        return len(self.results) >= self.accum_results
+
+    def result(self):
+        return self.results[0] if self.accum_results == 1 and len(self.results) == 1 else list(self.results)
+
+
+class MultiPatternMonitor:
+    """Wait for several log events in a single pass over a file or a queue.
+
+    Every line is checked first against one combined alternation of all the registered patterns, so the lines that
+    do not match any of them (most of them) are discarded with a single regex search. The lines that pass that filter
+    are sent to the subscribers whose pattern matches them.
+
+    Args:
+        file_path (str, optional): Path of the file to monitor. Default `None`
+        queue_item (Queue, optional): Queue to monitor instead of a file. Default `None`
+        time_step (float, optional): Fraction of time to wait in every get. Default `0.5`
+
+    Raises:
+        ValueError: If neither or both `file_path` and `queue_item` are set.
+    """
+
+    def __init__(self, file_path=None, queue_item=None, time_step=0.5):
+        if (file_path is None) == (queue_item is None):
+            raise ValueError('Exactly one of file_path or queue_item must be set')
+
+        self.tailer = FileTailer(file_path, time_step=time_step) if file_path is not None else None
+        self._queue = queue_item
+        self._time_step = time_step
+        self._subscriptions = {}
+        self._combined_regex = None
+        self._pending = []
+        # Pending subscriptions whose pattern is not part of the combined alternation
+        self._unfiltered = []
+        self._wait_for_all = True
+
+    def register(self, name, pattern, callback=None, accum_results=1, prefix=None):
+        """Register a new pattern to look for.
+
+        Args:
+            name (str): Name used to report the results and statistics of the pattern.
+            pattern (str): Regular expression matched from the beginning of every line.
+            callback (callable, optional): Function that receives the `re.Match` object of a matching line and returns
+                the result to store, or None to discard it. Default `None` (the line is stored)
+            accum_results (int, optional): Number of results needed to consider the pattern found. Default `1`
+            prefix (str, optional): Regular expression prepended to the pattern. Default `None`
+
+        Returns:
+            MultiPatternMonitor: This monitor, so several calls can be chained.
+        """
+        full_pattern = pattern if prefix is None else fr'{prefix}{pattern}'
+        self._subscriptions[name] = _PatternSubscription(name, full_pattern, callback, accum_results)
+        self._combined_regex = None
+        return self
+
+    def unregister(self, name):
+        """Stop looking for a registered pattern.
+
+        Args:
+            name (str): Name of the pattern.
+        """
+        del self._subscriptions[name]
+        self._combined_regex = None
+
+    def _compile(self):
+        """Build the alternation of all the pending patterns.
+
+        Patterns with numbered backreferences are left out of the alternation and checked on every line. If the
+        rest of the patterns can not be combined either (e.g. they repeat a group name), no prefilter is used.
+        """
+        pending = [subscription for subscription in self._subscriptions.values() if not subscription.satisfied]
+        combinable = [subscription for subscription in pending if subscription.combinable]
+        self._unfiltered = [subscription for subscription in pending if not subscription.combinable]
+        self._combined_regex = None
+        if combinable:
+            try:
+                self._combined_regex = re.compile('|'.join(subscription.combinable_pattern
+                                                           for subscription in combinable))
+            except re.error as e:
+                logger.debug(f"Patterns could not be combined, checking them one by one: {e}")
+                self._unfiltered = pending
+        self._pending = pending
+
+    def process_line(self, line):
+        """Send a line to all the subscribers whose pattern matches it.
+
+        Args:
+            line (str or bytes): Log line.
+
+        Returns:
+            bool: True if the monitor is done, that is, all the patterns (or any of them when not waiting for all)
+                have accumulated their expected results.
+        """
+        if not self._pending:
+            return True
+
+        line = line.decode() if isinstance(line, bytes) else line
+        candidates = self._pending
+        if self._combined_regex is not None and self._combined_regex.search(line) is None:
+            if not self._unfiltered:
+                return False
+            candidates = self._unfiltered
+
+        recompile = False
+        for subscription in candidates:
+            tic = time.perf_counter()
+            match = subscription.find(line)
+            if match is not None:
+                result = line if subscription.callback is None else subscription.callback(match)
+                if result is not None:
+                    subscription.matches += 1
+                    subscription.results.append(result)
+                    recompile = recompile or subscription.satisfied
+            subscription.time += time.perf_counter() - tic
+
+        if recompile:
+            if self._wait_for_all and not all(subscription.satisfied for subscription in self._pending):
+                self._compile()
+            else:
+                return True
+
+        return False
+
+    def start(self, timeout=-1, update_position=True, wait_for_all=True, error_message='', encoding=None):
+        """Start monitoring until the registered patterns are found.
+
+        Args:
+            timeout (int, optional): Maximum time to wait. Default `-1`
+            update_position (bool, optional): Continue reading from the last read position of the file. Default `True`
+            wait_for_all (bool, optional): Wait for all the patterns, otherwise stop when any of them is found.
+                Default `True`
+            error_message (str, optional): Message to log when the timeout is reached. Default `''`
+            encoding (str, optional): Encoding of the monitored file. Default `None`
+
+        Raises:
+            TimeoutError: If the patterns are not found before the timeout.
+        """
+        for subscription in self._subscriptions.values():
+            subscription.results = []
+        self._wait_for_all = wait_for_all
+        self._compile()
+
+        if self.tailer is None:
+            self._run_queue_monitor(self._queue, timeout, update_position, error_message)
+            return self
+
+        tailer = self.tailer if update_position else copy(self.tailer)
+        try:
+            if encoding is not None:
+                tailer.encoding = encoding
+            tailer.start()
+            self._run_queue_monitor(tailer.queue, timeout, True, error_message)
+        finally:
+            tailer.shutdown()
+
+        return self
+
+    def _run_queue_monitor(self, queue_item, timeout, update_position, error_message):
+        try:
+            QueueMonitor(queue_item, time_step=self._time_step).start(timeout=timeout, callback=self.process_line,
+                                                                       update_position=update_position)
+        except TimeoutError:
+            missing = [name for name, subscription in self._subscriptions.items() if not subscription.satisfied]
+            if error_message:
+                logger.error(error_message)
+            logger.error(f"Patterns not found: {missing}")
+            raise TimeoutError(error_message)
+
+    def result(self):
+        """Return the results of every registered pattern.
+
+        Returns:
+            dict: Results by pattern name. A single result if `accum_results` is 1, a list otherwise.
+        """
+        return {name: subscription.result() for name, subscription in self._subscriptions.items()}
+
+    def stats(self):
+        """Return the matching statistics of every registered pattern.
+
+        Returns:
+            dict: Number of matches and time spent matching (seconds) by pattern name.
+        """
+        return {name: {'matches': subscription.matches, 'time': subscription.time}
+                for name, subscription in self._subscriptions.items()}
+
+
 class SocketController:
 
     def __init__(self, address, family='AF_UNIX', connection_protocol='TCP', timeout=30, open_at_start=True):
@@ -413,6 +957,7 @@ class QueueMonitor:
         position = 0
         extra_timer_is_running = False
         extra_timer = 0.0
+        cursor = self._queue.cursor() if not update_position and hasattr(self._queue, 'cursor') else None
         while len(result_list) != accum_results or extra_timer_is_running:
             if timer >= timeout and not extra_timer_is_running:
                 self.abort()
@@ -424,6 +969,8 @@ class QueueMonitor:
             try:
                 if update_position:
                     msg = self._queue.get(block=True, timeout=self._time_step)
+                elif cursor is not None:
+                    msg = cursor.get(block=True, timeout=self._time_step)
                 else:
                     msg = self._queue.peek(position=position, block=True, timeout=self._time_step)
                     position += 1
@@ -441,6 +988,9 @@ class QueueMonitor:
                 if extra_timer_is_running:
                     extra_timer += time_count
 
+        if cursor is not None:
+            cursor.close()
+
         if len(result_list) == 1:
             return result_list[0]
         else:
@@ -492,6 +1042,91 @@ class QueueMonitor:
 
 
 class Queue(queue.Queue):
+    """Queue backed by an indexed, append-only buffer.
+
+    Every item keeps its absolute position in the stream, so any position can be peeked in O(1) and several
+    `QueueCursor` can read the queue without consuming it. Items already consumed by `get` and read by every open
+    cursor are compacted once there are more than `COMPACT_THRESHOLD` of them.
+
+    Args:
+        maxsize (int, optional): Maximum number of pending items. Default `0` (unbounded)
+    """
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.new_items = threading.Condition(self.mutex)
+
+    def _init(self, maxsize):
+        self._buffer = []
+        # Absolute position of the first buffered item and of the next item returned by `get`
+        self._base = 0
+        self._head = 0
+        self._cursors = weakref.WeakSet()
+
+    def _qsize(self):
+        return self._base + len(self._buffer) - self._head
+
+    def _put(self, item):
+        self._buffer.append(item)
+        self.new_items.notify_all()
+
+    def _get(self):
+        item = self._buffer[self._head - self._base]
+        self._head += 1
+        self._compact()
+        return item
+
+    def _compact(self):
+        """Drop the buffered items that are not pending for `get` nor for any open cursor."""
+        if self._head - self._base < self.COMPACT_THRESHOLD:
+            return
+
+        limit = min([self._head] + [cursor.position for cursor in self._cursors])
+        consumed = limit - self._base
+        if consumed >= self.COMPACT_THRESHOLD and consumed * 2 >= len(self._buffer):
+            del self._buffer[:consumed]
+            self._base = limit
+
+    def _get_at(self, position, block=True, timeout=None):
+        """Return the item at the given absolute position without consuming it.
+
+        Args:
+            position (int): Absolute position of the item in the stream.
+            block (bool, optional): Wait until the item is available. Default `True`
+            timeout (float, optional): Maximum time to wait for the item. Default `None` (wait forever)
+
+        Raises:
+            queue.Empty: If the item is not available in time.
+            IndexError: If the item was already compacted.
+        """
+        with self.new_items:
+            if not block:
+                if position >= self._base + len(self._buffer):
+                    raise queue.Empty
+            elif timeout is None:
+                while position >= self._base + len(self._buffer):
+                    self.new_items.wait()
+            elif timeout < 0:
+                raise ValueError("'timeout' must be a non-negative number")
+            else:
+                end_time = time.monotonic() + timeout
+                while position >= self._base + len(self._buffer):
+                    remaining = end_time - time.monotonic()
+                    if remaining <= 0.0:
+                        raise queue.Empty
+                    self.new_items.wait(remaining)
+
+            if position < self._base:
+                raise IndexError(f"Position {position} was compacted, the oldest buffered item is {self._base}")
+            return self._buffer[position - self._base]
+
+    @property
+    def queue(self):
+        """Items that have not been consumed by `get` yet."""
+        with self.mutex:
+            return deque(self._buffer[self._head - self._base:])
+
     def peek(self, *args, position=0, **kwargs):
         """Peek any given position without modifying the queue status.
 
@@ -503,11 +1138,72 @@ class Queue(queue.Queue):
         Returns:
             (any): Any item in the given position.
         """
-        aux_queue = queue.Queue()
-        aux_queue.queue = copy(self.queue)
-        for _ in range(position):
-            aux_queue.get(*args, **kwargs)
-        return aux_queue.get(*args, **kwargs)
+        return self._get_at(self._head + position, *args, **kwargs)
+
+    def cursor(self, position=None):
+        """Create a cursor that reads the queue without consuming it.
+
+        Args:
+            position (int, optional): Absolute position to start reading from. It can not be older than the oldest
+                buffered item. Default `None` (current head of the queue)
+
+        Returns:
+            QueueCursor: New cursor. The buffered items it has not read yet are kept until it is closed.
+        """
+        with self.mutex:
+            cursor = QueueCursor(self, self._head if position is None else max(position, self._base))
+            self._cursors.add(cursor)
+        return cursor
+
+    def skip_pending(self):
+        """Consume all the pending items at once.
+
+        The consumed items are still kept for the open cursors that have not read them yet.
+        """
+        with self.mutex:
+            self._head = self._base + len(self._buffer)
+            self._compact()
+            self.not_full.notify_all()
+
+    def cursors_lag(self):
+        """Return the number of buffered items that the slowest open cursor has not read yet."""
+        with self.mutex:
+            end = self._base + len(self._buffer)
+            return max([end - cursor.position for cursor in self._cursors], default=0)
+
+    def lagging_cursors(self, max_lag):
+        """Return the open cursors that have more than `max_lag` buffered items left to read."""
+        with self.mutex:
+            end = self._base + len(self._buffer)
+            return [cursor for cursor in self._cursors if end - cursor.position > max_lag]
+
+    @property
+    def first_position(self):
+        """Absolute position of the oldest buffered item."""
+        with self.mutex:
+            return self._base
+
+    def put_many(self, items):
+        """Put several items at once, taking the queue lock only once.
+
+        Args:
+            items (list): Items to add to the queue.
+        """
+        if self.maxsize > 0:
+            for item in items:
+                self.put(item)
+            return
+
+        with self.not_full:
+            self._buffer.extend(items)
+            self.unfinished_tasks += len(items)
+            self.not_empty.notify(len(items))
+            self.new_items.notify_all()
+
+    def __copy__(self):
+        new_queue = Queue(self.maxsize)
+        new_queue.put_many(list(self.queue))
+        return new_queue
 
     def __repr__(self):
         """Returns the object representation in string format.
@@ -519,6 +1215,75 @@ class Queue(queue.Queue):
         return str(self.queue)
 
 
+class QueueCursor:
+    """Non destructive reader of a `Queue`.
+
+    Each cursor keeps its own position, so several monitors can scan the same stream independently in linear time.
+
+    Args:
+        queue_item (Queue): Queue to read.
+        position (int): Absolute position of the first item to read.
+
+    Attributes:
+        detached (bool): The queue does not keep the items the cursor has not read anymore, see `detach`.
+        dropped (int): Number of items the cursor skipped because they were compacted after it was detached.
+    """
+
+    def __init__(self, queue_item, position):
+        self._queue = queue_item
+        self.position = position
+        self.detached = False
+        self.dropped = 0
+
+    def get(self, block=True, timeout=None):
+        """Return the next item and move the cursor forward.
+
+        Args:
+            block (bool, optional): Wait until there is a new item. Default `True`
+            timeout (float, optional): Maximum time to wait for a new item. Default `None` (wait forever)
+
+        Raises:
+            queue.Empty: If there is no new item in time.
+        """
+        while True:
+            if self.detached:
+                first_position = self._queue.first_position
+                if self.position < first_position:
+                    self.dropped += first_position - self.position
+                    self.position = first_position
+            try:
+                item = self._queue._get_at(self.position, block=block, timeout=timeout)
+                break
+            except IndexError:
+                # Only the items of a detached cursor can be compacted before it reads them
+                if not self.detached:
+                    raise
+
+        self.position += 1
+        return item
+
+    def copy(self):
+        """Create a new cursor on the same queue, at the current position.
+
+        Returns:
+            QueueCursor: New cursor. It should be closed when it is not needed anymore.
+        """
+        return self._queue.cursor(position=self.position)
+
+    def detach(self):
+        """Stop tracking the cursor but keep it readable.
+
+        The items it has not read can be compacted, the next reads skip them and count them in `dropped`.
+        """
+        self.close()
+        self.detached = True
+
+    def close(self):
+        """Stop tracking the cursor, so the items it has not read can be compacted."""
+        with self._queue.mutex:
+            self._queue._cursors.discard(self)
+
+
 class StreamServerPort(socketserver.ThreadingTCPServer):
     pass
 
@@ -6,6 +6,7 @@ import base64
 import hashlib
 import json
 import os
+import selectors
 import socket
 import struct
 import threading
@@ -19,6 +20,12 @@ from Crypto.Util.Padding import pad
 from fortishield_testing.tools import FORTISHIELD_PATH
 from fortishield_testing.tools.monitoring import Queue
 
+# Seconds the multi-connection listener waits for socket events before checking if it has to stop
+SELECT_TIMEOUT = 0.5
+RECV_BUFFER_SIZE = 65536
+# Seconds a rejected TCP connection is kept open to write its pending responses
+CLOSE_DELAY = 0.1
+
 
 class Cipher:
     """Algorithm to perform encryption/decryption of manager-agent secure messages:
@@ -583,10 +590,8 @@ class RemotedSimulator:
         else:
             crypto_method = "blowfish"
 
-        # Update keys to encrypt/decrypt
-        self.update_keys()
-        # TODO: Ask for specific keys depending on Agent Identifier
-        keys = self.get_key()
+        # Get the keys to encrypt/decrypt
+        keys = self.get_agent_keys(agent_identifier_type, agent_identifier)
         if keys is None:
             # No valid keys
             logger.error("Not valid keys used.")
@@ -635,6 +640,21 @@ class RemotedSimulator:
 
         return msg
 
+    def get_agent_keys(self, agent_identifier_type, agent_identifier):
+        """Get the keys used to encrypt/decrypt the messages of an agent.
+
+        Args:
+            agent_identifier_type (str): How the agent is identified (by_id or by_ip).
+            agent_identifier (str): Agent ID or IP address.
+
+        Returns:
+            tuple: Agent id, name, ip and key. None if there are no keys.
+        """
+        # Update keys to encrypt/decrypt
+        self.update_keys()
+        # TODO: Ask for specific keys depending on Agent Identifier
+        return self.get_key()
+
     def update_keys(self):
         """Update keys table with keys read from client.keys."""
         if not os.path.exists(self.client_keys_path):
@@ -727,3 +747,358 @@ class RemotedSimulator:
         if self.last_client:
             request = self.create_sec_message(f'#!-req {self.request_counter} {message}', 'aes')
             self.send(self.last_client, request)
+
+
+class RemotedConnection:
+    """State of an agent connection served by `MultiConnectionRemotedSimulator`.
+
+    Args:
+        address (tuple): Client address.
+        sock (socket.socket, optional): Connection socket. None for UDP clients.
+
+    Attributes:
+        agent_id (str): Identifier of the agent, taken from its last message.
+        encryption_key (bytes): Key of the last message of the connection.
+        global_count (int): Global counter of the secure messages sent to the agent.
+        local_count (int): Local counter of the secure messages sent to the agent.
+        inbound (bytearray): Received data not processed yet.
+        outbound (bytearray): Data waiting to be written into the socket.
+        close_time (float): Time when the connection has to be closed, None if it is not being closed.
+    """
+
+    def __init__(self, address, sock=None):
+        self.address = address
+        self.sock = sock
+        self.agent_id = None
+        self.encryption_key = ""
+        self.global_count = 1234567891
+        self.local_count = 5555
+        self.inbound = bytearray()
+        self.outbound = bytearray()
+        self.lock = threading.Lock()
+        self.connected_time = time.time()
+        self.closed_time = None
+        self.close_time = None
+        self.messages_received = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def stats(self):
+        """Get the throughput and queue depth of the connection.
+
+        Returns:
+            dict: Connection statistics.
+        """
+        elapsed = max((self.closed_time or time.time()) - self.connected_time, 1e-9)
+        return {
+            'address': f"{self.address[0]}:{self.address[1]}",
+            'agent_id': self.agent_id,
+            'connected': self.closed_time is None,
+            'messages_received': self.messages_received,
+            'bytes_received': self.bytes_received,
+            'messages_sent': self.messages_sent,
+            'bytes_sent': self.bytes_sent,
+            'eps': round(self.messages_received / elapsed, 3),
+            'inbound_pending_bytes': len(self.inbound),
+            'outbound_pending_bytes': len(self.outbound)
+        }
+
+
+class MultiConnectionRemotedSimulator(RemotedSimulator):
+    """Remoted simulator serving many agent connections at once.
+
+    All the connections are multiplexed by a selector in the listener thread, so an agent does not have to wait for
+    others to disconnect. Every connection keeps its own encryption key and message counters, and the keys are looked up
+    by the agent ID (or IP address) of each message, reading the client keys file again only when it changes.
+
+    Args:
+        server_address (str): Manager ip address.
+        remoted_port (str): Remoted connection port.
+        protocol (str): Remoted protocol.
+        mode (str): Remoted mode (REJECT, DUMMY_ACK, CONTROLLED_ACK, WRONG_KEY, INVALID_MSG)
+        client_keys (str): Client keys file path.
+        start_on_init (boolean): Indicate if remoted simulator should start after initialization.
+        rcv_msg_limit (int): max elements for the received message queue.
+        backlog (int): Maximum number of pending TCP connections.
+        stats_interval (int): Seconds between the logs of the connection statistics. None to disable them.
+
+    Examples:
+        >>> remoted = MultiConnectionRemotedSimulator(protocol='tcp', mode='DUMMY_ACK', stats_interval=10)
+        >>> remoted.connection_stats()
+        >>> remoted.stop()
+    """
+
+    def __init__(self, server_address='127.0.0.1', remoted_port=1514, protocol='udp', mode='REJECT',
+                 client_keys=FORTISHIELD_PATH + '/etc/client.keys', start_on_init=True, rcv_msg_limit=0, backlog=1024,
+                 stats_interval=None):
+        self.backlog = backlog
+        self.stats_interval = stats_interval
+        # Connections by socket (TCP) or client address (UDP)
+        self.connections = {}
+        self.closed_connections = []
+        self._keys_mtime = None
+        self._state_lock = threading.RLock()
+        super().__init__(server_address=server_address, remoted_port=remoted_port, protocol=protocol, mode=mode,
+                         client_keys=client_keys, start_on_init=start_on_init, rcv_msg_limit=rcv_msg_limit)
+
+    def _start_socket(self):
+        """Init remoted simulator socket."""
+        super()._start_socket()
+        if self.protocol == 'tcp':
+            self.sock.listen(self.backlog)
+
+    def get_agent_keys(self, agent_identifier_type, agent_identifier):
+        """Get the keys of the agent that sent a message, or the first ones if the agent is not in the client keys."""
+        self._reload_keys()
+        keys = self.keys[0 if agent_identifier_type == 'by_id' else 1].get(agent_identifier)
+        return keys if keys is not None else self.get_key()
+
+    def _reload_keys(self):
+        """Read the client keys file if it has changed since the last time it was read."""
+        try:
+            mtime = os.stat(self.client_keys_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime is None or mtime != self._keys_mtime:
+            try:
+                self.update_keys()
+            except OSError as e:
+                logger.debug(f"Could not read the client keys: {e}")
+                self.keys = ({}, {})
+            self._keys_mtime = mtime
+
+    def _activate(self, connection):
+        """Load the state of a connection into the simulator before processing its messages."""
+        self.encryption_key = connection.encryption_key
+        self.global_count = connection.global_count
+        self.local_count = connection.local_count
+
+    def _save(self, connection):
+        """Store the state of the simulator into the connection after processing its messages."""
+        connection.encryption_key = self.encryption_key
+        connection.global_count = self.global_count
+        connection.local_count = self.local_count
+        if self.last_message_ctx:
+            connection.agent_id = self.last_message_ctx.split(' ')[1]
+
+    def send(self, dst, data):
+        """Send method to write on the socket.
+
+        TCP messages are buffered in the connection and written without blocking, the pending data is written when the
+        socket is ready again.
+
+        Args:
+            dst (socket): Address to write specified data.
+            data (socket): Data to be send.
+        """
+        connection = self.connections.get(dst)
+        if connection is None or self.protocol != 'tcp':
+            super().send(dst, data)
+            if connection is not None:
+                connection.messages_sent += 1
+                connection.bytes_sent += len(data)
+            return
+
+        self.update_counters()
+        with connection.lock:
+            connection.outbound += pack('<I', len(data)) + data
+            connection.messages_sent += 1
+            self._flush(connection)
+
+    def _flush(self, connection):
+        """Write as much pending data of a TCP connection as the socket accepts without blocking."""
+        try:
+            while connection.outbound:
+                sent = connection.sock.send(connection.outbound)
+                connection.bytes_sent += sent
+                del connection.outbound[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            connection.outbound.clear()
+
+    def request(self, message):
+        """Send request to agent using current request counter.
+
+        Args:
+            message (str): Request content.
+        """
+        connection = self.connections.get(self.last_client)
+        if connection is None:
+            return super().request(message)
+
+        with self._state_lock:
+            self._activate(connection)
+            super().request(message)
+            self._save(connection)
+
+    def _process(self, connection, data):
+        """Process a message received from a connection and answer it.
+
+        Returns:
+            boolean: False if the connection has to be closed.
+        """
+        connection.messages_received += 1
+        connection.bytes_received += len(data)
+        dst = connection.sock if connection.sock is not None else connection.address
+
+        with self._state_lock:
+            self._activate(connection)
+            try:
+                ret = self.process_message(connection.address, data)
+            except Exception as e:
+                logger.debug(f"Error processing a message from {connection.address}: {e}")
+                ret = -1
+
+            # Response -1 means connection have to be closed
+            if ret == -1:
+                self._save(connection)
+                return self.protocol != 'tcp'
+            # If there is a response, answer it
+            elif ret:
+                self.send(dst, ret)
+
+            # Active response message
+            if self.active_response_message:
+                msg = self.create_sec_message(f"#!-execd {self.active_response_message}", "aes")
+                self.active_response_message = None
+                self.send(dst, msg)
+            self._save(connection)
+
+        return True
+
+    def _accept(self, selector):
+        """Accept the pending TCP connections."""
+        while True:
+            try:
+                sock, client_address = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            connection = RemotedConnection(client_address, sock)
+            self.connections[sock] = connection
+            self.last_client = sock
+            selector.register(sock, selectors.EVENT_READ, connection)
+
+    def _close(self, selector, connection):
+        """Close a TCP connection and keep its statistics."""
+        selector.unregister(connection.sock)
+        connection.sock.close()
+        connection.closed_time = time.time()
+        self.connections.pop(connection.sock, None)
+        self.closed_connections.append(connection)
+        if self.last_client is connection.sock:
+            self.last_client = None
+
+    def _read(self, selector, connection):
+        """Read the data available in a TCP connection and process its complete messages."""
+        try:
+            data = connection.sock.recv(RECV_BUFFER_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._close(selector, connection)
+            return
+        # The data received while the connection is being closed is discarded
+        if connection.close_time is not None:
+            return
+
+        connection.inbound += data
+        while len(connection.inbound) >= 4:
+            data_size = struct.unpack('<I', connection.inbound[0:4])[0]
+            if len(connection.inbound) < data_size + 4:
+                break
+            message = bytes(connection.inbound[4:data_size + 4])
+            del connection.inbound[:data_size + 4]
+            if not self._process(connection, message):
+                # Close it later from the listener loop, so the other connections are not blocked meanwhile
+                connection.close_time = time.time() + CLOSE_DELAY
+                connection.inbound.clear()
+                return
+
+    def _read_datagrams(self):
+        """Read and process the pending UDP messages."""
+        while True:
+            try:
+                data, client_address = self.sock.recvfrom(RECV_BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            connection = self.connections.get(client_address)
+            if connection is None:
+                connection = self.connections[client_address] = RemotedConnection(client_address)
+            self._process(connection, data)
+
+    def listener(self):
+        """Listener thread to serve every connection and process their received packages."""
+        selector = selectors.DefaultSelector()
+        self.sock.setblocking(False)
+        selector.register(self.sock, selectors.EVENT_READ)
+        last_stats_time = time.time()
+        try:
+            while self.running:
+                # Wake up in time to close the rejected connections
+                timeout = min([SELECT_TIMEOUT] + [max(connection.close_time - time.time(), 0)
+                                                  for connection in self.connections.values()
+                                                  if connection.close_time is not None])
+                for key, events in selector.select(timeout=timeout):
+                    if key.fileobj is self.sock:
+                        if self.protocol == 'tcp':
+                            self._accept(selector)
+                        else:
+                            self._read_datagrams()
+                        continue
+
+                    connection = key.data
+                    if events & selectors.EVENT_WRITE:
+                        with connection.lock:
+                            self._flush(connection)
+                    if events & selectors.EVENT_READ:
+                        self._read(selector, connection)
+
+                # Wait for the sockets to be writable only while they have pending data
+                if self.protocol == 'tcp':
+                    for sock, connection in list(self.connections.items()):
+                        if connection.close_time is not None and time.time() >= connection.close_time:
+                            self._close(selector, connection)
+                            continue
+                        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if connection.outbound else 0)
+                        if selector.get_key(sock).events != events:
+                            selector.modify(sock, events, connection)
+
+                if self.stats_interval is not None and time.time() - last_stats_time >= self.stats_interval:
+                    self.log_connection_stats()
+                    last_stats_time = time.time()
+        finally:
+            if self.protocol == 'tcp':
+                for connection in list(self.connections.values()):
+                    self._close(selector, connection)
+            selector.close()
+
+    def connection_stats(self, include_closed=False):
+        """Get the throughput and queue depth of every connection.
+
+        Args:
+            include_closed (boolean): Include the connections that have been closed.
+
+        Returns:
+            list(dict): Statistics of every connection.
+        """
+        connections = list(self.connections.values())
+        if include_closed:
+            connections = self.closed_connections + connections
+        return [connection.stats() for connection in connections]
+
+    def log_connection_stats(self):
+        """Log the statistics of the current connections and the depth of the received messages queue."""
+        stats = self.connection_stats()
+        logger.info(f"Remoted simulator: {len(stats)} connections, {self.rcv_msg_queue.qsize()} received messages "
+                    "in queue")
+        for connection_stats in stats:
+            logger.info(f"{connection_stats['address']} (agent {connection_stats['agent_id']}): "
+                        f"{connection_stats['messages_received']} messages received at {connection_stats['eps']} EPS, "
+                        f"{connection_stats['messages_sent']} sent, {connection_stats['inbound_pending_bytes']} "
+                        f"bytes pending to process, {connection_stats['outbound_pending_bytes']} bytes pending to send")
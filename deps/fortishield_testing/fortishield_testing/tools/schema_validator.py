@@ -0,0 +1,149 @@
+# Copyright (C) 2015-2023, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+import json
+import os
+
+from jsonschema import exceptions, validators
+
+from fortishield_testing import FORTISHIELD_TESTING_DATA_PATH
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# Suffix of the schema files used to validate the events of Windows hosts
+WINDOWS_SCHEMA_SUFFIX = '_windows'
+
+_validators = {}
+
+
+class SchemaValidator:
+    """Prebuilt validator of a JSON schema.
+
+    The schema is checked and its validator is built only once. If `fastjsonschema` is installed, the schema is also
+    compiled into a Python function, used as a fast path for the valid events. The events rejected by the compiled
+    function are validated again with `jsonschema`, so the raised error is the same one that `jsonschema.validate`
+    would raise.
+
+    Args:
+        schema (dict): JSON schema.
+        compile (boolean): Compile the schema with `fastjsonschema` if it is installed. Default `True`
+    """
+
+    def __init__(self, schema, compile=True):
+        validator_class = validators.validator_for(schema)
+        validator_class.check_schema(schema)
+
+        self.schema = schema
+        self._validator = validator_class(schema)
+        self._compiled = None
+
+        if compile and fastjsonschema is not None:
+            try:
+                self._compiled = fastjsonschema.compile(schema, use_default=False)
+            except fastjsonschema.JsonSchemaDefinitionException:
+                self._compiled = None
+
+    @property
+    def compiled(self):
+        """Whether the schema is also compiled with `fastjsonschema`."""
+        return self._compiled is not None
+
+    def validate(self, event):
+        """Validate an event.
+
+        Args:
+            event (dict): Event to validate.
+
+        Raises:
+            jsonschema.exceptions.ValidationError: If the event is not valid.
+        """
+        if self._compiled is not None:
+            try:
+                self._compiled(event)
+                return
+            except fastjsonschema.JsonSchemaValueException:
+                pass
+
+        error = exceptions.best_match(self._validator.iter_errors(event))
+        if error is not None:
+            raise error
+
+    def validate_events(self, events):
+        """Validate several events.
+
+        Args:
+            events (list): Events to validate.
+
+        Raises:
+            jsonschema.exceptions.ValidationError: With the error of the first event that is not valid.
+        """
+        for event in events:
+            self.validate(event)
+
+    def is_valid(self, event):
+        """Check if an event is valid.
+
+        Args:
+            event (dict): Event to validate.
+
+        Returns:
+            boolean: True if the event is valid, False otherwise.
+        """
+        try:
+            self.validate(event)
+        except exceptions.ValidationError:
+            return False
+        return True
+
+
+def get_schema_path(schema_file, platform=None):
+    """Get the path of the schema file used for a platform.
+
+    Args:
+        schema_file (str): Schema file name in the data folder, or schema file path.
+        platform (str): Platform of the events (`sys.platform` format). Default None, to use the schema file as is.
+
+    Returns:
+        str: Schema file path.
+    """
+    if platform == 'win32':
+        name, extension = os.path.splitext(schema_file)
+        schema_file = f"{name}{WINDOWS_SCHEMA_SUFFIX}{extension}"
+
+    return os.path.join(FORTISHIELD_TESTING_DATA_PATH, schema_file)
+
+
+def get_validator(schema_file, platform=None):
+    """Get the prebuilt validator of a schema file, building it the first time.
+
+    Args:
+        schema_file (str): Schema file name in the data folder, or schema file path.
+        platform (str): Platform of the events (`sys.platform` format). The Windows schema file has the `_windows`
+            suffix. Default None, to use the schema file as is.
+
+    Returns:
+        SchemaValidator: Validator of the schema.
+    """
+    key = (schema_file, platform)
+    if key not in _validators:
+        with open(get_schema_path(schema_file, platform), 'r') as f:
+            _validators[key] = SchemaValidator(json.load(f))
+
+    return _validators[key]
+
+
+def validate_events(events, schema_file, platform=None):
+    """Validate several events with the prebuilt validator of a schema file.
+
+    Args:
+        events (list): Events to validate.
+        schema_file (str): Schema file name in the data folder, or schema file path.
+        platform (str): Platform of the events (`sys.platform` format). Default None, to use the schema file as is.
+
+    Raises:
+        jsonschema.exceptions.ValidationError: With the error of the first event that is not valid.
+    """
+    get_validator(schema_file, platform).validate_events(events)
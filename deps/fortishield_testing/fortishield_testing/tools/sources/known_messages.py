@@ -0,0 +1,172 @@
+# Copyright (C) 2015-2022, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+import json
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    try:
+        import sre_parse
+    except ImportError:
+        # Without the regex parser every known message regex is tried
+        sre_parse = None
+
+LOG_DAEMON_REGEX = re.compile(r".*\d+\/\d+\/\d+ \d+:\d+:\d+ (.*?):")
+# Shortest literal worth checking before trying a known message regex
+MIN_LITERAL_LENGTH = 3
+
+
+def get_log_daemon(log_line):
+    """Get the daemon that generated a log line.
+
+    Args:
+        log_line (str): Log line.
+
+    Returns:
+        str: Daemon name, or None if the line does not have the log format.
+    """
+    match = LOG_DAEMON_REGEX.match(log_line)
+    return match.group(1) if match else None
+
+
+def get_required_literal(regex):
+    """Get the longest literal text that any string matching a regex must contain.
+
+    Only the top level of the regex is analyzed, so literals inside groups, alternations or repetitions are not taken
+    into account.
+
+    Args:
+        regex (str): Regular expression.
+
+    Returns:
+        str: Required literal, or None if it is too short or can not be calculated.
+    """
+    if sre_parse is None:
+        return None
+
+    # The regex parser is a private module of the standard library, so any change in its API disables the prefilter
+    # of the regex instead of failing
+    try:
+        parsed_regex = sre_parse.parse(regex)
+        flags = parsed_regex.state.flags if hasattr(parsed_regex, 'state') else parsed_regex.pattern.flags
+        if flags & re.IGNORECASE:
+            return None
+
+        literals = ['']
+        for op, value in parsed_regex:
+            if op == sre_parse.LITERAL:
+                literals[-1] += chr(value)
+            elif literals[-1]:
+                literals.append('')
+        literal = max(literals, key=len)
+    except Exception:
+        return None
+
+    return literal if len(literal) >= MIN_LITERAL_LENGTH else None
+
+
+class KnownMessagesClassifier:
+    """Classify log messages as known or unexpected, using a whitelist of regular expressions per severity.
+
+    The whitelist is compiled once per severity. Every known message regex is matched from the beginning of the log
+    message, in the same order as the whitelist, and it is skipped if the message does not contain its required literal
+    text. The matches of every whitelist entry are counted, so the entries that never matched can be reported.
+
+    Args:
+        known_messages (dict): Known message regexes of every severity (`warning`, `error`, `critical`...).
+        prefilter (boolean): Check the required literal of every regex before trying it. Default `True`
+
+    Examples:
+        >>> classifier = KnownMessagesClassifier.from_file('know_messages.json')
+        >>> unexpected = classifier.get_unexpected('warning', report_warnings)
+        >>> classifier.get_unmatched('warning')
+    """
+
+    def __init__(self, known_messages, prefilter=True):
+        self.known_messages = {severity: list(regexes) for severity, regexes in known_messages.items()}
+        self.prefilter = prefilter
+        self._compiled = {severity: [(re.compile(regex), get_required_literal(regex) if prefilter else None)
+                                     for regex in regexes]
+                          for severity, regexes in self.known_messages.items()}
+        self.matches = {severity: [0] * len(regexes) for severity, regexes in self.known_messages.items()}
+
+    @classmethod
+    def from_file(cls, path, prefilter=True):
+        """Create a classifier from a JSON file with the known messages of every severity.
+
+        Args:
+            path (str): JSON file path.
+            prefilter (boolean): Check the required literal of every regex before trying it. Default `True`
+
+        Returns:
+            KnownMessagesClassifier: Classifier of the file messages.
+        """
+        with open(path) as known_messages_file:
+            return cls(json.load(known_messages_file), prefilter)
+
+    def match(self, severity, message):
+        """Get the whitelist entry that matches a message.
+
+        Args:
+            severity (str): Severity of the message.
+            message (str): Log message.
+
+        Returns:
+            int: Index of the matching regex in the severity whitelist, or None if the message is unexpected.
+        """
+        for index, (regex, literal) in enumerate(self._compiled.get(severity, [])):
+            if literal is not None and literal not in message:
+                continue
+            if regex.match(message):
+                self.matches[severity][index] += 1
+                return index
+
+        return None
+
+    def classify(self, severity, messages):
+        """Classify several messages of the same severity.
+
+        Args:
+            severity (str): Severity of the messages.
+            messages (list): Log messages.
+
+        Returns:
+            dict: Messages matched by every whitelist regex (`known`) and messages not matched by any (`unexpected`).
+        """
+        classification = {'known': {regex: [] for regex in self.known_messages.get(severity, [])}, 'unexpected': []}
+        for message in messages:
+            index = self.match(severity, message)
+            if index is None:
+                classification['unexpected'].append(message)
+            else:
+                classification['known'][self.known_messages[severity][index]].append(message)
+
+        return classification
+
+    def get_unexpected(self, severity, messages):
+        """Get the messages that are not in the whitelist.
+
+        Args:
+            severity (str): Severity of the messages.
+            messages (list): Log messages.
+
+        Returns:
+            list: Unexpected messages.
+        """
+        return [message for message in messages if self.match(severity, message) is None]
+
+    def get_unmatched(self, severity=None):
+        """Get the whitelist regexes that have not matched any message yet.
+
+        Args:
+            severity (str): Severity of the whitelist. Default None, to get the regexes of all the severities.
+
+        Returns:
+            list or dict: Unmatched regexes of the severity, or of every severity if it is not specified.
+        """
+        if severity is None:
+            return {severity: self.get_unmatched(severity) for severity in self.known_messages}
+
+        return [regex for regex, matches in zip(self.known_messages[severity], self.matches[severity]) if not matches]
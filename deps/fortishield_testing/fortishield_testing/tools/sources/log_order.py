@@ -0,0 +1,178 @@
+# Copyright (C) 2015-2022, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+import os
+import re
+from multiprocessing import Pool
+
+from yaml import safe_load
+
+
+class LogSequence:
+    """Expected order of the logs of a task, compiled into a table of patterns per state.
+
+    The sequence is defined as a tree whose nodes have three parameters: `log_id`, `parent` and `tag`. The tag of the
+    root node is not used, the tags of the rest of nodes are regexes searched in the logs. Every node with children is
+    a state, and after a leaf node the sequence goes back to the root.
+
+    Args:
+        nodes (list): List of dicts, each one with the parameters of a tree node: log_id, parent, tag.
+
+    Attributes:
+        root (str): ID of the root node.
+        transitions (dict): Compiled tag, tag and next state of every child of every state, in definition order.
+    """
+
+    def __init__(self, nodes):
+        children = {}
+        self.root = None
+        for node in nodes:
+            if node['parent'] is None:
+                self.root = node['log_id']
+            else:
+                children.setdefault(node['parent'], []).append(node)
+
+        if self.root is None:
+            raise ValueError('The log sequence does not have a root node')
+
+        self.transitions = {state: [(re.compile(child['tag']), child['tag'],
+                                     child['log_id'] if child['log_id'] in children else self.root)
+                                    for child in state_children]
+                            for state, state_children in children.items()}
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a log sequence from a YAML file.
+
+        Args:
+            path (str): YAML file path.
+
+        Returns:
+            LogSequence: Compiled log sequence.
+        """
+        with open(path) as sequence_file:
+            return cls(safe_load(sequence_file))
+
+    def next_state(self, state, log):
+        """Get the state reached from a state after a log.
+
+        Args:
+            state (str): Current state.
+            log (str): Log message.
+
+        Returns:
+            str: Next state, or None if the log is not expected in the current state.
+        """
+        for pattern, _, next_state in self.transitions.get(state, []):
+            if pattern.search(log):
+                return next_state
+
+        return None
+
+    def expected_logs(self, state):
+        """Get the tags of the logs expected in a state.
+
+        Args:
+            state (str): Current state.
+
+        Returns:
+            list: Expected tags.
+        """
+        return [tag for _, tag, _ in self.transitions.get(state, [])]
+
+
+def load_log_sequences(data_path):
+    """Load all the log sequences of a folder.
+
+    The log type of every sequence is its file name without extension, replacing the underscores by spaces.
+
+    Args:
+        data_path (str): Path of the folder with the YAML files.
+
+    Returns:
+        dict: Log sequence of every log type.
+    """
+    return {' '.join(filename.split('.')[0].split('_')): LogSequence.from_file(os.path.join(data_path, filename))
+            for filename in os.listdir(data_path)}
+
+
+class LogOrderChecker:
+    """Check that the logs of every node follow their expected sequences, reading every log file once.
+
+    Every line matching `log_format` is checked against the sequence of its log type and node. When a log is not
+    expected, an error is recorded and the rest of logs of that type and node are not checked anymore.
+
+    Args:
+        sequences (dict): Log sequence of every log type.
+        log_format (str): Regex of the checked lines, with the named groups `log_type` and `log`, and optionally
+            `node`.
+        node_parser (callable): Function that gets the node name from the `node` group of a line, or None to keep the
+            node of the previous line. Default None, to use the node of the file.
+        allowed_logs (list): Texts of the logs that are ignored when they are not expected. Default None
+
+    Examples:
+        >>> checker = LogOrderChecker(load_log_sequences('data'), r'.* \\[(?P<log_type>Integrity sync)] (?P<log>.*)')
+        >>> errors = checker.check_files({'worker_1/logs/cluster.log': 'worker_1'})
+    """
+
+    def __init__(self, sequences, log_format, node_parser=None, allowed_logs=None):
+        self.sequences = sequences
+        self.log_format = re.compile(log_format)
+        self.node_parser = node_parser
+        self.allowed_logs = allowed_logs or []
+
+    def check_file(self, log_file, node=None):
+        """Check the logs order of a file.
+
+        Args:
+            log_file (str): Log file path.
+            node (str): Node name of the file logs. Default None
+
+        Returns:
+            list: Errors found, dicts with the `node`, `log_type`, `expected_logs`, `found_log` and `line` fields.
+        """
+        states = {}
+        errors = []
+        failed = set()
+
+        with open(log_file, errors='replace') as log:
+            for line in log:
+                result = self.log_format.search(line)
+                if not result:
+                    continue
+
+                if self.node_parser is not None:
+                    node = self.node_parser(result.group('node')) or node
+
+                log_type = result.group('log_type')
+                if log_type not in self.sequences or (node, log_type) in failed:
+                    continue
+
+                sequence = self.sequences[log_type]
+                state = states.get((node, log_type), sequence.root)
+                next_state = sequence.next_state(state, result.group('log'))
+
+                if next_state is not None:
+                    states[(node, log_type)] = next_state
+                elif not any(allowed_log in result.group('log') for allowed_log in self.allowed_logs):
+                    errors.append({'node': node, 'log_type': log_type, 'expected_logs': sequence.expected_logs(state),
+                                   'found_log': result.group('log'), 'line': result.group(0)})
+                    failed.add((node, log_type))
+
+        return errors
+
+    def check_files(self, log_files, processes=None):
+        """Check the logs order of several files in parallel.
+
+        Args:
+            log_files (dict): Node name of every log file path.
+            processes (int): Number of worker processes. Default one per CPU core.
+
+        Returns:
+            dict: Errors found in every log file, see `check_file`.
+        """
+        if len(log_files) <= 1 or processes == 1:
+            return {log_file: self.check_file(log_file, node) for log_file, node in log_files.items()}
+
+        with Pool(min(processes or os.cpu_count() or 1, len(log_files))) as pool:
+            return dict(zip(log_files, pool.starmap(self.check_file, log_files.items())))
@@ -5,10 +5,18 @@ import os
 import re
 import numpy as np
 import pandas as pd
+from collections import deque
 from datetime import datetime
 import logging
 from itertools import groupby
 from mmap import ACCESS_READ, mmap
+from multiprocessing import Pool
+
+TIMESTAMP_REGEX = re.compile(r"^(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})")
+KEEP_ALIVE_REGEX = re.compile(r"(\d{4}\/\d{2}\/\d{2} \d{2}:\d{2}:\d{2}) fortishield\-remoted.* inserting "
+                              r"'(.*)\|(.*)\|(.*)\|(.*)\|(.* \[.*\].*)\n(.*)\n.*\"_agent_ip\":(\S+)")
+# Number of lines of a keep-alive log
+KEEP_ALIVE_LINES = 3
 
 
 class LogAnalyzer:
@@ -66,19 +74,95 @@ class LogAnalyzer:
             return error_lines
 
     @staticmethod
-    def get_error_logs_hosts(log_dict):
+    def scan_log_file(log_path):
+        """Gather all the information needed from a log file in a single pass.
+
+        The lines are classified by severity, the keep-alive logs are extracted and the last timestamp is tracked, all
+        while the file is read line by line.
+
+        Args:
+            log_path (str): Log path.
+
+        Returns:
+            dict: Lines of every error code (`errors`), agent and timestamp tuples of the keep-alive logs
+                (`keep_alives`) and last timestamp of the file (`last_timestamp`).
+        """
+        errors = {error_code: [] for error_code in LogAnalyzer.error_codes}
+        error_tokens = [(error_code, f"{error_code}:") for error_code in LogAnalyzer.error_codes]
+        keep_alives = []
+        last_timestamp = None
+        # Last lines read, a keep-alive log starts in the first one
+        window = deque(maxlen=KEEP_ALIVE_LINES)
+        skip_lines = 0
+
+        with open(log_path, errors='replace') as log:
+            for line in log:
+                line = line[:-1] if line.endswith('\n') else line
+
+                lowercase_line = line.lower()
+                for error_code, token in error_tokens:
+                    if token in lowercase_line:
+                        errors[error_code].append(line)
+
+                if line[:1].isdigit() and TIMESTAMP_REGEX.match(line):
+                    last_timestamp = line
+
+                window.append(line)
+                if skip_lines > 0:
+                    skip_lines -= 1
+                elif len(window) == KEEP_ALIVE_LINES and ' inserting ' in window[0]:
+                    match = KEEP_ALIVE_REGEX.search('\n'.join(window))
+                    if match and match.start() < len(window[0]):
+                        keep_alives.append((match.group(1), match.group(3)))
+                        skip_lines = KEEP_ALIVE_LINES - 1
+
+        if last_timestamp is not None:
+            last_timestamp = TIMESTAMP_REGEX.match(last_timestamp).group(1)
+
+        return {'errors': errors, 'keep_alives': keep_alives, 'last_timestamp': last_timestamp}
+
+    @staticmethod
+    def scan_log_files(log_paths, processes=None):
+        """Scan several log files in parallel, see `scan_log_file`.
+
+        Args:
+            log_paths (list): Log paths.
+            processes (int): Number of worker processes. Default one per CPU core.
+
+        Returns:
+            dict: Scan of every log path.
+        """
+        # Start with the biggest files, so the workers finish at the same time
+        log_paths = sorted(set(log_paths), key=os.path.getsize, reverse=True)
+        if len(log_paths) <= 1 or processes == 1:
+            return {log_path: LogAnalyzer.scan_log_file(log_path) for log_path in log_paths}
+
+        with Pool(min(processes or os.cpu_count() or 1, len(log_paths))) as pool:
+            return dict(zip(log_paths, pool.map(LogAnalyzer.scan_log_file, log_paths, chunksize=1)))
+
+    @staticmethod
+    def get_error_logs_hosts(log_dict, log_scans=None, processes=None):
         """Get all the error/warning/critical logs of the logs dictionary.
 
         Args:
             log_dict (dict): Dictionary with the name of the host and the log path.
+            log_scans (dict): Scans of the log files, see `scan_log_files`. Default None, to scan them now.
+            processes (int): Number of worker processes used to scan the log files.
         """
+        log_paths = [log_path for host_log in log_dict for log_path in host_log['logs'].values()
+                     if os.path.exists(log_path)]
+        if log_scans is None:
+            log_scans = LogAnalyzer.scan_log_files(log_paths, processes)
+
         error_dict = {'critical': [], 'error': [], 'warning': []}
         for type in LogAnalyzer.error_codes:
             for host_log in log_dict:
                 error_list_host = []
                 for host_name, log_path in host_log['logs'].items():
                     if os.path.exists(log_path):
-                        host_error = LogAnalyzer.get_error_log_file(log_path, type)
+                        # Remove the timestamp to get the unique logs
+                        host_error = dict.fromkeys(' '.join(error_line.split()[2:])
+                                                   for error_line in log_scans[log_path]['errors'][type])
                         if host_error:
                             error_list_host += \
                                               [f"[{host_name}] " + host_error_line for host_error_line in host_error]
@@ -87,78 +171,120 @@ class LogAnalyzer:
         return error_dict
 
     @staticmethod
-    def keep_alive_log_parser(log_files):
+    def keep_alive_log_parser(log_files, log_scans=None, processes=None):
         """Get keep-alive information of the manager log.
 
         Args:
             log_files (list): List of manager logs to gather agent connection information.
+            log_scans (dict): Scans of the log files, see `scan_log_files`. Default None, to scan them now.
+            processes (int): Number of worker processes used to scan the log files.
         """
-        keep_alive_regex = '(\d{4}\/\d{2}\/\d{2} \d{2}:\d{2}:\d{2}) fortishield\-remoted.* inserting ' + \
-                           '\'(.*)\|(.*)\|(.*)\|(.*)\|(.* \[.*\].*)\n(.*)\n.*"_agent_ip":(\S+)'
+        log_paths = [log_file['logs']['ossec.log'] for log_file in log_files]
+        if log_scans is None:
+            log_scans = LogAnalyzer.scan_log_files(log_paths, processes)
 
         keep_alives = {}
-        for log_file in log_files:
-            regex = re.compile(rf"{keep_alive_regex}", re.MULTILINE)
-
-            with open(log_file['logs']['ossec.log']) as log:
-                for match in regex.finditer(log.read()):
-                    if match.group(3) not in keep_alives:
-                        keep_alives[match.group(3)] = {"n_keep_alive": 1, "max_difference": 0, "mean_difference": 0,
-                                                       "last_keep_alive": match.group(1),
-                                                       "first_keep_alive": match.group(1)}
-                    else:
-                        keep_alives[match.group(3)]["n_keep_alive"] += 1
-
-                        last_keep_alive_datetime = datetime.strptime(keep_alives[match.group(3)]["last_keep_alive"],
-                                                                     '%Y/%m/%d %H:%M:%S')
-                        recent_keep_alive_datetime = datetime.strptime(match.group(1), '%Y/%m/%d %H:%M:%S')
-
-                        if keep_alives[match.group(3)]["max_difference"] < \
-                                abs(recent_keep_alive_datetime - last_keep_alive_datetime).seconds:
-                            keep_alives[match.group(3)]["max_difference"] = \
-                                abs(recent_keep_alive_datetime - last_keep_alive_datetime).seconds
-
-                        keep_alives[match.group(3)]["mean_difference"] += \
-                            abs(recent_keep_alive_datetime - last_keep_alive_datetime).seconds
-
-                        keep_alives[match.group(3)]["last_keep_alive"] = match.group(1)
-
-                last_timestamp = None
-                log.seek(0)
-                log_lines = log.readlines()
-                for line in reversed(log_lines):
-                    last_log_line = line
-                    timestamp = LogAnalyzer.get_log_timestamp(last_log_line)
-                    if timestamp:
-                        last_timestamp = timestamp
-                        break
-
-            for agent in keep_alives.keys():
-                # Calculate means
-                keep_alives[agent]["mean_difference"] = \
-                    keep_alives[agent]["mean_difference"]/keep_alives[agent]["n_keep_alive"]
-
-                # Calculate last keep alive
-                last_keep_alive = datetime.strptime(keep_alives[agent]['last_keep_alive'], '%Y/%m/%d %H:%M:%S')
-                keep_alives[agent] = \
-                    {**keep_alives[agent], **{'remainder': abs(last_timestamp - last_keep_alive).seconds}}
+        last_timestamp = None
+        for log_path in log_paths:
+            for timestamp, agent in log_scans[log_path]['keep_alives']:
+                if agent not in keep_alives:
+                    keep_alives[agent] = {"n_keep_alive": 1, "max_difference": 0, "mean_difference": 0,
+                                          "last_keep_alive": timestamp, "first_keep_alive": timestamp}
+                else:
+                    keep_alives[agent]["n_keep_alive"] += 1
+
+                    last_keep_alive_datetime = datetime.strptime(keep_alives[agent]["last_keep_alive"],
+                                                                 '%Y/%m/%d %H:%M:%S')
+                    recent_keep_alive_datetime = datetime.strptime(timestamp, '%Y/%m/%d %H:%M:%S')
+                    difference = abs(recent_keep_alive_datetime - last_keep_alive_datetime).seconds
+
+                    if keep_alives[agent]["max_difference"] < difference:
+                        keep_alives[agent]["max_difference"] = difference
+
+                    keep_alives[agent]["mean_difference"] += difference
+                    keep_alives[agent]["last_keep_alive"] = timestamp
+
+            if log_scans[log_path]['last_timestamp'] is not None:
+                last_timestamp = datetime.strptime(log_scans[log_path]['last_timestamp'], '%Y/%m/%d %H:%M:%S')
+
+        for agent in keep_alives.keys():
+            # Calculate means
+            keep_alives[agent]["mean_difference"] = \
+                keep_alives[agent]["mean_difference"]/keep_alives[agent]["n_keep_alive"]
+
+            # Calculate last keep alive
+            last_keep_alive = datetime.strptime(keep_alives[agent]['last_keep_alive'], '%Y/%m/%d %H:%M:%S')
+            keep_alives[agent] = \
+                {**keep_alives[agent], **{'remainder': abs(last_timestamp - last_keep_alive).seconds}}
 
         keep_alives_report = {'keep_alives': keep_alives}
         return keep_alives_report
 
 
+class StatisticsCache:
+    """In-memory columnar cache of the statistics CSV files.
+
+    Every CSV file is parsed only once while it is not modified. Its numeric columns are kept as NumPy arrays, keyed by
+    path and modification time, so the same file can be analyzed by several reports without reading it again.
+    """
+
+    def __init__(self):
+        self._files = {}
+
+    def _get_file(self, path):
+        """Get the cached dataframe and columns of a file, parsing it if it is new or was modified."""
+        mtime = os.stat(path).st_mtime_ns
+        cached_file = self._files.get(path)
+        if cached_file is None or cached_file['mtime'] != mtime:
+            cached_file = {'mtime': mtime, 'dataframe': pd.read_csv(path), 'columns': {}}
+            self._files[path] = cached_file
+        return cached_file
+
+    def read_csv(self, path):
+        """Get the dataframe of a statistics file.
+
+        Args:
+            path (str): Statistics CSV file path.
+
+        Returns:
+            pandas.DataFrame: Statistics of the file.
+        """
+        return self._get_file(path)['dataframe']
+
+    def get_columns(self, path, fields):
+        """Get the values of several fields of a statistics file.
+
+        Args:
+            path (str): Statistics CSV file path.
+            fields (list): Fields to get.
+
+        Returns:
+            numpy.ndarray: Matrix of float values, with a row per sample and a column per field.
+        """
+        cached_file = self._get_file(path)
+        columns = cached_file['columns']
+        for field in fields:
+            if field not in columns:
+                columns[field] = cached_file['dataframe'][field].to_numpy(dtype=float)
+
+        return np.column_stack([columns[field] for field in fields])
+
+
 class StatisticsAnalyzer:
     """This class group several statics methods to gather specific information from Fortishield statistics."""
 
     @staticmethod
-    def calculate_values(statistis_files, fields):
+    def calculate_values(statistis_files, fields, cache=None):
         """Calculate statistical values of the specified files.
 
+        The mean, minimum, maximum and regression coefficient of every field are calculated for all the files at once.
+
         Args:
             statistis_files (list): List of statistics csv files.
             fields (list): List of fields to calculate certain statistical values.
+            cache (StatisticsCache): Cache of the statistics files. Default None, to read them now.
         """
-        n_stats = len(statistis_files)
+        cache = StatisticsCache() if cache is None else cache
         mean_fields = {}
 
         for field in fields:
@@ -173,38 +299,45 @@ class StatisticsAnalyzer:
             mean_fields['max_reg_cof_' + field] = None
             mean_fields['min_reg_cof_' + field] = None
 
-        for statistic in statistis_files:
-            for field in fields:
-                dataframe = pd.read_csv(statistic['path'])
-                mean = dataframe[field].mean()
-                max = dataframe[field].max()
-                min = dataframe[field].min()
-
-                mean_fields['max_' + field] = float(max) if not mean_fields['max_' + field] or \
-                    max > mean_fields['max_' + field] else float(mean_fields['max_' + field])
-
-                mean_fields['min_' + field] = float(min) if not mean_fields['min_' + field] or \
-                    min < mean_fields['min_' + field] else float(mean_fields['min_' + field])
-
-                mean_fields['max_mean_' + field] = float(mean) if not mean_fields['max_mean_' + field] or \
-                    mean > mean_fields['max_mean_' + field] else float(mean_fields['max_mean_' + field])
-
-                mean_fields['min_mean_' + field] = float(mean) if not mean_fields['min_mean_' + field] or \
-                    mean < mean_fields['min_mean_' + field] else \
-                    float(mean_fields['min_mean_' + field])
-
-                mean_fields['mean_' + field] += float(mean)
-
-                reg_cof = float(np.polyfit(range(len(dataframe)), list(dataframe[field]), 1)[0])
-                mean_fields['mean_reg_cof_' + field] += reg_cof
-                mean_fields['max_reg_cof_' + field] = float(reg_cof) if not mean_fields['max_reg_cof_' + field] or \
-                    reg_cof > mean_fields['max_reg_cof_' + field] else float(mean_fields['max_reg_cof_' + field])
-                mean_fields['min_reg_cof_' + field] = float(reg_cof) if not mean_fields['min_reg_cof_' + field] or \
-                    reg_cof < mean_fields['min_reg_cof_' + field] else float(mean_fields['min_reg_cof_' + field])
-
-        for field in fields:
-            mean_fields['mean_' + field] = mean_fields['mean_' + field] / n_stats
-            mean_fields['mean_reg_cof_' + field] = mean_fields['mean_reg_cof_' + field] / n_stats
+        values = [cache.get_columns(statistic['path'], fields) for statistic in statistis_files]
+        values = [file_values for file_values in values if len(file_values)]
+        if not values:
+            return mean_fields
+
+        # All the files are concatenated, every file is a segment of rows
+        lengths = np.array([len(file_values) for file_values in values])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        values = np.concatenate(values)
+        samples = np.concatenate([np.arange(length) for length in lengths]).astype(float)[:, np.newaxis]
+
+        valid = ~np.isnan(values)
+        samples = np.where(valid, samples, 0)
+        count = np.add.reduceat(valid.astype(float), starts)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.add.reduceat(np.where(valid, values, 0), starts) / count
+            maxs = np.fmax.reduceat(values, starts)
+            mins = np.fmin.reduceat(values, starts)
+
+            # Least squares slope of every file and field, using centered values to avoid losing precision
+            centered_samples = np.where(valid, samples - np.repeat(np.add.reduceat(samples, starts) / count, lengths,
+                                                                   axis=0), 0)
+            centered_values = np.where(valid, values - np.repeat(means, lengths, axis=0), 0)
+            reg_cofs = np.add.reduceat(centered_samples * centered_values, starts) / \
+                np.add.reduceat(centered_samples ** 2, starts)
+        reg_cofs[count < 2] = 0
+
+        for index, field in enumerate(fields):
+            mean_fields['mean_' + field] = float(means[:, index].mean())
+            mean_fields['max_mean_' + field] = float(means[:, index].max())
+            mean_fields['min_mean_' + field] = float(means[:, index].min())
+
+            mean_fields['min_' + field] = float(mins[:, index].min())
+            mean_fields['max_' + field] = float(maxs[:, index].max())
+
+            mean_fields['mean_reg_cof_' + field] = float(reg_cofs[:, index].mean())
+            mean_fields['max_reg_cof_' + field] = float(reg_cofs[:, index].max())
+            mean_fields['min_reg_cof_' + field] = float(reg_cofs[:, index].min())
 
         return mean_fields
 
@@ -212,12 +345,14 @@ class StatisticsAnalyzer:
 class FortishieldStatisticsAnalyzer():
     """This class group several statics methods to gather specific information from Fortishield statistics."""
     @staticmethod
-    def analyze_agentd_statistics(agentd_statistics_files):
+    def analyze_agentd_statistics(agentd_statistics_files, cache=None):
         """Create a report for fortishield-agentd daemon.
 
         Args:
             agentd_statistics_files (dict): Agentd statistics files.
+            cache (StatisticsCache): Cache of the statistics files. Default None, to read them now.
         """
+        cache = StatisticsCache() if cache is None else cache
         # Status
         n_stats = len(agentd_statistics_files)
         agentd_report = {
@@ -236,7 +371,7 @@ class FortishieldStatisticsAnalyzer():
 
         status_dataframe = pd.DataFrame()
         for agentd_stat in agentd_statistics_files:
-            agent_dataframe = pd.read_csv(agentd_stat['path'])
+            agent_dataframe = cache.read_csv(agentd_stat['path'])
             status_dataframe = agent_dataframe['status']
 
             begin_status_value = status_dataframe.iloc[0]
@@ -272,21 +407,23 @@ class FortishieldStatisticsAnalyzer():
         agentd_report['mean_status_change_count'] /= n_stats
 
         agentd_report = {**agentd_report, **(StatisticsAnalyzer.calculate_values(agentd_statistics_files,
-                         ['msg_sent', 'msg_count', 'msg_buffer']))}
+                         ['msg_sent', 'msg_count', 'msg_buffer'], cache))}
 
         return agentd_report
 
-    def analyze_remoted_statistics(remoted_statistics_files):
+    @staticmethod
+    def analyze_remoted_statistics(remoted_statistics_files, cache=None):
         """Create a report for fortishield-remoted daemon.
 
         Args:
             agentd_statistics_files (dict): Remoted statistics files.
+            cache (StatisticsCache): Cache of the statistics files. Default None, to read them now.
         """
         remoted_report = StatisticsAnalyzer.calculate_values(remoted_statistics_files,
                                                              ['queue_size', 'total_queue_size', 'tcp_sessions',
                                                               'evt_count', 'ctrl_msg_count', 'discarded_count',
                                                               'queued_msgs', 'sent_bytes', 'recv_bytes',
-                                                              'dequeued_after_close'])
+                                                              'dequeued_after_close'], cache)
         return remoted_report
 
 
@@ -298,6 +435,7 @@ class ReportGenerator:
 
     Args:
         target (str): Artifact path.
+        processes (int): Number of worker processes used to scan the log files. Default one per CPU core.
 
     Attributes:
         artifact_path (str): Root artifact path.
@@ -308,8 +446,11 @@ class ReportGenerator:
         n_workers (str): Number of workers nodes.
         n_agents (str): Number of agents.
         cluster_environment (boolean): Cluster or single node environment.
+        processes (int): Number of worker processes used to scan the log files.
+        log_scans (dict): Scans of the log files of every host, gathered once by `make_report`.
+        statistics_cache (StatisticsCache): Cache of the statistics and metrics files shared by all the reports.
     """
-    def __init__(self, artifact_path):
+    def __init__(self, artifact_path, processes=None):
         self.daemons_manager = ['fortishield-modulesd', 'fortishield-monitord', 'fortishield-remoted', 'fortishield-authd',
                                 'fortishield-db', 'fortishield-syscheckd', 'fortishield-analysisd']
 
@@ -371,6 +512,9 @@ class ReportGenerator:
             self.cluster_environment = False
 
         self.n_agents = len(os.listdir(agents_path))
+        self.processes = processes
+        self.log_scans = None
+        self.statistics_cache = StatisticsCache()
 
     def get_instances_artifacts(self, component, hosts_regex=".*"):
         """Get the artifact path for specified hosts_regex
@@ -459,7 +603,8 @@ class ReportGenerator:
         """
         agentd_report = FortishieldStatisticsAnalyzer.analyze_agentd_statistics(self.get_instances_statistics('fortishield-agentd',
                                                                           component,
-                                                                          hosts_regex))
+                                                                          hosts_regex),
+                                                                          self.statistics_cache)
         return agentd_report
 
     def remoted_report(self, component='managers', hosts_regex='.*'):
@@ -469,13 +614,14 @@ class ReportGenerator:
             component (str): Fortishield installation type (agents/managers/all).
             hosts_regex (str): Regex to filter by hostname.
         """
-        remoted_report = FortishieldStatisticsAnalyzer.analyze_remoted_statistics(self.get_instances_statistics(
-                                                                                                        'fortishield-remoted',
-                                                                                                        component,
-                                                                                                        hosts_regex))
+        remoted_statistics = self.get_instances_statistics('fortishield-remoted', component, hosts_regex)
+        remoted_report = FortishieldStatisticsAnalyzer.analyze_remoted_statistics(remoted_statistics,
+                                                                                  self.statistics_cache)
         remoted_report = {**remoted_report, **LogAnalyzer.keep_alive_log_parser(self.get_instances_logs(log='ossec.log',
                                                                                 component=component,
-                                                                                hosts_regex=hosts_regex))}
+                                                                                hosts_regex=hosts_regex),
+                                                                                log_scans=self.log_scans,
+                                                                                processes=self.processes)}
 
         return remoted_report
 
@@ -494,7 +640,8 @@ class ReportGenerator:
         for daemon in metric_daemons:
             metric_csv = self.get_instances_process_metrics(daemon, component, hosts_regex)
 
-            metric_total[daemon] = StatisticsAnalyzer.calculate_values(metric_csv, self.metric_fields)
+            metric_total[daemon] = StatisticsAnalyzer.calculate_values(metric_csv, self.metric_fields,
+                                                                        self.statistics_cache)
 
         return metric_total
 
@@ -503,10 +650,16 @@ class ReportGenerator:
         report = {}
         report['metadata'] = {'n_agents': self.n_agents, 'n_workers': self.n_workers}
 
-        report['agents'] = LogAnalyzer.get_error_logs_hosts(log_dict=self.get_instances_logs(log='all',
-                                                                                             component='agents'))
-        report['managers'] = LogAnalyzer.get_error_logs_hosts(log_dict=self.get_instances_logs(log='all',
-                                                                                               component='managers'))
+        agents_logs = self.get_instances_logs(log='all', component='agents')
+        managers_logs = self.get_instances_logs(log='all', component='managers')
+
+        # Every log file is read only once, its scan is used by all the reports
+        self.log_scans = LogAnalyzer.scan_log_files([log_path for host_log in agents_logs + managers_logs
+                                                     for log_path in host_log['logs'].values()
+                                                     if os.path.exists(log_path)], self.processes)
+
+        report['agents'] = LogAnalyzer.get_error_logs_hosts(log_dict=agents_logs, log_scans=self.log_scans)
+        report['managers'] = LogAnalyzer.get_error_logs_hosts(log_dict=managers_logs, log_scans=self.log_scans)
         try:
             report['agents']['fortishield-agentd'] = self.agentd_report()
         except Exception as e:
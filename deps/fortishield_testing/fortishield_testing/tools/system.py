@@ -2,12 +2,15 @@
 # Created by Fortishield, Inc. <security@khulnasoft.com>.
 # This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
 
+import base64
 import json
 import tempfile
 import sys
 import os
 import logging
+import shlex
 import xml.dom.minidom as minidom
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Union, List
 import testinfra
 import yaml
@@ -22,6 +25,47 @@ from ansible.vars.manager import VariableManager
 logger = logging.getLogger('testinfra')
 logger.setLevel(logging.CRITICAL)
 
+# Maximum number of hosts managed at the same time by the concurrent operations
+DEFAULT_MAX_WORKERS = 16
+
+
+class HostOperationError(Exception):
+    """Error raised when a concurrent operation fails in some hosts.
+
+    Args:
+        operation (str): Name of the operation.
+        results (dict): Results of every host, see `HostManager.run_on_hosts`.
+    """
+
+    def __init__(self, operation, results):
+        self.results = results
+        failed_hosts = ', '.join(f"{host} ({error!r})" for host, error in get_failed_hosts(results).items())
+        super().__init__(f"{operation} failed in hosts: {failed_hosts}")
+
+
+def get_failed_hosts(results):
+    """Get the hosts where a concurrent operation failed.
+
+    Args:
+        results (dict): Results of every host, see `HostManager.run_on_hosts`.
+
+    Returns:
+        dict: Error of every failed host.
+    """
+    return {host: result['error'] for host, result in results.items() if result['error'] is not None}
+
+
+def quote_powershell(value):
+    """Quote a string as a PowerShell literal, escaping its single quotes.
+
+    Args:
+        value (str): String to quote.
+
+    Returns:
+        str: Single quoted literal.
+    """
+    return "'" + value.replace("'", "''") + "'"
+
 
 class HostManager:
     """This class is an extensible remote host management interface. Within this we have multiple functions to modify
@@ -130,6 +174,95 @@ class HostManager:
         """
         return testinfra.get_host(f"ansible://{host}?ansible_inventory={self.inventory_path}")
 
+    def run_on_hosts(self, operation, hosts, *args, max_workers=None, timeout=None, raise_on_error=False, **kwargs):
+        """Run an operation on several hosts at the same time, using a bounded pool of threads.
+
+        The operation is called once per host, with the host as first argument followed by `args` and `kwargs`. The
+        hosts still running when the timeout expires are reported as failed with a `TimeoutError`, but their calls are
+        not interrupted.
+
+        Args:
+            operation (str or callable): Name of a HostManager method, or function that receives the host.
+            hosts (list): Hostnames. The repeated ones are only run once.
+            max_workers (int, optional): Maximum number of hosts run at the same time. Default `DEFAULT_MAX_WORKERS`
+            timeout (float, optional): Maximum seconds to wait for all the hosts. Default `None` (no limit)
+            raise_on_error (bool, optional): Raise a `HostOperationError` if the operation fails in any host.
+                Default `False`
+
+        Returns:
+            dict: `result` and `error` (exception raised, or None) of every host, in the same order as `hosts`.
+
+        Example:
+            results = host_manager.run_on_hosts('clear_file', host_manager.get_group_hosts('managers'),
+                                                file_path='/var/ossec/logs/ossec.log')
+        """
+        operation_name = operation if isinstance(operation, str) else getattr(operation, '__name__', str(operation))
+        operation = getattr(self, operation) if isinstance(operation, str) else operation
+        hosts = list(dict.fromkeys(hosts))
+        results = {host: {'result': None, 'error': None} for host in hosts}
+
+        if hosts:
+            executor = ThreadPoolExecutor(max_workers=min(max_workers or DEFAULT_MAX_WORKERS, len(hosts)))
+            try:
+                futures = {executor.submit(operation, host, *args, **kwargs): host for host in hosts}
+                wait(futures, timeout=timeout)
+                for future, host in futures.items():
+                    if not future.done():
+                        future.cancel()
+                        results[host]['error'] = TimeoutError(f"{operation_name} did not finish in {timeout} seconds")
+                    elif future.exception() is not None:
+                        results[host]['error'] = future.exception()
+                    else:
+                        results[host]['result'] = future.result()
+            finally:
+                executor.shutdown(wait=False)
+
+        for host, error in get_failed_hosts(results).items():
+            logging.error(f"{operation_name} failed in host {host}: {error!r}")
+
+        if raise_on_error and get_failed_hosts(results):
+            raise HostOperationError(operation_name, results)
+
+        return results
+
+    def run_in_stages(self, operation, stages, *args, max_workers=None, timeout=None, stop_on_error=True,
+                      raise_on_error=False, **kwargs):
+        """Run an operation on several groups of hosts, one group after another.
+
+        The hosts of every stage run at the same time (see `run_on_hosts`), and a stage does not start until the
+        previous one has finished, so ordering constraints like "masters before workers" can be expressed as
+        `['master', 'workers']`.
+
+        Args:
+            operation (str or callable): Name of a HostManager method, or function that receives the host.
+            stages (list): Group patterns or lists of hostnames, in execution order.
+            max_workers (int, optional): Maximum number of hosts run at the same time. Default `DEFAULT_MAX_WORKERS`
+            timeout (float, optional): Maximum seconds to wait for the hosts of every stage. Default `None` (no limit)
+            stop_on_error (bool, optional): Do not run the next stages if the operation fails in any host.
+                Default `True`
+            raise_on_error (bool, optional): Raise a `HostOperationError` if the operation fails in any host.
+                Default `False`
+
+        Returns:
+            dict: `result` and `error` of every host run, see `run_on_hosts`.
+
+        Example:
+            host_manager.run_in_stages('control_service', ['master', 'workers', 'agents'], state='restarted')
+        """
+        results = {}
+        for stage in stages:
+            hosts = self.get_group_hosts(stage) if isinstance(stage, str) else stage
+            results.update(self.run_on_hosts(operation, hosts, *args, max_workers=max_workers, timeout=timeout,
+                                             **kwargs))
+            if stop_on_error and get_failed_hosts(results):
+                break
+
+        if raise_on_error and get_failed_hosts(results):
+            operation_name = operation if isinstance(operation, str) else getattr(operation, '__name__', str(operation))
+            raise HostOperationError(operation_name, results)
+
+        return results
+
     def truncate_file(self, host: str, filepath: str):
         ansible_command = 'file'
         if 'os_name' in self.get_host_variables(host):
@@ -243,6 +376,60 @@ class HostManager:
 
         return result['stdout']
 
+    def get_files_increment(self, host: str, files_position: dict):
+        """Get the content appended to several files since the last read, with a single command in the host.
+
+        Every file is read from its last position, unless it has been rotated (its identifier has changed) or truncated
+        (it is smaller than the last position), in which case it is read from the beginning. The content is transferred
+        base64 encoded, so the positions are always byte positions.
+
+        Args:
+            host (str): Hostname
+            files_position (dict): Last position of every file path, as a tuple with the file identifier (the inode in
+                Linux and Unix, the creation time in Windows) and the byte offset. Use `(None, 0)` to read a file from
+                the start.
+
+        Returns:
+            dict: New position and content of every file path, as a tuple with the file identifier, the byte offset
+                where the content starts, the new byte offset and the content (bytes). The identifier is None if the
+                file does not exist.
+
+        Example:
+            positions = {'/var/ossec/logs/ossec.log': (None, 0)}
+            for path, (file_id, start, offset, content) in get_files_increment('fortishield-master', positions).items():
+                positions[path] = (file_id, offset)
+        """
+        paths = list(files_position)
+        if 'os_name' in self.get_host_variables(host) and self.get_host_variables(host)['os_name'] == 'windows':
+            script = ''.join(
+                f"$p={quote_powershell(path)}; if (Test-Path -LiteralPath $p) {{ "
+                f"$i=(Get-Item -LiteralPath $p).CreationTimeUtc.Ticks; "
+                f"$f=[System.IO.File]::Open($p,'Open','Read','ReadWrite,Delete'); $n=$f.Length; "
+                f"$s=if (\"$i\" -eq '{file_id}' -and $n -ge {offset}) {{ {offset} }} else {{ 0 }}; "
+                f"$b=New-Object byte[] ($n-$s); [void]$f.Seek($s,'Begin'); $r=0; "
+                f"while ($r -lt $b.Length) {{ $r+=$f.Read($b,$r,$b.Length-$r) }}; $f.Close(); "
+                f"Write-Output \"$i $n $s $([Convert]::ToBase64String($b))\" }} else {{ Write-Output '- 0 0 ' }}; "
+                for path, (file_id, offset) in files_position.items())
+            output = self.get_host(host).ansible('win_shell', script, check=False)['stdout']
+        else:
+            # Inode and size with GNU stat, BSD stat, or ls and wc where stat is not available
+            script = "fstat() { stat -c '%i %s' \"$1\" 2>/dev/null || stat -f '%i %z' \"$1\" 2>/dev/null || " \
+                     "{ [ -f \"$1\" ] && echo \"$(ls -i \"$1\" | awk '{print $1}') $(wc -c < \"$1\")\"; }; }; "
+            script += ''.join(
+                f"f={shlex.quote(path)}; if st=$(fstat \"$f\"); then set -- $st; "
+                f"if [ \"$1\" = '{file_id}' ] && [ \"$2\" -ge {offset} ]; then s={offset}; else s=0; fi; "
+                f"printf '%s %s %s ' \"$1\" \"$2\" \"$s\"; tail -c +$((s + 1)) \"$f\" | head -c $(($2 - s)) | "
+                f"base64 | tr -d '\\n'; echo; else echo '- 0 0 '; fi; "
+                for path, (file_id, offset) in files_position.items())
+            output = self.get_host(host).ansible('shell', script, check=False)['stdout']
+
+        increments = {}
+        for path, line in zip(paths, output.splitlines()):
+            file_id, size, start, content = (line.strip().split(' ') + [''])[:4]
+            increments[path] = (None if file_id == '-' else file_id, int(start), int(size),
+                                base64.b64decode(content))
+
+        return increments
 
     def apply_config(self, config_yml_path: str, dest_path: str = FORTISHIELD_CONF, clear_files: list = None,
                      restart_services: list = None):
@@ -257,17 +444,18 @@ class HostManager:
         with open(config_yml_path, mode='r') as config_yml:
             config = yaml.safe_load(config_yml)
 
+        templates = self.run_on_hosts(self.get_file_content, list(config), dest_path, raise_on_error=True)
+
         parse_configurations = dict()
         for host, payload in config.items():
-            template_ossec_conf = self.get_file_content(host, dest_path).split('\n')
-            parse_configurations[host] = set_section_fortishield_conf(sections=payload['sections'],
-                                                                template=template_ossec_conf)
-
-        for host, configuration in parse_configurations.items():
-            configuration = ''.join(configuration)
+            template_ossec_conf = templates[host]['result'].split('\n')
+            configuration = ''.join(set_section_fortishield_conf(sections=payload['sections'],
+                                                                 template=template_ossec_conf))
             dom = minidom.parseString(configuration)
-            configuration = dom.toprettyxml().split('\n', 1)[1]
-            self.modify_file_content(host, dest_path, configuration)
+            parse_configurations[host] = dom.toprettyxml().split('\n', 1)[1]
+
+        def apply_host_config(host):
+            self.modify_file_content(host, dest_path, parse_configurations[host])
 
             if restart_services:
                 for service in restart_services:
@@ -276,6 +464,8 @@ class HostManager:
                 for log in clear_files:
                     self.clear_file(host=host, file_path=log)
 
+        self.run_on_hosts(apply_host_config, list(parse_configurations), raise_on_error=True)
+
     def apply_api_config(self, api_config: str or dict = None, host_list: list = None, dest_path: str = FORTISHIELD_API_CONF,
                          clear_log: bool = False):
         """Apply the API configuration described in the yaml file or in the dictionary.
@@ -671,20 +861,22 @@ class HostManager:
 
         return result
 
-    def control_environment(self, operation, group_list):
+    def control_environment(self, operation, group_list, max_workers=None):
         """
         Controls the Fortishield services on hosts in the specified groups.
 
+        The groups are handled in order, and the hosts of every group at the same time.
+
         Args:
             operation (str): The operation to perform on Fortishield services ('start', 'stop', 'restart').
             group_list (list): A list of group names whose hosts' Fortishield services should be controlled.
+            max_workers (int, optional): Maximum number of hosts handled at the same time. Default `DEFAULT_MAX_WORKERS`
 
         Example:
             control_environment('restart', ['group1', 'group2'])
         """
-        for group in group_list:
-            for host in self.get_group_hosts(group):
-                self.handle_fortishield_services(host, operation)
+        self.run_in_stages(self.handle_fortishield_services, group_list, operation, max_workers=max_workers,
+                           raise_on_error=True)
 
     def get_agents_ids(self):
         """
@@ -727,36 +919,54 @@ class HostManager:
         )
         logging.info(f"Agents removed result {result}")
 
-    def get_hosts_not_reachable(self) -> List[str]:
+    def ping_host(self, host: str):
+        """Check that a host is accessible.
+
+        Args:
+            host (str): Hostname
+
+        Raises:
+            Exception: If the host is not reachable.
+        """
+        logging.info(f"Checking host {host}...")
+        os_name = self.get_host_variables(host)['os_name']
+        if os_name == 'windows':
+            command = 'ansible.windows.win_ping'
+        else:
+            command = 'ping'
+        self.get_host(host).ansible(command, check=False)
+
+    def get_hosts_not_reachable(self, max_workers=None) -> List[str]:
         """
         Checks that all hosts provided in the inventory are accessible.
 
+        Args:
+            max_workers (int, optional): Maximum number of hosts checked at the same time. Default `DEFAULT_MAX_WORKERS`
+
         Returns:
             List[str]: List of hosts that are not reachable.
         """
-        hosts_not_reachable = []
-        for host in self.get_group_hosts('all'):
-            logging.info(f"Checking host {host}...")
-            os_name = self.get_host_variables(host)['os_name']
-            if os_name == 'windows':
-                command = 'ansible.windows.win_ping'
-            else:
-                command = 'ping'
-            try:
-                self.get_host(host).ansible(command, check=False)
-            except Exception as e:
-                logging.error(f"Error connecting to host {host}: {e}")
-                hosts_not_reachable.append(host)
+        results = self.run_on_hosts(self.ping_host, self.get_group_hosts('all'), max_workers=max_workers)
+
+        return list(get_failed_hosts(results))
 
-        return hosts_not_reachable
 
+def clean_environment(host_manager, target_files, max_workers=None):
+    """Clears a series of files on target hosts managed by a host manager.
+
+    The files of every host are cleared in order, and the hosts at the same time.
 
-def clean_environment(host_manager, target_files):
-    """Clears a series of files on target hosts managed by a host manager
     Args:
         host_manager (object): a host manager object with not None inventory_path
         target_files (dict): a dictionary of tuples, each with the host and the path of the file to clear.
+        max_workers (int, optional): Maximum number of hosts cleared at the same time. Default `DEFAULT_MAX_WORKERS`
     """
-    for target in target_files:
+    host_files = {}
+    for host, file_path in target_files:
+        host_files.setdefault(host, []).append(file_path)
+
+    def clear_host_files(host):
+        for file_path in host_files[host]:
+            host_manager.clear_file(host=host, file_path=file_path)
 
-        host_manager.clear_file(host=target[0], file_path=target[1])
+    host_manager.run_on_hosts(clear_host_files, list(host_files), max_workers=max_workers, raise_on_error=True)
@@ -67,15 +67,15 @@ class HostMonitor:
 
     def run(self, update_position=False):
         """This method creates and destroy the needed processes for the messages founded in messages_path.
-        It creates one file composer (process) for every file to be monitored in every host."""
+        It creates one file composer (process) for every host, collecting all the files monitored in it."""
         for host, payload in self.test_cases.items():
             monitored_files = {case['path'] for case in payload}
             if len(monitored_files) == 0:
                 raise AttributeError('There is no path to monitor. Exiting...')
-            for path in monitored_files:
-                output_path = f'{host}_{path.split("/")[-1]}.tmp'
-                self._file_content_collectors.append(self.file_composer(host=host, path=path, output_path=output_path))
-                logger.debug(f'Add new file composer process for {host} and path: {path}')
+            output_paths = {path: f'{host}_{path.split("/")[-1]}.tmp' for path in monitored_files}
+            self._file_content_collectors.append(self.file_composer(host=host, paths=output_paths))
+            logger.debug(f'Add new file composer process for {host} and paths: {monitored_files}')
+            for path, output_path in output_paths.items():
                 self._file_monitors.append(self._start(host=host,
                                                        payload=[block for block in payload if block["path"] == path],
                                                        path=output_path))
@@ -95,33 +95,45 @@ class HostMonitor:
         return self.result()
 
     @new_process
-    def file_composer(self, host, path, output_path):
-        """Collects the file content of the specified path in the desired host and append it to the output_path file.
-        Simulates the behavior of tail -f and redirect the output to output_path.
+    def file_composer(self, host, paths):
+        """Collects the content of the specified paths in the desired host and append it to their output_path files.
+        Simulates the behavior of tail -F and redirect the output to output_path.
+
+        Only the bytes appended since the last read are transferred, with a single command for all the paths of the
+        host in every step. Only complete lines are appended, the last partial line of every path is kept until it is
+        completed. If a file is rotated or truncated, it is collected again from the beginning.
 
         Args:
             host (str): Hostname.
-            path (str): Host file path to be collect.
-            output_path (str): Output path of the content collected from the remote host path.
+            paths (dict): Output path of the content collected from every host path.
         """
-        try:
-            truncate_file(os.path.join(self._tmp_path, output_path))
-        except FileNotFoundError:
-            pass
-        logger.debug(f'Starting file composer for {host} and path: {path}. '
-                     f'Composite file in {os.path.join(self._tmp_path, output_path)}')
-        tmp_file = os.path.join(self._tmp_path, output_path)
+        positions = {}
+        partial_lines = {}
+        for path, output_path in paths.items():
+            try:
+                truncate_file(os.path.join(self._tmp_path, output_path))
+            except FileNotFoundError:
+                pass
+            logger.debug(f'Starting file composer for {host} and path: {path}. '
+                         f'Composite file in {os.path.join(self._tmp_path, output_path)}')
+            positions[path] = (None, 0)
+            partial_lines[path] = b''
+
         while True:
-            with FileLock(tmp_file):
-                with open(tmp_file, "r+") as file:
-                    content = self.host_manager.get_file_content(host, path).split('\n')
-                    file_content = file.read().split('\n')
-                    for new_line in content:
-                        if new_line == '':
-                            continue
-                        if new_line not in file_content:
-                            file.write(f'{new_line}\n')
-                time.sleep(self._time_step)
+            for path, (file_id, start, offset, content) in self.host_manager.get_files_increment(host,
+                                                                                                  positions).items():
+                last_id, last_offset = positions[path]
+                if last_id is not None and (file_id != last_id or start < last_offset):
+                    logger.debug(f'{path} has been rotated or truncated in {host}, collecting it from the beginning')
+                    partial_lines[path] = b''
+                positions[path] = (file_id, offset)
+                complete, new_line, partial_lines[path] = (partial_lines[path] + content).rpartition(b'\n')
+                if new_line:
+                    tmp_file = os.path.join(self._tmp_path, paths[path])
+                    with FileLock(tmp_file):
+                        with open(tmp_file, 'ab') as file:
+                            file.write(complete + new_line)
+            time.sleep(self._time_step)
 
     @new_process
     def _start(self, host, payload, path, encoding=None, error_messages_per_host=None, update_position=False):
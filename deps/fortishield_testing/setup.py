@@ -47,6 +47,7 @@ scripts_list = [
     'qa-docs=fortishield_testing.scripts.qa_docs:main',
     'qa-ctl=fortishield_testing.scripts.qa_ctl:main',
     'check-files=fortishield_testing.scripts.check_files:main',
+    'benchmark-schema-validator=fortishield_testing.scripts.benchmark_schema_validator:main',
     'add-agents-client-keys=fortishield_testing.scripts.add_agents_client_keys:main',
     'unsync-agents=fortishield_testing.scripts.unsync_agents:main',
     'stress_results_comparator=fortishield_testing.scripts.stress_results_comparator:main'
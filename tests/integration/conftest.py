@@ -19,6 +19,7 @@ from fortishield_testing import ALERTS_JSON_PATH, ARCHIVES_JSON_PATH, ARCHIVES_L
 from fortishield_testing.db_interface.agent_db import update_os_info
 from fortishield_testing.db_interface.global_db import get_system, modify_system
 from fortishield_testing.logcollector import create_file_structure, delete_file_structure
+from fortishield_testing.modules.fim import latency as fim_latency
 from fortishield_testing.tools import (PREFIX, LOG_FILE_PATH, FORTISHIELD_CONF, get_service, ALERT_FILE_PATH,
                                  FORTISHIELD_LOCAL_INTERNAL_OPTIONS, AGENT_CONF, AGENT_INFO_SOCKET_PATH)
 from fortishield_testing.tools import ALERT_FILE_PATH, LOG_FILE_PATH, FORTISHIELD_CONF, FORTISHIELD_LOCAL_INTERNAL_OPTIONS, get_service
@@ -27,7 +28,8 @@ from fortishield_testing.tools import (PREFIX, LOG_FILE_PATH, FORTISHIELD_CONF,
 from fortishield_testing.tools.configuration import get_minimal_configuration, get_fortishield_conf, write_fortishield_conf
 from fortishield_testing.tools.file import (truncate_file, recursive_directory_creation, remove_file, copy, write_file,
                                       delete_path_recursively)
-from fortishield_testing.tools.monitoring import FileMonitor, QueueMonitor, SocketController, close_sockets
+from fortishield_testing.tools.monitoring import (FileMonitor, QueueMonitor, SocketController, close_sockets,
+                                             get_tail_hub)
 from fortishield_testing.tools.services import check_daemon_status, control_service, delete_dbs
 from fortishield_testing.tools.time import TimeMachine
 import fortishield_testing.tools.configuration as conf
@@ -365,6 +367,14 @@ def pytest_addoption(parser):
         type=str,
         help="pass web hook url required for shuffle integratord tests."
     )
+    parser.addoption(
+        "--fim-latency-report",
+        action="store",
+        metavar="fim_latency_report",
+        default=None,
+        type=str,
+        help="write the FIM event detection latency percentiles of every FIM mode into a JSON file."
+    )
 
 
 def pytest_configure(config):
@@ -445,6 +455,17 @@ def pytest_configure(config):
     if global_parameters.wpk_package_path:
         global_parameters.wpk_package_path = global_parameters.wpk_package_path
 
+    # Start recording the FIM detection latency if a report file is passed through command line args
+    if config.getoption("--fim-latency-report"):
+        fim_latency.start_latency_recording()
+
+
+def pytest_unconfigure(config):
+    # Write the FIM detection latency report
+    fim_latency_report = config.getoption("--fim-latency-report")
+    if fim_latency_report:
+        fim_latency.stop_latency_recording(fim_latency_report)
+
 
 def pytest_html_results_table_header(cells):
     cells.insert(4, html.th('Tier', class_='sortable tier', col='tier'))
@@ -1113,6 +1134,16 @@ def file_monitoring(request):
     logger.debug(f"Trucanted {file_to_monitor}")
 
 
+@pytest.fixture(scope='session')
+def log_tail_hub():
+    """Share a single reader thread per log file among all the `SharedFileMonitor` of the session."""
+    hub = get_tail_hub()
+
+    yield hub
+
+    hub.shutdown()
+
+
 @pytest.fixture()
 def set_fortishield_configuration(configuration):
     """Set fortishield configuration
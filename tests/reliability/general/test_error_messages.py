@@ -90,13 +90,12 @@ os_version:
     - Windows Server 2016
     - Windows Server 2019
 '''
-import json
 import os
-import re
 
 import pytest
 
-from fortishield_testing import global_parameters
+from fortishield_testing import global_parameters, logger
+from fortishield_testing.tools.sources.known_messages import KnownMessagesClassifier, get_log_daemon
 
 error_codes = ['warning', 'error', 'critical']
 known_messages_filename = 'know_messages.json'
@@ -104,14 +103,19 @@ known_messages_path = os.path.join(os.path.dirname(__file__), known_messages_fil
 
 
 target = ['agents', 'managers'] if not global_parameters.target_hosts else global_parameters.target_hosts
+known_messages_classifier = KnownMessagesClassifier.from_file(known_messages_path)
 
 
-def get_log_daemon(log_line):
-    pattern = re.compile(".*\d+\/\d+\/\d+ \d+:\d+:\d+ (.*?):")
-    if pattern.match(log_line):
-        return pattern.match(log_line).group(1)
-    else:
-        return None
+@pytest.fixture(scope='module', autouse=True)
+def report_unmatched_known_messages(record_testsuite_property):
+    """Report the known messages that have not matched any message of the checked severities."""
+    yield
+
+    for code in error_codes:
+        unmatched_messages = known_messages_classifier.get_unmatched(code)
+        if unmatched_messages:
+            logger.warning(f"{len(unmatched_messages)} known {code} messages never matched: {unmatched_messages}")
+        record_testsuite_property(f"unmatched_known_{code}_messages", unmatched_messages)
 
 
 @pytest.mark.parametrize('code', error_codes)
@@ -136,26 +140,12 @@ def test_error_messages(get_report, code, target):
         - None
     '''
     unexpected_errors = []
-    with open(known_messages_path) as f:
-        expected_error_messages = json.loads(f.read())
 
     for target_messages in get_report[target][code]:
         for error_messages in target_messages.values():
-            for error_message in error_messages:
-                target_message = True
-                if global_parameters.target_daemons:
-                    target_message = False
-                    for daemon in global_parameters.target_daemons:
-                        if get_log_daemon(error_message) == daemon:
-                            target_message = True
-                            break            
-                if target_message:
-                    known_error = False
-                    if expected_error_messages[code]:
-                        combined_known_regex = '(' + ')|('.join(expected_error_messages[code]) + ')'
-                        known_error = re.match(combined_known_regex, error_message)
-
-                    if not known_error:
-                        unexpected_errors += [error_message]
+            if global_parameters.target_daemons:
+                error_messages = [error_message for error_message in error_messages
+                                  if get_log_daemon(error_message) in global_parameters.target_daemons]
+            unexpected_errors += known_messages_classifier.get_unexpected(code, error_messages)
 
     assert not unexpected_errors, f"Unexpected error message detected {unexpected_errors}"
@@ -6,43 +6,32 @@ import os
 import re
 
 import pytest
-import treelib
-from yaml import safe_load
 
-# Configuration
-test_data_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
-logs_format = re.compile(
-    r'(.*) \[(Local agent-groups|Agent-groups send full|Agent-groups send)] (.*)')
-incorrect_order = []
-
-
-# Classes
-class LogsOrder:
-    """This class contains the logs order object."""
-
-    def __init__(self):
-        self.logs_order = {
-            ' '.join(filename.split('.')[0].split('_')): {
-                'tree': dict_to_tree(safe_load(open(os.path.join(test_data_path, filename)))),
-                'node': 'root'
-            } for filename in os.listdir(test_data_path)
-        }
+from fortishield_testing.tools.sources.log_order import LogOrderChecker, load_log_sequences
 
 
 # Functions
-def dict_to_tree(dict_tree):
-    """Convert list of dicts (nodes) into a tree data structure.
+def get_node_name(log_prefix):
+    """Get the node that generated a cluster log.
 
     Args:
-        dict_tree (list): List of dicts, each one with three parameters to create a tree node: log_id, parent, tag.
+        log_prefix (str): Text of the log before its log type.
 
     Returns:
-        Tree: tree data structure.
+        str: Node name, or None if it is not found.
     """
-    tree = treelib.Tree()
-    for tree_node in dict_tree:
-        tree.create_node(tree_node['tag'], tree_node['log_id'], parent=tree_node['parent'])
-    return tree
+    if 'Worker' in log_prefix:
+        return re.search('.*Worker (.*?)]', log_prefix).group(1)
+    elif 'Master' in log_prefix:
+        return 'Master'
+
+
+# Configuration
+test_data_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
+logs_order_checker = LogOrderChecker(
+    load_log_sequences(test_data_path),
+    r'(?P<node>.*) \[(?P<log_type>Local agent-groups|Agent-groups send full|Agent-groups send)] (?P<log>.*)',
+    node_parser=get_node_name)
 
 
 # Tests
@@ -63,38 +52,9 @@ def test_check_logs_order_master(artifacts_path):
     if not os.path.exists(cluster_log_files):
         pytest.fail(f"No files found inside {artifacts_path}.")
 
-    all_managers = {'Master': LogsOrder().logs_order}
-    name = ''
-
-    with open(cluster_log_files) as file:
-        for line in file.readlines():
-            result = logs_format.search(line)
-            if result:
-                node_name = result.group(1)
-                if 'Worker' in node_name:
-                    name = re.search('.*Worker (.*?)]', node_name).group(1)
-                    if name not in all_managers:
-                        all_managers[name] = LogsOrder().logs_order
-                elif 'Master' in node_name:
-                    name = 'Master'
-
-                log_tag = result.group(2)
-                full_log = result.group(3)
-
-                if log_tag in all_managers[name]:
-                    tree_info = all_managers[name][log_tag]
-                    for child in tree_info['tree'].children(tree_info['node']):
-                        if re.search(child.tag, full_log):
-                            # Current node is updated so the tree points to the next expected log.
-                            all_managers[name][log_tag]['node'] = child.identifier if \
-                                tree_info['tree'].children(child.identifier) else 'root'
-                            break
-                    else:
-                        incorrect_order.append({'node': name, 'log_type': log_tag,
-                                                'expected_logs': [log.tag for log in
-                                                                  tree_info['tree'].children(tree_info['node'])],
-                                                'found_log': full_log})
-                        pytest.fail(f"[{incorrect_order[0]['node']}]"
-                                    f"\n - Log type: {incorrect_order[0]['log_type']}"
-                                    f"\n - Expected logs: {incorrect_order[0]['expected_logs']}"
-                                    f"\n - Found log: {incorrect_order[0]['found_log']}")
+    incorrect_order = logs_order_checker.check_file(cluster_log_files, node='Master')
+    if incorrect_order:
+        pytest.fail(f"[{incorrect_order[0]['node']}]"
+                    f"\n - Log type: {incorrect_order[0]['log_type']}"
+                    f"\n - Expected logs: {incorrect_order[0]['expected_logs']}"
+                    f"\n - Found log: {incorrect_order[0]['found_log']}")
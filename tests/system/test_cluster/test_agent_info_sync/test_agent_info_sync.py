@@ -48,16 +48,18 @@ queries = ['global sql select id from agent where name=\"{agent}\"',
 @pytest.fixture(scope='function')
 def clean_cluster_logs():
     """Remove old logs from all the existent managers."""
-    for host in testinfra_hosts:
-        host_manager.clear_file(host=host, file_path=os.path.join(FORTISHIELD_LOGS_PATH, 'cluster.log'))
+    def clean_host_logs(host):
+        if host in testinfra_hosts:
+            host_manager.clear_file(host=host, file_path=os.path.join(FORTISHIELD_LOGS_PATH, 'cluster.log'))
         host_manager.clear_file(host=host, file_path=os.path.join(FORTISHIELD_LOGS_PATH, 'ossec.log'))
 
         # Its required to restart each node after clearing the log files
-        host_manager.get_host(host).ansible('command', 'service fortishield-manager restart', check=False)
+        service = 'fortishield-manager' if host in testinfra_hosts else 'fortishield-agent'
+        host_manager.get_host(host).ansible('command', f'service {service} restart', check=False)
 
-    for agent in test_infra_agents:
-        host_manager.clear_file(host=agent, file_path=os.path.join(FORTISHIELD_LOGS_PATH, 'ossec.log'))
-        host_manager.get_host(agent).ansible('command', 'service fortishield-agent restart', check=False)
+    # Master first, then the workers and finally the agents
+    host_manager.run_in_stages(clean_host_logs, [testinfra_hosts[:1], testinfra_hosts[1:], test_infra_agents],
+                               raise_on_error=True)
 
 
 @pytest.fixture(scope='function')
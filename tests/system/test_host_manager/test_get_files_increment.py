@@ -0,0 +1,89 @@
+# Copyright (C) 2015-2023, Fortishield Inc.
+# Created by Fortishield, Inc. <security@khulnasoft.com>.
+# This program is free software; you can redistribute it and/or modify it under the terms of GPLv2
+
+import os
+
+import pytest
+from fortishield_testing.tools.system import HostManager
+
+
+# The files are read through the Ansible local connection, so no environment has to be deployed
+testinfra_hosts = ['localhost']
+
+inventory_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'inventory.yml')
+host_manager = HostManager(inventory_path)
+
+
+def read_increment(path, position):
+    """Read the content appended to a local file since a position, as the remote log monitors do.
+
+    Args:
+        path (str): File path.
+        position (tuple): File identifier and byte offset of the last read.
+
+    Returns:
+        tuple: New position of the file, byte offset where the content starts and content.
+    """
+    file_id, start, offset, content = host_manager.get_files_increment('localhost', {path: position})[path]
+    return (file_id, offset), start, content
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    """Path of an empty log file, with characters that have to be quoted in the shell."""
+    path = tmp_path / "ossec $(log) 'file'.log"
+    path.write_bytes(b'')
+    return str(path)
+
+
+def test_get_files_increment_append(log_file):
+    """Check that only the content appended since the last read is returned, including unterminated lines."""
+    with open(log_file, 'ab') as f:
+        f.write(b'first line\nsecond ')
+    position, start, content = read_increment(log_file, (None, 0))
+    assert (start, content) == (0, b'first line\nsecond ')
+    assert position == (str(os.stat(log_file).st_ino), 18)
+
+    with open(log_file, 'ab') as f:
+        f.write(b'line\n\xc3\xb1\n')
+    position, start, content = read_increment(log_file, position)
+    assert (start, content) == (18, b'line\n\xc3\xb1\n')
+    assert position[1] == 26
+
+    position, start, content = read_increment(log_file, position)
+    assert (start, content) == (26, b'')
+
+
+def test_get_files_increment_truncation(log_file):
+    """Check that a truncated file is read again from the beginning."""
+    with open(log_file, 'ab') as f:
+        f.write(b'old content\n')
+    position, _, _ = read_increment(log_file, (None, 0))
+
+    with open(log_file, 'wb') as f:
+        f.write(b'new\n')
+    new_position, start, content = read_increment(log_file, position)
+    assert (start, content) == (0, b'new\n')
+    assert new_position == (position[0], 4)
+
+
+def test_get_files_increment_rotation(log_file):
+    """Check that a rotated file is read from the beginning, even if it is bigger than the last position."""
+    with open(log_file, 'ab') as f:
+        f.write(b'rotated\n')
+    position, _, _ = read_increment(log_file, (None, 0))
+
+    os.rename(log_file, f"{log_file}.1")
+    with open(log_file, 'wb') as f:
+        f.write(b'content of the new file\n')
+    new_position, start, content = read_increment(log_file, position)
+    assert (start, content) == (0, b'content of the new file\n')
+    assert new_position == (str(os.stat(log_file).st_ino), 24)
+    assert new_position[0] != position[0]
+
+
+def test_get_files_increment_missing_file(log_file):
+    """Check that a file that does not exist has no identifier and no content."""
+    os.remove(log_file)
+    assert read_increment(log_file, (None, 0)) == ((None, 0), 0, b'')